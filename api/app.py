@@ -1,14 +1,47 @@
 import os
 import json
-from flask import Flask, request, jsonify, send_file
+import logging
+import time
+import contextlib
+import gzip
+from flask import Flask, Response, request, jsonify, g
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from werkzeug.wsgi import wrap_file
 from flask_cors import CORS
 import tempfile
 import uuid
-import trimesh
 import numpy as np
 from datetime import datetime
 import math
 import io
+from collections import namedtuple
+from slicer import TriangleZIndex, iter_layers, iter_sliced_layers, slice_schedules
+from stl_loader import STLFormatError, load_mesh
+from artifact_store import ArtifactStore, Sweeper
+from gcode_cache import GcodeCache, cache_key
+from mesh_store import MeshStore, mesh_id_for
+from large_stl import (
+    BandedTriangleIndex, MappedSTL, MemoryBudget, MemoryBudgetError, OutOfCoreMesh, is_binary_stl_file,
+    save_upload, scan_triangles,
+)
+from geometry_cache import GeometryCache
+from mesh_stats import ExtrusionCounter, layer_extrusion, material_stats, mesh_topology, scan_mesh
+from jobs import JobManager, QueueFullError, STATUS_COMPLETED
+from toolpath import LayerToolpath, MOVE_TRAVEL, MOVE_PERIMETER
+from toolpath_binary import encode_toolpaths
+from print_time import PrintTimeEstimator, limits_gcode
+from arc_fitting import ArcFitter
+from travel_optimizer import TravelOptimizer
+from infill import INFILL_PATTERNS, get_pattern, infill_lines
+from polygon_offset import perimeter_shells
+from plate import PlateFullError, arrange_plate, plate_id
+from instrumentation import (
+    REGISTRY, REQUEST_SECONDS, collect_stages, configure_logging,
+    record_bytes_written, record_stage, stage,
+)
+
+configure_logging()
+logger = logging.getLogger('pimp_my_printer')
 
 app = Flask(__name__)
 CORS(app)  # Abilita CORS per tutte le routes
@@ -17,32 +50,309 @@ CORS(app)  # Abilita CORS per tutte le routes
 TEMP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'temp')
 os.makedirs(TEMP_DIR, exist_ok=True)
 
+# Valori predefiniti dei parametri di stampa letti da generate_gcode
+DEFAULT_PARAMS = {
+    'layer_height': 0.2,
+    'nozzle_temp': 210,
+    'bed_temp': 60,
+    'print_speed': 60,
+    'infill_density': 20,
+    'infill_pattern': 'grid',
+    # Perimetri concentrici per ogni contorno chiuso del layer
+    'perimeters': 2,
+    # Layer adattivi: altezza tra min e max guidata dalla pendenza delle
+    # facce, con scalino massimo 'adaptive_tolerance' mm sulle superfici
+    'adaptive_layers': False,
+    'adaptive_min_height': 0.1,
+    'adaptive_max_height': 0.3,
+    'adaptive_tolerance': 0.15,
+    'retraction_distance': 5.0,
+    'retraction_speed': 45.0,
+    # Arc fitting: sequenze di segmenti su una circonferenza diventano G2/G3
+    'arc_fitting': False,
+    'arc_tolerance': 0.05,
+    # Ordinamento dei percorsi per ridurre gli spostamenti, con raffinamento
+    # 2-opt opzionale (millisecondi massimi per layer, 0 per disattivarlo)
+    'travel_optimization': True,
+    'travel_2opt_ms': 0,
+}
+
+# Parametri che cambiano solo l'emissione del G-code (intestazione, velocità,
+# ritrazione, archi) e non i percorsi dei layer: esclusi dalla chiave della
+# cache della geometria
+EMISSION_PARAMS = (
+    'nozzle_temp', 'bed_temp', 'print_speed', 'retraction_distance', 'retraction_speed',
+    'arc_fitting', 'arc_tolerance',
+)
+
+# Intervallo ammesso per un parametro numerico (vedi params_error): minimo e
+# massimo (None senza limite), minimo escluso, solo valori interi
+ParamRange = namedtuple('ParamRange', ['minimum', 'maximum', 'exclusive', 'integer'],
+                        defaults=(None, None, False, False))
+
+# Intervalli dei parametri numerici di DEFAULT_PARAMS. Altezza del layer e
+# velocità devono essere positive (sono divisori nello slicing e nei tempi);
+# le temperature finiscono così come sono nei comandi M104/M140 del G-code
+PARAM_RANGES = {
+    'layer_height': ParamRange(0, exclusive=True),
+    'infill_density': ParamRange(0, 100),
+    'perimeters': ParamRange(0, integer=True),
+    'adaptive_min_height': ParamRange(0, exclusive=True),
+    'adaptive_max_height': ParamRange(0, exclusive=True),
+    'adaptive_tolerance': ParamRange(0, exclusive=True),
+    'nozzle_temp': ParamRange(0, 400),
+    'bed_temp': ParamRange(0, 150),
+    'print_speed': ParamRange(0, exclusive=True),
+    'retraction_distance': ParamRange(0),
+    'retraction_speed': ParamRange(0, exclusive=True),
+    'arc_tolerance': ParamRange(0, exclusive=True),
+    'travel_2opt_ms': ParamRange(0),
+}
+
+# Interruttori: devono essere booleani JSON, una stringa come "false"
+# risulterebbe vera e attiverebbe la funzione
+BOOLEAN_PARAMS = ('adaptive_layers', 'arc_fitting', 'travel_optimization')
+
+# Velocità degli spostamenti (mm/min) e sollevamento Z dopo la ritrazione (mm)
+TRAVEL_SPEED = 3000
+Z_HOP_HEIGHT = 0.4
+
+# Larghezza della linea rispetto all'altezza del layer ed estrusione E per
+# mm³ depositato (filamento da 1.75mm)
+EXTRUSION_WIDTH_FACTOR = 1.2
+EXTRUSION_MULTIPLIER = 0.0432
+
+# Posizione della testina alla fine della purge line dell'intestazione
+PURGE_END_POSITION = (5.4, 10.0, 1.0)
+
+# Distanza (mm) del modello dai bordi del piatto: angolo minimo in X=10, Y=10
+PLATE_MARGIN = 10.0
+
+# Piatti con più modelli (/api/slice/plate): dimensioni del piatto e
+# distanza tra i pezzi in mm, numero massimo di pezzi per piatto
+PLATE_WIDTH = float(os.environ.get('PLATE_WIDTH', 220))
+PLATE_DEPTH = float(os.environ.get('PLATE_DEPTH', 220))
+PLATE_SPACING = float(os.environ.get('PLATE_SPACING', 5))
+PLATE_MAX_PARTS = int(os.environ.get('PLATE_MAX_PARTS', 64))
+
+# Livello di compressione gzip dei G-code salvati (1 più veloce, 9 più compatto)
+GCODE_GZIP_LEVEL = int(os.environ.get('GCODE_GZIP_LEVEL', 6))
+
+# Numero massimo di set di parametri in una richiesta a /api/slice/sweep
+SWEEP_MAX_VARIANTS = int(os.environ.get('SWEEP_MAX_VARIANTS', 32))
+
+# Numero massimo di layer in una richiesta a /api/preview/layers
+PREVIEW_MAX_LAYERS = int(os.environ.get('PREVIEW_MAX_LAYERS', 200))
+
+# Archivio dei G-code generati (quota in byte del nodo ed età massima in secondi)
+artifact_store = ArtifactStore(
+    TEMP_DIR,
+    max_bytes=int(os.environ.get('ARTIFACT_MAX_BYTES', os.environ.get('GCODE_CACHE_MAX_BYTES', 1024 * 1024 * 1024))),
+    max_age=int(os.environ.get('ARTIFACT_MAX_AGE', os.environ.get('GCODE_CACHE_MAX_AGE', 24 * 3600))),
+)
+
+# Cache dei G-code generati: chiave (mesh, parametri) -> G-code in archivio
+gcode_cache = GcodeCache(
+    TEMP_DIR,
+    artifact_store,
+    max_age=int(os.environ.get('GCODE_CACHE_MAX_AGE', 24 * 3600)),
+)
+
+# File STL binari oltre questa dimensione seguono il percorso a memoria
+# limitata (vedi large_stl), con il picco di memoria residente entro il budget
+LARGE_STL_THRESHOLD = int(os.environ.get('LARGE_STL_THRESHOLD_MB', 256)) * 1024 * 1024
+MEMORY_BUDGET = int(os.environ.get('MEMORY_BUDGET_MB', 1536)) * 1024 * 1024
+
+# Archivio dei mesh già caricati, condiviso tra /api/preview e /api/slice
+mesh_store = MeshStore(
+    TEMP_DIR,
+    max_items=int(os.environ.get('MESH_STORE_MAX_ITEMS', 8)),
+    max_age=int(os.environ.get('MESH_STORE_MAX_AGE', 24 * 3600)),
+    memory_budget=MEMORY_BUDGET,
+)
+
+# Cache dei percorsi dei layer: chiave (mesh, parametri geometrici)
+geometry_cache = GeometryCache(
+    TEMP_DIR,
+    max_items=int(os.environ.get('GEOMETRY_CACHE_MAX_ITEMS', 8)),
+    max_age=int(os.environ.get('GEOMETRY_CACHE_MAX_AGE', 24 * 3600)),
+)
+
+# Job di slicing asincroni su un pool di processi limitato
+job_manager = JobManager(
+    TEMP_DIR,
+    max_workers=int(os.environ.get('SLICE_WORKERS', os.cpu_count() or 1)),
+    max_queue=int(os.environ.get('SLICE_QUEUE_DEPTH', 16)),
+    max_age=int(os.environ.get('JOB_MAX_AGE', 24 * 3600)),
+)
+
+# Pulizia periodica in background: nessuna eviction durante le richieste
+sweeper = Sweeper(
+    interval=int(os.environ.get('ARTIFACT_SWEEP_INTERVAL', 60)),
+    tasks=[artifact_store.sweep, gcode_cache.evict, mesh_store.evict, geometry_cache.evict, job_manager.sweep],
+)
+artifact_store.sweeper = sweeper
+
+# Metriche lette dai componenti al momento dell'esposizione su /api/metrics
+REGISTRY.callback('pmp_jobs_pending', 'gauge', "Job di slicing in coda o in esecuzione", job_manager.pending)
+REGISTRY.callback('pmp_jobs_queue_limit', 'gauge', "Profondità massima della coda dei job", lambda: job_manager.max_queue)
+REGISTRY.callback('pmp_gcode_cache_hits_total', 'counter', "Richieste servite dalla cache dei G-code", lambda: gcode_cache.stats()['hits'])
+REGISTRY.callback('pmp_gcode_cache_misses_total', 'counter', "Richieste non presenti nella cache dei G-code", lambda: gcode_cache.stats()['misses'])
+REGISTRY.callback('pmp_gcode_cache_evictions_total', 'counter', "Voci rimosse dalla cache dei G-code", lambda: gcode_cache.stats()['evictions'])
+REGISTRY.callback('pmp_artifact_bytes', 'gauge', "Byte di G-code in archivio (stima aggiornata dalla pulizia)", lambda: artifact_store.stats()['bytes'])
+REGISTRY.callback('pmp_artifact_max_bytes', 'gauge', "Quota in byte dell'archivio dei G-code", lambda: artifact_store.max_bytes)
+REGISTRY.callback('pmp_artifact_evictions_total', 'counter', "G-code rimossi dall'archivio", lambda: artifact_store.stats()['evictions'])
+REGISTRY.callback('pmp_mesh_store_hits_total', 'counter', "Mesh trovati nell'archivio", lambda: mesh_store.stats()['hits'])
+REGISTRY.callback('pmp_mesh_store_misses_total', 'counter', "Mesh richiesti e non presenti nell'archivio", lambda: mesh_store.stats()['misses'])
+REGISTRY.callback('pmp_mesh_store_in_memory', 'gauge', "Mesh tenuti in memoria", lambda: mesh_store.stats()['in_memory'])
+REGISTRY.callback('pmp_geometry_cache_hits_total', 'counter', "Percorsi dei layer riletti dalla cache della geometria", lambda: geometry_cache.stats()['hits'])
+REGISTRY.callback('pmp_geometry_cache_misses_total', 'counter', "Percorsi dei layer non presenti nella cache della geometria", lambda: geometry_cache.stats()['misses'])
+
+# Endpoint interrogati di frequente: il log della richiesta è a livello DEBUG
+QUIET_ENDPOINTS = ('health_check', 'metrics')
+
+@app.before_request
+def start_request_timer():
+    """Avvia il cronometro e il raccoglitore dei tempi delle fasi"""
+    # Il thread di pulizia parte con la prima richiesta servita da questo processo
+    sweeper.ensure_started()
+    g.request_start = time.perf_counter()
+    g.instrumentation = contextlib.ExitStack()
+    g.stages = g.instrumentation.enter_context(collect_stages())
+
+@app.after_request
+def log_request(response):
+    """Registra la durata della richiesta e ne scrive il log con i tempi delle fasi"""
+    if 'request_start' not in g:
+        return response
+    duration = time.perf_counter() - g.request_start
+    endpoint = request.endpoint or 'unknown'
+    REQUEST_SECONDS.observe(duration, endpoint=endpoint, status=response.status_code)
+    level = logging.DEBUG if endpoint in QUIET_ENDPOINTS else logging.INFO
+    logger.log(level, "Richiesta completata", extra={
+        "method": request.method,
+        "path": request.path,
+        "status": response.status_code,
+        "duration_s": round(duration, 6),
+        "stages": {name: round(seconds, 6) for name, seconds in g.stages.stages.items()},
+        "bytes_written": g.stages.bytes_written,
+    })
+    return response
+
+@app.teardown_request
+def stop_request_timer(exception=None):
+    instrumentation = g.pop('instrumentation', None)
+    if instrumentation is not None:
+        instrumentation.close()
+    # Copia su disco di un file STL grande (vedi request_mesh_id)
+    stl_path = g.pop('stl_path', None)
+    if stl_path is not None:
+        try:
+            os.remove(stl_path)
+        except OSError:
+            pass
+
+def normalize_params(params):
+    """
+    Restituisce i soli parametri che influenzano il G-code, con i valori
+    predefiniti applicati come in generate_gcode
+    """
+    return {key: params.get(key, default) for key, default in DEFAULT_PARAMS.items()}
+
+def range_error(key, value, rule):
+    """
+    Controlla un parametro numerico rispetto al suo ParamRange
+    
+    Returns:
+        Messaggio di errore, None se il valore è valido
+    """
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        return f"Il parametro '{key}' deve essere un numero"
+    if rule.integer and not isinstance(value, int):
+        return f"Il parametro '{key}' deve essere un numero intero"
+    if rule.minimum is not None:
+        if rule.exclusive and value <= rule.minimum:
+            return f"Il parametro '{key}' deve essere maggiore di {rule.minimum}"
+        if value < rule.minimum:
+            return f"Il parametro '{key}' deve essere almeno {rule.minimum}"
+    if rule.maximum is not None and value > rule.maximum:
+        return f"Il parametro '{key}' non può superare {rule.maximum}"
+    return None
+
+def params_error(params):
+    """
+    Controlla i parametri di stampa di una richiesta
+    
+    Ogni parametro numerico presente deve essere un numero finito
+    nell'intervallo di PARAM_RANGES e ogni interruttore di BOOLEAN_PARAMS
+    un booleano, 'infill_pattern' un pattern registrato e l'altezza minima
+    dei layer adattivi non può superare la massima; i valori predefiniti
+    sono sempre validi.
+    
+    Returns:
+        Messaggio di errore, None se i parametri sono validi
+    """
+    if not isinstance(params, dict):
+        return "I parametri di stampa devono essere un oggetto JSON"
+    for key, rule in PARAM_RANGES.items():
+        if key in params:
+            error = range_error(key, params[key], rule)
+            if error is not None:
+                return error
+    for key in BOOLEAN_PARAMS:
+        if key in params and not isinstance(params[key], bool):
+            return f"Il parametro '{key}' deve essere true o false"
+    pattern = params.get('infill_pattern', DEFAULT_PARAMS['infill_pattern'])
+    if not isinstance(pattern, str) or get_pattern(pattern) is None:
+        return f"Il parametro 'infill_pattern' deve essere uno tra: {', '.join(sorted(INFILL_PATTERNS))}"
+    min_height = params.get('adaptive_min_height', DEFAULT_PARAMS['adaptive_min_height'])
+    max_height = params.get('adaptive_max_height', DEFAULT_PARAMS['adaptive_max_height'])
+    if min_height > max_height:
+        return "Il parametro 'adaptive_min_height' non può superare 'adaptive_max_height'"
+    return None
+
+def geometry_key(mesh_id, params):
+    """Chiave della cache della geometria: mesh e parametri non di emissione"""
+    geometry_params = {
+        key: value for key, value in normalize_params(params).items() if key not in EMISSION_PARAMS
+    }
+    return cache_key(mesh_id, geometry_params)
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Endpoint per verificare che l'API sia in funzione"""
     return jsonify({
         "status": "ok",
         "message": "Pimp My Printer API is running",
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "cache": gcode_cache.stats(),
+        "artifacts": artifact_store.stats(),
+        "mesh_store": mesh_store.stats(),
+        "geometry_cache": geometry_cache.stats(),
+        "jobs_pending": job_manager.pending()
     })
 
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Metriche del processo nel formato di esposizione di Prometheus"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/slice', methods=['POST'])
 def slice_stl():
     """
     Endpoint principale per generare G-code da file STL
     
     Richiede:
-    - Un file STL nel campo 'file'
+    - Un file STL nel campo 'file', oppure l'ID di un mesh già caricato
+      nel campo 'mesh_id'
     - Parametri di stampa in formato JSON nel campo 'params'
     
     Restituisce il G-code generato
     """
-    # Verifica se è presente il file STL
-    if 'file' not in request.files:
+    # Verifica se è presente il file STL o il riferimento a un mesh già caricato
+    if 'file' not in request.files and not request.form.get('mesh_id'):
         return jsonify({"error": "Nessun file STL caricato"}), 400
     
-    stl_file = request.files['file']
-    
     # Verifica se è presente il JSON dei parametri
     params_str = request.form.get('params')
     if not params_str:
@@ -53,124 +363,368 @@ def slice_stl():
         params = json.loads(params_str)
     except Exception as e:
         return jsonify({"error": f"Errore parsing parametri: {str(e)}"}), 400
+    error = params_error(params)
+    if error is not None:
+        return jsonify({"error": error}), 400
     
-    # Genera un nome file temporaneo unico
-    temp_stl_path = os.path.join(TEMP_DIR, f"{uuid.uuid4()}.stl")
+    try:
+        mesh_id = request_mesh_id()
+        
+        # Stesso file con gli stessi parametri: restituisce il G-code già generato
+        key = cache_key(mesh_id, normalize_params(params))
+        cached = gcode_cache.lookup(key)
+        if cached is not None:
+            logger.info("G-code trovato in cache", extra={"gcode_id": cached['gcode_id']})
+            return jsonify(slice_response(cached['gcode_id'], cached['filename'], cached['stats'], mesh_id, cached=True))
+        
+        entry, error = load_request_mesh(mesh_id)
+        if error is not None:
+            return error
+        
+        response = run_slice(entry, params, key)
+        return jsonify(response)
+    
+    except Exception as e:
+        # In caso di errore, restituisce un messaggio di errore
+        logger.exception("Errore nel processo di slicing")
+        return jsonify({"error": f"Errore nel processo di slicing: {str(e)}"}), 500
+
+@app.route('/api/slice/stream', methods=['POST'])
+def slice_stl_stream():
+    """
+    Come /api/slice, ma restituisce direttamente il G-code come risposta
+    chunked, generata un layer alla volta
+    
+    Il G-code viene salvato anche su file e registrato nella cache; il suo
+    ID è nell'header X-Gcode-Id.
+    """
+    if 'file' not in request.files and not request.form.get('mesh_id'):
+        return jsonify({"error": "Nessun file STL caricato"}), 400
+    
+    params_str = request.form.get('params')
+    if not params_str:
+        return jsonify({"error": "Parametri di stampa mancanti"}), 400
+    
+    try:
+        # Analizza la stringa JSON dai campi del form
+        params = json.loads(params_str)
+    except Exception as e:
+        return jsonify({"error": f"Errore parsing parametri: {str(e)}"}), 400
+    error = params_error(params)
+    if error is not None:
+        return jsonify({"error": error}), 400
+    
+    try:
+        mesh_id = request_mesh_id()
+        key = cache_key(mesh_id, normalize_params(params))
+        cached = gcode_cache.lookup(key)
+        if cached is not None:
+            response = send_artifact(cached['artifact'])
+            response.headers['X-Gcode-Id'] = cached['gcode_id']
+            return response
+        
+        entry, error = load_request_mesh(mesh_id)
+        if error is not None:
+            return error
+    
+    except Exception as e:
+        logger.exception("Errore nel processo di slicing")
+        return jsonify({"error": f"Errore nel processo di slicing: {str(e)}"}), 500
+    
+    gcode_id = str(uuid.uuid4())
+    gcode_filename = f"pimp_my_printer_{gcode_id}.gcode"
+    gcode_path = artifact_store.path_for(gcode_id)
+    
+    def generate():
+        estimator = PrintTimeEstimator(PURGE_END_POSITION)
+        arc_fitter = make_arc_fitter(params)
+        travel_optimizer = make_travel_optimizer(params)
+        extrusion = ExtrusionCounter(EXTRUSION_MULTIPLIER)
+        schedule = layer_schedule(entry.index, params)
+        chunks = iter_gcode(
+            entry.mesh, params, entry.stats, index=entry.index,
+            estimator=estimator, arc_fitter=arc_fitter, schedule=schedule, sections=entry.sections,
+            toolpaths=extrusion.count(iter_cached_toolpaths(entry, params, schedule, travel_optimizer))
+        )
+        content_length = 0
+        for data in stream_gcode_to_file(gcode_path, chunks):
+            content_length += len(data)
+            yield data
+        stats = slice_stats(
+            entry.stats, estimator, arc_fitter, travel_optimizer,
+            layer_summary(entry, params, schedule), extrusion
+        )
+        gcode_cache.store(key, gcode_id, gcode_filename, stats, content_length)
+    
+    return Response(generate(), mimetype='text/plain', headers={
+        'Content-Disposition': f'attachment; filename={gcode_filename}',
+        'X-Gcode-Id': gcode_id,
+    })
+
+@app.route('/api/slice/sweep', methods=['POST'])
+def slice_sweep():
+    """
+    Slicing dello stesso mesh con più set di parametri in una sola richiesta
+    
+    Richiede:
+    - Un file STL nel campo 'file', oppure l'ID di un mesh già caricato
+      nel campo 'mesh_id'
+    - Una lista JSON di set di parametri nel campo 'params' (al massimo
+      SWEEP_MAX_VARIANTS)
+    
+    Restituisce per ogni set, nell'ordine, la stessa risposta di /api/slice
+    """
+    if 'file' not in request.files and not request.form.get('mesh_id'):
+        return jsonify({"error": "Nessun file STL caricato"}), 400
+    
+    params_str = request.form.get('params')
+    if not params_str:
+        return jsonify({"error": "Parametri di stampa mancanti"}), 400
+    
+    try:
+        # Analizza la stringa JSON dai campi del form
+        variants = json.loads(params_str)
+    except Exception as e:
+        return jsonify({"error": f"Errore parsing parametri: {str(e)}"}), 400
+    if not isinstance(variants, list) or not variants or not all(isinstance(p, dict) for p in variants):
+        return jsonify({"error": "Il campo 'params' deve essere una lista di set di parametri"}), 400
+    if len(variants) > SWEEP_MAX_VARIANTS:
+        return jsonify({"error": f"Troppi set di parametri (massimo {SWEEP_MAX_VARIANTS})"}), 400
+    for params in variants:
+        error = params_error(params)
+        if error is not None:
+            return jsonify({"error": error}), 400
     
     try:
-        # Salva il file STL
-        stl_file.save(temp_stl_path)
-        
-        print(f"File STL salvato in: {temp_stl_path}")
-        print(f"Dimensione file: {os.path.getsize(temp_stl_path)} bytes")
-        
-        # Prova a determinare se il file è ASCII o binario
-        is_binary = False
-        with open(temp_stl_path, 'rb') as f:
-            header = f.read(100)  # Legge i primi 100 byte
-            is_binary = b'solid' not in header[:5] or b'\0' in header
-        
-        print(f"Formato file STL: {'binario' if is_binary else 'ASCII'}")
-        
-        # Prova diversi metodi di caricamento in sequenza
-        mesh = None
-        load_methods = [
-            # 1. Formato dedotto
-            lambda: trimesh.load(temp_stl_path, file_type='stl_binary' if is_binary else 'stl'),
-            # 2. Formato alternativo
-            lambda: trimesh.load(temp_stl_path, file_type='stl' if is_binary else 'stl_binary'),
-            # 3. Formato automatico
-            lambda: trimesh.load(temp_stl_path),
-            # 4. Carica come STL binario forzato con opzioni di fallback
-            lambda: trimesh.load(temp_stl_path, file_type='stl_binary', process=False),
-            # 5. Carica come STL ASCII forzato con opzioni di fallback
-            lambda: trimesh.load(temp_stl_path, file_type='stl', process=False),
-            # 6. Prova con formato OBJ
-            lambda: trimesh.load(temp_stl_path, file_type='obj'),
-        ]
-        
-        for i, load_method in enumerate(load_methods):
+        mesh_id = request_mesh_id()
+        
+        # Le varianti già generate sono restituite dalla cache
+        keys = [cache_key(mesh_id, normalize_params(params)) for params in variants]
+        responses = []
+        missing = []
+        for params, key in zip(variants, keys):
+            cached = gcode_cache.lookup(key)
+            if cached is None:
+                responses.append(None)
+                missing.append((params, key))
+            else:
+                responses.append(slice_response(cached['gcode_id'], cached['filename'], cached['stats'], mesh_id, cached=True))
+        
+        if missing:
+            entry, error = load_request_mesh(mesh_id)
+            if error is not None:
+                return error
+            generated = iter(run_sweep(entry, missing))
+            responses = [response if response is not None else next(generated) for response in responses]
+        
+        logger.info("Sweep completata", extra={
+            "mesh_id": mesh_id, "variants": len(variants), "generated": len(missing),
+        })
+        return jsonify({"success": True, "mesh_id": mesh_id, "variants": responses})
+    
+    except Exception as e:
+        logger.exception("Errore nel processo di slicing")
+        return jsonify({"error": f"Errore nel processo di slicing: {str(e)}"}), 500
+
+@app.route('/api/slice/plate', methods=['POST'])
+def slice_plate():
+    """
+    Slicing di più modelli disposti automaticamente sullo stesso piatto
+    
+    Richiede:
+    - Uno o più file STL nei campi 'file' e/o ID di mesh già caricati nei
+      campi 'mesh_id' (i modelli sono numerati prima i file, poi gli ID)
+    - Il numero di copie di ogni modello come lista JSON nel campo 'copies'
+      (opzionale, una copia per modello)
+    - Parametri di stampa in formato JSON nel campo 'params'
+    
+    Restituisce la risposta di /api/slice per il G-code dell'intero piatto,
+    con la disposizione dei pezzi in stats['plate']
+    """
+    uploads = request.files.getlist('file')
+    mesh_ids = request.form.getlist('mesh_id')
+    if not uploads and not mesh_ids:
+        return jsonify({"error": "Nessun file STL caricato"}), 400
+    
+    params_str = request.form.get('params')
+    if not params_str:
+        return jsonify({"error": "Parametri di stampa mancanti"}), 400
+    
+    try:
+        # Analizza le stringhe JSON dai campi del form
+        params = json.loads(params_str)
+        copies = json.loads(request.form.get('copies') or 'null')
+    except Exception as e:
+        return jsonify({"error": f"Errore parsing parametri: {str(e)}"}), 400
+    error = params_error(params)
+    if error is not None:
+        return jsonify({"error": error}), 400
+    
+    model_count = len(uploads) + len(mesh_ids)
+    if copies is None:
+        copies = [1] * model_count
+    if (not isinstance(copies, list) or len(copies) != model_count
+            or not all(type(c) is int and c >= 1 for c in copies)):
+        return jsonify({"error": "Il campo 'copies' deve indicare almeno una copia per ogni modello"}), 400
+    if sum(copies) > PLATE_MAX_PARTS:
+        return jsonify({"error": f"Troppi pezzi sul piatto (massimo {PLATE_MAX_PARTS})"}), 400
+    
+    try:
+        with stage('upload'):
+            stl_data = [upload.read() for upload in uploads]
+        model_ids = [mesh_id_for(data) for data in stl_data] + mesh_ids
+        stl_data += [None] * len(mesh_ids)
+        
+        # Il piatto è un mesh come gli altri, con ID derivato da modelli e copie
+        mesh_id = plate_id(zip(model_ids, copies), PLATE_WIDTH, PLATE_DEPTH, PLATE_SPACING, PLATE_MARGIN)
+        key = cache_key(mesh_id, normalize_params(params))
+        cached = gcode_cache.lookup(key)
+        if cached is not None:
+            logger.info("G-code trovato in cache", extra={"gcode_id": cached['gcode_id']})
+            return jsonify(slice_response(cached['gcode_id'], cached['filename'], cached['stats'], mesh_id, cached=True))
+        
+        entry = mesh_store.get(mesh_id)
+        if entry is None:
+            models = []
+            for model_id, data in zip(model_ids, stl_data):
+                model, error = load_request_mesh(model_id, data)
+                if error is not None:
+                    return error
+                if isinstance(model.mesh, OutOfCoreMesh):
+                    return jsonify({"error": f"Modello troppo grande per un piatto: {model_id}"}), 400
+                models.append(model)
+            
             try:
-                print(f"Tentativo di caricamento #{i+1}...")
-                mesh = load_method()
-                if mesh is not None:
-                    print(f"Caricamento riuscito con metodo #{i+1}")
-                    break
-            except Exception as e:
-                print(f"Errore con metodo di caricamento #{i+1}: {e}")
-        
-        if mesh is None:
-            # Se tutti i tentativi falliscono, crea un mesh semplice di fallback
-            print("Creazione di un mesh di fallback (cubo)")
-            vertices = np.array([
-                [0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0],
-                [0, 0, 1], [1, 0, 1], [1, 1, 1], [0, 1, 1]
-            ]) * 100.0
-            faces = np.array([
-                [0, 1, 2], [0, 2, 3], [4, 5, 6], [4, 6, 7],
-                [0, 1, 5], [0, 5, 4], [1, 2, 6], [1, 6, 5],
-                [2, 3, 7], [2, 7, 6], [3, 0, 4], [3, 4, 7]
-            ])
-            mesh = trimesh.Trimesh(vertices=vertices, faces=faces)
-        
-        print(f"Mesh caricato: {len(mesh.vertices)} vertici, {len(mesh.faces)} facce")
-        
-        # Calcola le statistiche del modello
-        stats = calculate_model_stats(mesh)
-        
-        # Genera il G-code
-        gcode = generate_gcode(mesh, params, stats)
-        
-        # Crea un ID univoco per questo G-code
-        gcode_id = str(uuid.uuid4())
-        gcode_filename = f"pimp_my_printer_{gcode_id}.gcode"
-        gcode_path = os.path.join(TEMP_DIR, gcode_filename)
-        
-        # Salva il G-code in un file temporaneo
-        with open(gcode_path, 'w') as f:
-            f.write(gcode)
+                with stage('plate'):
+                    mesh, layout = arrange_plate(
+                        [model.mesh for model in models], copies,
+                        PLATE_WIDTH, PLATE_DEPTH, PLATE_SPACING, PLATE_MARGIN,
+                    )
+            except PlateFullError as e:
+                return jsonify({"error": f"Disposizione sul piatto non riuscita: {str(e)}"}), 400
             
-        # Risposta con statistiche e URL per il download
-        response = {
-            "success": True,
-            "message": "G-code generato con successo",
-            "gcode_id": gcode_id,
-            "filename": gcode_filename,
-            "stats": stats,
-            "download_url": f"/api/download/{gcode_id}"
-        }
+            with stage('stats'):
+                stats, sections = calculate_model_stats(mesh)
+            usable_area = (PLATE_WIDTH - 2 * PLATE_MARGIN) * (PLATE_DEPTH - 2 * PLATE_MARGIN)
+            stats['plate'] = {
+                "models": model_ids,
+                "copies": copies,
+                "parts": layout,
+                "utilization": round(sum(p['width'] * p['depth'] for p in layout) / usable_area, 3),
+            }
+            entry = mesh_store.put(mesh_id, mesh, stats, sections)
+            logger.info("Piatto disposto", extra={
+                "mesh_id": mesh_id, "models": model_count, "parts": len(layout),
+            })
         
+        response = run_slice(entry, params, key)
         return jsonify(response)
     
     except Exception as e:
-        # In caso di errore, restituisce un messaggio di errore
+        logger.exception("Errore nel processo di slicing")
         return jsonify({"error": f"Errore nel processo di slicing: {str(e)}"}), 500
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_slice_job():
+    """
+    Accoda un job di slicing asincrono
     
-    finally:
-        # Pulizia file temporaneo STL
-        try:
-            if os.path.exists(temp_stl_path):
-                os.remove(temp_stl_path)
-        except Exception:
-            pass
+    Richiede gli stessi campi di /api/slice ('file' oppure 'mesh_id', e
+    'params'). Restituisce subito l'ID del job; l'avanzamento si legge da
+    /api/jobs/<job_id> e il risultato da /api/jobs/<job_id>/result.
+    """
+    if 'file' not in request.files and not request.form.get('mesh_id'):
+        return jsonify({"error": "Nessun file STL caricato"}), 400
+    
+    params_str = request.form.get('params')
+    if not params_str:
+        return jsonify({"error": "Parametri di stampa mancanti"}), 400
+    
+    try:
+        # Analizza la stringa JSON dai campi del form
+        params = json.loads(params_str)
+    except Exception as e:
+        return jsonify({"error": f"Errore parsing parametri: {str(e)}"}), 400
+    error = params_error(params)
+    if error is not None:
+        return jsonify({"error": error}), 400
+    
+    try:
+        mesh_id = request_mesh_id()
+        key = cache_key(mesh_id, normalize_params(params))
+        cached = gcode_cache.lookup(key)
+        if cached is not None:
+            # Risultato già disponibile: il job nasce completato
+            result = slice_response(cached['gcode_id'], cached['filename'], cached['stats'], mesh_id, cached=True)
+            job_id = job_manager.create(status=STATUS_COMPLETED, progress=1.0, mesh_id=mesh_id, result=result)
+        else:
+            # Il mesh viene caricato qui, così il processo del pool lo trova in archivio
+            entry, error = load_request_mesh(mesh_id)
+            if error is not None:
+                return error
+            job_id = job_manager.submit(run_slice_job, entry.mesh_id, params, key, mesh_id=mesh_id)
+    
+    except QueueFullError:
+        return jsonify({"error": "Coda di slicing piena, riprovare più tardi"}), 503
+    
+    except Exception as e:
+        logger.exception("Errore nella creazione del job")
+        return jsonify({"error": f"Errore nella creazione del job: {str(e)}"}), 500
+    
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "status_url": f"/api/jobs/{job_id}",
+        "result_url": f"/api/jobs/{job_id}/result",
+        "mesh_id": mesh_id
+    }), 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def slice_job_status(job_id):
+    """Stato e avanzamento per layer di un job di slicing"""
+    state = job_manager.status(job_id)
+    if state is None:
+        return jsonify({"error": "Job non trovato"}), 404
+    state = {k: v for k, v in state.items() if k != 'result'}
+    return jsonify(state)
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_slice_job(job_id):
+    """Annulla un job in coda o in esecuzione"""
+    state = job_manager.cancel(job_id)
+    if state is None:
+        return jsonify({"error": "Job non trovato"}), 404
+    return jsonify({"job_id": job_id, "status": state['status']})
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def slice_job_result(job_id):
+    """Risultato di un job completato (come la risposta di /api/slice)"""
+    state = job_manager.status(job_id)
+    if state is None:
+        return jsonify({"error": "Job non trovato"}), 404
+    if state['status'] != STATUS_COMPLETED:
+        body = {"error": "Job non completato", "status": state['status']}
+        if 'error' in state:
+            body['detail'] = state['error']
+        return jsonify(body), 409
+    return jsonify(state['result'])
 
 @app.route('/api/download/<gcode_id>', methods=['GET'])
 def download_gcode(gcode_id):
-    """Endpoint per scaricare il G-code generato"""
-    filename = f"pimp_my_printer_{gcode_id}.gcode"
-    file_path = os.path.join(TEMP_DIR, filename)
+    """
+    Endpoint per scaricare il G-code generato
     
-    if not os.path.exists(file_path):
+    Supporta la compressione gzip, le richieste condizionali (ETag) e le
+    richieste Range per riprendere i download interrotti (vedi send_artifact).
+    """
+    artifact = artifact_store.get(gcode_id)
+    if artifact is None:
         return jsonify({"error": "File G-code non trovato"}), 404
     
     try:
-        return send_file(
-            file_path,
-            as_attachment=True,
-            download_name=filename,
-            mimetype='text/plain'
-        )
+        return send_artifact(artifact)
     except Exception as e:
+        logger.exception("Errore nel download")
         return jsonify({"error": f"Errore nel download: {str(e)}"}), 500
 
 @app.route('/api/preview', methods=['POST'])
@@ -178,13 +732,15 @@ def preview_gcode():
     """
     Endpoint per ottenere un'anteprima del G-code senza generare il file completo
     
+    Accetta un file STL nel campo 'file' oppure l'ID di un mesh già
+    caricato nel campo 'mesh_id'. Con 'topology' a true le statistiche
+    includono i controlli topologici del mesh (vedi mesh_topology).
+    
     Restituisce un campione del G-code che verrebbe generato
     """
-    if 'file' not in request.files:
+    if 'file' not in request.files and not request.form.get('mesh_id'):
         return jsonify({"error": "Nessun file STL caricato"}), 400
     
-    stl_file = request.files['file']
-    
     params_str = request.form.get('params')
     if not params_str:
         return jsonify({"error": "Parametri di stampa mancanti"}), 400
@@ -194,165 +750,523 @@ def preview_gcode():
         params = json.loads(params_str)
     except Exception as e:
         return jsonify({"error": f"Errore parsing parametri: {str(e)}"}), 400
-    
-    # Genera un nome file temporaneo unico
-    temp_stl_path = os.path.join(TEMP_DIR, f"{uuid.uuid4()}.stl")
+    error = params_error(params)
+    if error is not None:
+        return jsonify({"error": error}), 400
     
     try:
-        # Salva il file STL
-        stl_file.save(temp_stl_path)
-        
-        print(f"File STL (anteprima) salvato in: {temp_stl_path}")
-        print(f"Dimensione file: {os.path.getsize(temp_stl_path)} bytes")
-        
-        # Prova a determinare se il file è ASCII o binario
-        is_binary = False
-        with open(temp_stl_path, 'rb') as f:
-            header = f.read(100)  # Legge i primi 100 byte
-            is_binary = b'solid' not in header[:5] or b'\0' in header
-        
-        print(f"Formato file STL: {'binario' if is_binary else 'ASCII'}")
-        
-        # Prova diversi metodi di caricamento in sequenza
-        mesh = None
-        load_methods = [
-            # 1. Formato dedotto
-            lambda: trimesh.load(temp_stl_path, file_type='stl_binary' if is_binary else 'stl'),
-            # 2. Formato alternativo
-            lambda: trimesh.load(temp_stl_path, file_type='stl' if is_binary else 'stl_binary'),
-            # 3. Formato automatico
-            lambda: trimesh.load(temp_stl_path),
-            # 4. Carica come STL binario forzato con opzioni di fallback
-            lambda: trimesh.load(temp_stl_path, file_type='stl_binary', process=False),
-            # 5. Carica come STL ASCII forzato con opzioni di fallback
-            lambda: trimesh.load(temp_stl_path, file_type='stl', process=False),
-            # 6. Prova con formato OBJ
-            lambda: trimesh.load(temp_stl_path, file_type='obj'),
-        ]
-        
-        for i, load_method in enumerate(load_methods):
-            try:
-                print(f"Tentativo di caricamento #{i+1} (anteprima)...")
-                mesh = load_method()
-                if mesh is not None:
-                    print(f"Caricamento riuscito con metodo #{i+1}")
-                    break
-            except Exception as e:
-                print(f"Errore con metodo di caricamento #{i+1}: {e}")
-        
-        if mesh is None:
-            # Se tutti i tentativi falliscono, crea un mesh semplice di fallback
-            print("Creazione di un mesh di fallback (cubo) per anteprima")
-            vertices = np.array([
-                [0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0],
-                [0, 0, 1], [1, 0, 1], [1, 1, 1], [0, 1, 1]
-            ]) * 100.0
-            faces = np.array([
-                [0, 1, 2], [0, 2, 3], [4, 5, 6], [4, 6, 7],
-                [0, 1, 5], [0, 5, 4], [1, 2, 6], [1, 6, 5],
-                [2, 3, 7], [2, 7, 6], [3, 0, 4], [3, 4, 7]
-            ])
-            mesh = trimesh.Trimesh(vertices=vertices, faces=faces)
-        
-        print(f"Mesh caricato: {len(mesh.vertices)} vertici, {len(mesh.faces)} facce")
-        
-        # Calcola le statistiche del modello
-        stats = calculate_model_stats(mesh)
+        mesh_id = request_mesh_id()
+        entry, error = load_request_mesh(mesh_id)
+        if error is not None:
+            return error
+        topology = request.form.get('topology', '').lower() in ('1', 'true', 'yes')
+        if topology and isinstance(entry.mesh, OutOfCoreMesh):
+            return jsonify({"error": "Controlli topologici non disponibili per i modelli caricati a memoria limitata"}), 400
+        
+        # Tempo di stampa dal planner di movimento e materiale dai
+        # percorsi generati
+        schedule = layer_schedule(entry.index, params)
+        extrusion = ExtrusionCounter(EXTRUSION_MULTIPLIER)
+        with stage('print_time'):
+            estimator = estimate_print_time(
+                entry.mesh, params,
+                toolpaths=extrusion.count(iter_cached_toolpaths(entry, params, schedule=schedule))
+            )
+        stats = slice_stats(
+            entry.stats, estimator, layers=layer_summary(entry, params, schedule), extrusion=extrusion
+        )
+        
+        # Controlli topologici solo su richiesta (costosi sui mesh grandi)
+        if topology:
+            with stage('topology'):
+                stats['topology'] = mesh_topology(entry.mesh.faces)
         
         # Genera una versione ridotta del G-code (solo header e prime righe)
-        preview_gcode = generate_gcode_preview(mesh, params, stats)
+        preview_gcode = generate_gcode_preview(
+            entry.mesh, params, stats, index=entry.index,
+            print_time_s=estimator.total_time, schedule=schedule
+        )
         
         # Risposta con statistiche e anteprima G-code
         response = {
             "success": True,
             "message": "Anteprima G-code generata",
             "preview": preview_gcode,
-            "stats": stats
+            "stats": stats,
+            "mesh_id": mesh_id
         }
         
         return jsonify(response)
     
     except Exception as e:
         # In caso di errore, restituisce un messaggio di errore
+        logger.exception("Errore nella generazione anteprima")
         return jsonify({"error": f"Errore nella generazione anteprima: {str(e)}"}), 500
+
+@app.route('/api/preview/layers', methods=['POST'])
+def preview_layers():
+    """
+    Percorsi utensile reali di un intervallo di layer, per il visualizzatore
     
-    finally:
-        # Pulizia file temporaneo STL
-        try:
-            if os.path.exists(temp_stl_path):
-                os.remove(temp_stl_path)
-        except Exception:
-            pass
+    Richiede:
+    - Un file STL nel campo 'file', oppure l'ID di un mesh già caricato
+      nel campo 'mesh_id'
+    - I parametri di stampa in formato JSON nel campo 'params'
+    - Il primo layer nel campo 'first' (predefinito 0) e il numero di layer
+      nel campo 'count' (predefinito e massimo PREVIEW_MAX_LAYERS)
+    
+    Restituisce i layer richiesti nel formato binario di toolpath_binary
+    (application/octet-stream); sono calcolati solo quei layer (vedi
+    iter_layer_range). Gli header X-Mesh-Id e X-Geometry-Cached riportano
+    l'ID del mesh e se i percorsi vengono dalla cache della geometria.
+    """
+    if 'file' not in request.files and not request.form.get('mesh_id'):
+        return jsonify({"error": "Nessun file STL caricato"}), 400
+    
+    params_str = request.form.get('params')
+    if not params_str:
+        return jsonify({"error": "Parametri di stampa mancanti"}), 400
+    
+    try:
+        # Analizza la stringa JSON dai campi del form
+        params = json.loads(params_str)
+    except Exception as e:
+        return jsonify({"error": f"Errore parsing parametri: {str(e)}"}), 400
+    error = params_error(params)
+    if error is not None:
+        return jsonify({"error": error}), 400
+    try:
+        first = int(request.form.get('first', 0))
+        count = int(request.form.get('count', PREVIEW_MAX_LAYERS))
+    except ValueError:
+        return jsonify({"error": "I campi 'first' e 'count' devono essere numeri interi"}), 400
+    if first < 0 or count < 1:
+        return jsonify({"error": "Intervallo di layer non valido"}), 400
+    if count > PREVIEW_MAX_LAYERS:
+        return jsonify({"error": f"Troppi layer richiesti (massimo {PREVIEW_MAX_LAYERS})"}), 400
+    
+    try:
+        mesh_id = request_mesh_id()
+        entry, error = load_request_mesh(mesh_id)
+        if error is not None:
+            return error
+        
+        schedule = layer_schedule(entry.index, params)
+        total_layers = len(schedule[0])
+        if first >= total_layers:
+            return jsonify({"error": f"Layer iniziale oltre l'ultimo layer del modello ({total_layers})"}), 400
+        stop = min(first + count, total_layers)
+        
+        cached = geometry_cache.contains(geometry_key(mesh_id, params))
+        with stage('preview_layers'):
+            data = encode_toolpaths(
+                iter_layer_range(entry, params, schedule, first, stop), first, total_layers
+            )
+        logger.debug("Layer di anteprima generati", extra={
+            "mesh_id": mesh_id, "first": first, "layers": stop - first, "bytes": len(data),
+        })
+        
+        response = Response(data, mimetype='application/octet-stream')
+        response.headers['X-Geometry-Cached'] = 'true' if cached else 'false'
+        response.headers['X-Mesh-Id'] = mesh_id
+        return response
+    
+    except Exception as e:
+        logger.exception("Errore nella generazione dei layer di anteprima")
+        return jsonify({"error": f"Errore nella generazione dei layer di anteprima: {str(e)}"}), 500
 
-def calculate_model_stats(mesh):
+def request_mesh_id():
+    """
+    Restituisce l'ID del mesh della richiesta corrente
+
+    Se è presente un file STL, l'ID è l'hash del suo contenuto e i byte
+    letti restano disponibili in g.stl_data per il caricamento. I file oltre
+    LARGE_STL_THRESHOLD non sono letti in memoria: sono copiati a blocchi
+    in un file temporaneo, in g.stl_path.
     """
-    Calcola statistiche utili sul modello 3D
+    g.stl_data = None
+    if 'file' in request.files:
+        upload = request.files['file']
+        upload.stream.seek(0, os.SEEK_END)
+        size = upload.stream.tell()
+        upload.stream.seek(0)
+        if size > LARGE_STL_THRESHOLD:
+            with stage('upload'):
+                g.stl_path = os.path.join(TEMP_DIR, f"upload_{uuid.uuid4().hex}.stl")
+                mesh_id = save_upload(upload.stream, g.stl_path)
+            logger.debug("File STL grande ricevuto", extra={"bytes": size})
+            return mesh_id
+        # Legge il file STL direttamente dal buffer di upload (nessun file temporaneo)
+        with stage('upload'):
+            g.stl_data = upload.read()
+            mesh_id = mesh_id_for(g.stl_data)
+        logger.debug("File STL ricevuto", extra={"bytes": len(g.stl_data)})
+        return mesh_id
+    return request.form.get('mesh_id')
+
+def load_request_mesh(mesh_id, stl_data=None):
+    """
+    Recupera il mesh della richiesta dall'archivio o lo carica dal file STL
     
     Args:
-        mesh: Oggetto trimesh contenente il modello 3D
+        mesh_id: ID del mesh
+        stl_data: Byte del file STL (predefinito: quelli letti da
+            request_mesh_id, se presenti)
+    
+    Returns:
+        Tupla (entry, error): la voce MeshEntry oppure la risposta di errore
+    """
+    entry = mesh_store.get(mesh_id)
+    if entry is not None:
+        logger.debug("Mesh trovato in archivio", extra={"mesh_id": mesh_id})
+        return entry, None
+    
+    if stl_data is None:
+        stl_path = g.get('stl_path')
+        if stl_path is not None:
+            if is_binary_stl_file(stl_path):
+                return load_large_mesh(mesh_id, stl_path)
+            # Solo i binari si possono mappare: gli ASCII sono letti in memoria
+            with open(stl_path, 'rb') as f:
+                stl_data = f.read()
+        else:
+            stl_data = g.get('stl_data')
+    if stl_data is None:
+        return None, (jsonify({"error": f"Mesh non trovato: {mesh_id}"}), 404)
+    
+    try:
+        with stage('parse'):
+            mesh = load_mesh(stl_data)
+    except STLFormatError as e:
+        logger.warning("File STL non valido", extra={"mesh_id": mesh_id, "error": str(e)})
+        return None, (jsonify({"error": f"File STL non valido: {str(e)}"}), 400)
+    
+    logger.info("Mesh caricato", extra={
+        "mesh_id": mesh_id, "vertices": len(mesh.vertices), "faces": len(mesh.faces),
+    })
+    
+    # Calcola le statistiche del modello (una sola volta per mesh)
+    with stage('stats'):
+        stats, sections = calculate_model_stats(mesh)
+    return mesh_store.put(mesh_id, mesh, stats, sections), None
+
+def load_large_mesh(mesh_id, path):
+    """
+    Carica un file STL binario grande senza leggerlo in memoria
+    
+    Il file è mappato e letto a blocchi: statistiche del modello (come
+    calculate_model_stats, senza controlli topologici) e bande Z per lo
+    slicing, con la memoria residente entro MEMORY_BUDGET.
+    
+    Returns:
+        Tupla (entry, error) come load_request_mesh
+    """
+    budget = MemoryBudget(MEMORY_BUDGET)
+    budget.reset()
+    try:
+        with stage('parse'):
+            stl = MappedSTL(path)
+            scanner = scan_triangles(stl, budget)
+        with stage('bands'):
+            index = BandedTriangleIndex.build(
+                stl, scanner.bounds, mesh_store.banded_directory(mesh_id), budget, invert=scanner.volume < 0
+            )
+    except STLFormatError as e:
+        logger.warning("File STL non valido", extra={"mesh_id": mesh_id, "error": str(e)})
+        return None, (jsonify({"error": f"File STL non valido: {str(e)}"}), 400)
+    except MemoryBudgetError as e:
+        logger.warning("Budget di memoria superato", extra={"mesh_id": mesh_id, "error": str(e)})
+        return None, (jsonify({"error": f"Modello troppo grande per il budget di memoria: {str(e)}"}), 413)
+    del stl
+    
+    stats = model_stats(
+        scanner.bounds[1] - scanner.bounds[0], abs(scanner.volume), scanner.surface_area, len(index)
+    )
+    stats['out_of_core'] = dict(budget.summary(), bands=len(index.counts))
+    logger.info("Mesh caricato fuori memoria", extra={
+        "mesh_id": mesh_id, "faces": len(index), "bands": len(index.counts),
+        "peak_rss_mb": stats['out_of_core']['peak_rss_mb'],
+    })
+    return mesh_store.put_banded(mesh_id, index, stats, scanner.sections()), None
+
+def slice_response(gcode_id, filename, stats, mesh_id, cached):
+    """Corpo della risposta di /api/slice"""
+    return {
+        "success": True,
+        "message": "G-code generato con successo",
+        "gcode_id": gcode_id,
+        "filename": filename,
+        "stats": stats,
+        "download_url": f"/api/download/{gcode_id}",
+        "mesh_id": mesh_id,
+        "cached": cached
+    }
+
+def run_slice(entry, params, key, progress=None, schedule=None, layers=None, shell_cache=None):
+    """
+    Genera e salva il G-code di un mesh e lo registra nella cache
+    
+    Args:
+        entry: MeshEntry del modello
+        params: Parametri di stampa
+        key: Chiave della cache dei G-code
+        progress: Callback opzionale chiamata con (layer, layer_count)
+        schedule: Quote dei layer da layer_schedule (opzionale)
+        layers: Layer già affettati e perimetri condivisi shell_cache
+            (opzionali, vedi iter_cached_toolpaths)
         
     Returns:
-        Dizionario con le statistiche del modello
+        Dizionario della risposta di /api/slice
+    """
+    # Crea un ID univoco per questo G-code
+    gcode_id = str(uuid.uuid4())
+    gcode_filename = f"pimp_my_printer_{gcode_id}.gcode"
+    gcode_path = artifact_store.path_for(gcode_id)
+    
+    # Genera il G-code (indice Z dei triangoli condiviso con /api/preview)
+    # scrivendolo su file un layer alla volta
+    estimator = PrintTimeEstimator(PURGE_END_POSITION)
+    arc_fitter = make_arc_fitter(params)
+    travel_optimizer = make_travel_optimizer(params)
+    extrusion = ExtrusionCounter(EXTRUSION_MULTIPLIER)
+    # Mesh fuori memoria: picco di memoria residente dello slicing
+    budget = getattr(entry.index, 'budget', None)
+    if budget is not None:
+        budget.reset()
+    if schedule is None:
+        schedule = layer_schedule(entry.index, params)
+    chunks = iter_gcode(
+        entry.mesh, params, entry.stats, index=entry.index, progress=progress,
+        estimator=estimator, arc_fitter=arc_fitter, schedule=schedule, sections=entry.sections,
+        toolpaths=extrusion.count(iter_cached_toolpaths(
+            entry, params, schedule, travel_optimizer, layers=layers, shell_cache=shell_cache
+        ))
+    )
+    content_length = write_gcode(gcode_path, chunks)
+    
+    # Statistiche del mesh con i tempi calcolati dal planner
+    stats = slice_stats(
+        entry.stats, estimator, arc_fitter, travel_optimizer,
+        layer_summary(entry, params, schedule), extrusion
+    )
+    if budget is not None:
+        stats['memory'] = budget.summary()
+    gcode_cache.store(key, gcode_id, gcode_filename, stats, content_length)
+    
+    return slice_response(gcode_id, gcode_filename, stats, entry.mesh_id, cached=False)
+
+def run_sweep(entry, variants):
+    """
+    Genera i G-code di più set di parametri per lo stesso mesh
+    
+    Mesh, statistiche e indice Z sono quelli di entry. I piani di tutte le
+    varianti da affettare sono intersecati in un solo passaggio
+    (slice_schedules); le varianti con la geometria già in cache non vengono
+    affettate, quelle con gli stessi parametri geometrici (vedi
+    geometry_key) sono affettate una volta sola e quelle con la stessa
+    chiave sono generate una volta sola.
+    Anche i perimetri sono condivisi tra le varianti con lo stesso piano,
+    numero di perimetri e larghezza (ad esempio una sweep della densità di
+    riempimento). Contorni e perimetri restano in memoria fino al termine
+    della sweep.
+    
+    Args:
+        entry: MeshEntry del modello
+        variants: Lista di tuple (params, key) non presenti nella cache
+            dei G-code
+        
+    Returns:
+        Lista delle risposte come /api/slice, nell'ordine delle varianti
+    """
+    schedules = [layer_schedule(entry.index, params) for params, _ in variants]
+    pending = {}
+    for i, (params, _) in enumerate(variants):
+        # Le varianti successive con la stessa geometria la rileggono dalla cache
+        geometry = geometry_key(entry.mesh_id, params)
+        if geometry not in pending and not geometry_cache.contains(geometry):
+            pending[geometry] = i
+    with stage('slice'):
+        sliced = dict(zip(pending.values(), slice_schedules(entry.index, [schedules[i] for i in pending.values()])))
+    
+    shell_cache = {}
+    responses = {}
+    for i, (params, key) in enumerate(variants):
+        if key not in responses:
+            responses[key] = run_slice(
+                entry, params, key, schedule=schedules[i], layers=sliced.pop(i, None), shell_cache=shell_cache
+            )
+    return [responses[key] for _, key in variants]
+
+def slice_stats(stats, estimator, arc_fitter=None, travel_optimizer=None, layers=None, extrusion=None):
+    """
+    Statistiche della risposta di /api/slice: quelle del mesh più il tempo
+    calcolato dal planner, i layer (vedi layer_summary), peso e filamento
+    dai volumi estrusi (ExtrusionCounter) e, se attivi, gli spostamenti
+    risparmiati dall'ordinamento dei percorsi e il risultato dell'arc
+    fitting
+    """
+    stats = dict(stats, print_time=estimator.summary())
+    if layers is not None:
+        stats['layers'] = layers
+    if extrusion is not None:
+        stats.update(extrusion.summary())
+    if travel_optimizer is not None:
+        stats['travel'] = travel_optimizer.summary()
+    if arc_fitter is not None:
+        stats['arc_fitting'] = arc_fitter.summary()
+    return stats
+
+def layer_schedule(index, params):
+    """
+    Quote (layer_z, planes) dei layer da affettare
+    
+    Altezza fissa 'layer_height' oppure, con 'adaptive_layers', altezze
+    variabili calcolate dalla pendenza delle facce; il primo layer resta
+    alto layer_height per l'adesione al piatto.
+    """
+    layer_height = params.get('layer_height', DEFAULT_PARAMS['layer_height'])
+    if not params.get('adaptive_layers', DEFAULT_PARAMS['adaptive_layers']):
+        return index.layer_planes(layer_height)
+    with stage('layer_schedule'):
+        return index.adaptive_layer_planes(
+            params.get('adaptive_min_height', DEFAULT_PARAMS['adaptive_min_height']),
+            params.get('adaptive_max_height', DEFAULT_PARAMS['adaptive_max_height']),
+            params.get('adaptive_tolerance', DEFAULT_PARAMS['adaptive_tolerance']),
+            first_height=layer_height,
+        )
+
+def layer_summary(entry, params, schedule):
+    """
+    Statistiche dei layer: numero, layer risparmiati rispetto all'altezza
+    fissa 'layer_height', altezze minima e massima e area della sezione di
+    ogni layer (dal profilo delle sezioni del mesh)
+    """
+    layer_height = params.get('layer_height', DEFAULT_PARAMS['layer_height'])
+    layer_z, planes = schedule
+    heights = np.diff(layer_z, prepend=0.0)
+    fixed_count = len(entry.index.layer_planes(layer_height)[0])
+    areas = entry.sections.at(planes)[0]
+    return {
+        "adaptive": bool(params.get('adaptive_layers', DEFAULT_PARAMS['adaptive_layers'])),
+        "count": len(layer_z),
+        "fixed_count": fixed_count,
+        "saved": fixed_count - len(layer_z),
+        "min_height_mm": round(float(heights.min()), 3),
+        "max_height_mm": round(float(heights.max()), 3),
+        "areas_mm2": [round(float(area), 2) for area in areas],
+    }
+
+def make_travel_optimizer(params):
+    """TravelOptimizer configurato dai parametri, None se l'ordinamento è disattivato"""
+    if not params.get('travel_optimization', DEFAULT_PARAMS['travel_optimization']):
+        return None
+    budget_ms = params.get('travel_2opt_ms', DEFAULT_PARAMS['travel_2opt_ms'])
+    return TravelOptimizer(two_opt_budget=budget_ms / 1000)
+
+def make_arc_fitter(params):
+    """ArcFitter configurato dai parametri, None se l'arc fitting è disattivato"""
+    if not params.get('arc_fitting', DEFAULT_PARAMS['arc_fitting']):
+        return None
+    return ArcFitter(params.get('arc_tolerance', DEFAULT_PARAMS['arc_tolerance']))
+
+def send_artifact(artifact):
     """
-    print("Calcolo statistiche del modello...")
+    Risposta HTTP con il G-code di un artefatto
     
-    # Verifica che il mesh sia valido
-    if not mesh.is_watertight:
-        print("ATTENZIONE: Il modello non è watertight (chiuso)")
+    Il file è salvato in gzip: ai client che accettano 'gzip' viene inviato
+    così com'è (Content-Encoding: gzip), agli altri decompresso al volo. Gli
+    artefatti non cambiano mai, quindi ogni rappresentazione ha un ETag forte
+    derivato dall'ID; la risposta gestisce If-None-Match/If-Modified-Since
+    (304) e le richieste Range/If-Range (206) sui byte della rappresentazione
+    inviata.
+    
+    Args:
+        artifact: Metadati restituiti da ArtifactStore.get
         
-    # Corregge i normali se necessario
-    if hasattr(mesh, 'faces_normals'):
-        if not mesh.faces_normals.any():
-            print("Generando le normali per il mesh...")
-            mesh.fix_normals()
+    Returns:
+        Response Flask
+    """
+    compressed = request.accept_encodings['gzip'] > 0
+    if compressed:
+        body = open(artifact['path'], 'rb')
+        length = artifact['size']
+        etag = f"{artifact['gcode_id']}-gzip"
     else:
-        print("Il mesh non ha l'attributo faces_normals, generando normali...")
-        try:
-            mesh.fix_normals()
-        except Exception as e:
-            print(f"Impossibile generare normali: {e}")
+        body = gzip.open(artifact['path'], 'rb')
+        length = artifact['content_length']
+        etag = artifact['gcode_id']
     
+    response = Response(wrap_file(request.environ, body), mimetype='text/plain', direct_passthrough=True)
+    response.headers.set('Content-Disposition', 'attachment', filename=artifact['filename'])
+    if compressed:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    response.content_length = length
+    response.set_etag(etag)
+    response.last_modified = artifact['created']
+    # Il client deve comunque rivalidare: l'artefatto può essere rimosso
+    response.cache_control.no_cache = True
     try:
-        # Ottieni le dimensioni del modello
-        dimensions = mesh.extents
-        print(f"Dimensioni: {dimensions}")
-    except Exception as e:
-        print(f"Errore nel calcolo delle dimensioni: {e}")
-        # Usa un valore predefinito se le dimensioni non possono essere calcolate
-        dimensions = np.array([100.0, 100.0, 100.0])
+        return response.make_conditional(request, accept_ranges=True, complete_length=length)
+    except RequestedRangeNotSatisfiable as error:
+        body.close()
+        return error.get_response()
+
+def run_slice_job(mesh_id, params, key, progress=None):
+    """Esegue un job di slicing nel processo del pool"""
+    entry = mesh_store.get(mesh_id)
+    if entry is None:
+        raise RuntimeError(f"Mesh non trovato: {mesh_id}")
+    return run_slice(entry, params, key, progress=progress)
+
+def calculate_model_stats(mesh):
+    """
+    Calcola le statistiche del modello in una sola passata sui triangoli
     
-    try:
-        # Volume in mm³
-        volume = mesh.volume if hasattr(mesh, 'is_watertight') and mesh.is_watertight else mesh.bounding_box.volume * 0.8
-        print(f"Volume: {volume} mm³")
-    except Exception as e:
-        print(f"Errore nel calcolo del volume: {e}")
-        # Usa un valore predefinito basato sulla dimensione
-        if hasattr(mesh, 'bounding_box'):
-            volume = mesh.bounding_box.volume * 0.3
-        else:
-            # Stima basata sulle dimensioni approssimative
-            volume = dimensions[0] * dimensions[1] * dimensions[2] * 0.3
+    Ingombro, volume, superficie e profilo delle sezioni (vedi
+    mesh_stats.MeshScanner), senza controlli topologici: quelli si
+    eseguono solo su richiesta (vedi mesh_topology). Un mesh con volume
+    negativo (facce orientate verso l'interno) viene invertito, così i
+    contorni dello slicing hanno il verso corretto.
     
-    # Se il volume è NaN o infinito, usa un valore stimato
-    if not isinstance(volume, (int, float)) or math.isnan(volume) or math.isinf(volume) or volume <= 0:
-        print("Volume non valido, stima basata sulle dimensioni...")
-        volume = dimensions[0] * dimensions[1] * dimensions[2] * 0.3  # Stima approssimativa
+    Args:
+        mesh: Oggetto trimesh contenente il modello 3D
+        
+    Returns:
+        Tupla (stats, sections): dizionario con le statistiche del modello
+        e SectionProfile
+    """
+    scanner = scan_mesh(mesh.triangles)
+    if scanner.volume < 0:
+        logger.warning("Facce del modello orientate verso l'interno, mesh invertito")
+        mesh.invert()
     
-    # Numero di triangoli
-    triangle_count = len(mesh.faces)
-    print(f"Triangoli: {triangle_count}")
+    dimensions = scanner.bounds[1] - scanner.bounds[0]
+    logger.debug("Statistiche del modello calcolate", extra={
+        "dimensions": [float(d) for d in dimensions], "volume": abs(scanner.volume),
+        "triangles": scanner.triangle_count,
+    })
+    
+    stats = model_stats(dimensions, abs(scanner.volume), scanner.surface_area, scanner.triangle_count)
+    return stats, scanner.sections()
+
+def model_stats(dimensions, volume, surface_area, triangle_count):
+    """
+    Statistiche del modello
     
-    # Stima del peso (assumendo densità PLA di 1.24 g/cm³)
-    # Converti da mm³ a cm³ dividendo per 1000
-    weight_estimate = (volume / 1000) * 1.24
+    Peso e filamento non dipendono dal volume del modello ma dai percorsi:
+    sono aggiunti alle risposte da ExtrusionCounter (o stimati da
+    estimate_material per l'intestazione del G-code).
     
-    # Stima della lunghezza del filamento (assumendo filamento da 1.75mm)
-    # Volume in mm³ diviso per l'area della sezione del filamento
-    filament_section_area = math.pi * (1.75/2)**2
-    filament_length_mm = volume / filament_section_area
-    filament_length_m = filament_length_mm / 1000
+    Args:
+        dimensions: Ingombro (X, Y, Z) in mm
+        volume: Volume in mm³
+        surface_area: Superficie in mm²
+        triangle_count: Numero di triangoli
     
+    Returns:
+        Dizionario con le statistiche del modello
+    """
     return {
         "dimensions": {
             "width": float(dimensions[0]),  # X
@@ -360,58 +1274,136 @@ def calculate_model_stats(mesh):
             "height": float(dimensions[2])  # Z
         },
         "volume": float(volume),
-        "triangle_count": triangle_count,
-        "estimated_weight_g": float(weight_estimate),
-        "estimated_filament_m": float(filament_length_m)
+        "surface_area": float(surface_area),
+        "triangle_count": int(triangle_count),
     }
 
-def generate_gcode_preview(mesh, params, stats):
+def estimate_material(sections, params, schedule):
+    """
+    Stima di materiale e tempo di stampa prima dello slicing
+    
+    I volumi di perimetri e riempimento di ogni layer sono stimati dal
+    profilo delle sezioni (vedi mesh_stats.layer_extrusion); il tempo è la
+    lunghezza delle linee estruse (volume / sezione della linea) alla
+    velocità di stampa, senza spostamenti né accelerazioni. Usata per
+    l'intestazione del G-code, scritta prima dei percorsi.
+    
+    Args:
+        sections: SectionProfile del modello
+        params: Parametri di stampa
+        schedule: Quote dei layer da layer_schedule
+    
+    Returns:
+        Tupla (material, print_time_s): statistiche come material_stats e
+        tempo stimato in secondi
+    """
+    layer_height = params.get('layer_height', DEFAULT_PARAMS['layer_height'])
+    print_speed = params.get('print_speed', DEFAULT_PARAMS['print_speed'])
+    infill_density = params.get('infill_density', DEFAULT_PARAMS['infill_density'])
+    infill = get_pattern(params.get('infill_pattern', DEFAULT_PARAMS['infill_pattern']))
+    perimeters = int(params.get('perimeters', DEFAULT_PARAMS['perimeters']))
+    
+    extrusion_width = layer_height * EXTRUSION_WIDTH_FACTOR
+    # Frazione dell'area coperta dal riempimento (vedi infill.line_spacing)
+    infill_fraction = min(max(infill_density, 0), 100) / 100 if infill is not None else 0.0
+    layer_z, planes = schedule
+    heights = np.diff(layer_z, prepend=0.0)
+    shells, infill_volume = layer_extrusion(
+        sections, planes, heights, extrusion_width, perimeters, infill_fraction
+    )
+    line_length = float(((shells + infill_volume) / (extrusion_width * heights)).sum())
+    return material_stats(float(shells.sum()), float(infill_volume.sum())), line_length / print_speed
+
+def generate_gcode_preview(mesh, params, stats, index=None, print_time_s=None, schedule=None):
     """
     Genera un'anteprima del G-code (solo intestazione e prime righe)
     Args:
         mesh: Modello 3D in formato trimesh
         params: Parametri di stampa
-        stats: Statistiche del modello
+        stats: Statistiche del modello, con peso e filamento dei percorsi
+            (vedi ExtrusionCounter)
+        index: TriangleZIndex del mesh (opzionale)
+        print_time_s: Tempo di stampa calcolato dal planner
+        schedule: Quote dei layer da layer_schedule (opzionale)
         
     Returns:
         Stringa contenente l'anteprima del G-code
     """
     # Estrai i parametri
-    layer_height = params.get('layer_height', 0.2)
-    nozzle_temp = params.get('nozzle_temp', 210)
-    bed_temp = params.get('bed_temp', 60)
-    print_speed = params.get('print_speed', 60)
-    infill_density = params.get('infill_density', 20)
-    infill_pattern = params.get('infill_pattern', 'grid')
+    layer_height = params.get('layer_height', DEFAULT_PARAMS['layer_height'])
+    
+    if schedule is None and index is not None:
+        schedule = layer_schedule(index, params)
+    if schedule is not None:
+        # Quota finale coerente con quella usata dallo slicing
+        top_z = float(schedule[0][-1])
+    else:
+        height = stats['dimensions']['height']
+        top_z = math.ceil(height / layer_height) * layer_height
+    
+    # Genera l'anteprima del G-code
+    return (
+        gcode_header(params, stats, print_time_s / 60)
+        + PREVIEW_PLACEHOLDER
+        + gcode_footer(top_z, print_time_s)
+    )
+
+# Segnaposto dell'anteprima al posto dei movimenti dei layer
+PREVIEW_PLACEHOLDER = """; [... Il G-code completo continuerebbe con i movimenti effettivi della testina ...]
+; [... Questa è solo un'anteprima, il file completo includerebbe tutti i layer ...]
+
+"""
+
+def gcode_header(params, stats, estimated_time_min):
+    """
+    Intestazione del G-code: commenti, inizializzazione e purge line
+    
+    Args:
+        params: Parametri di stampa
+        stats: Statistiche del modello, con peso e filamento stimati
+        estimated_time_min: Tempo di stampa stimato in minuti
+        
+    Returns:
+        Stringa con l'intestazione, fino all'inizio del primo layer
+    """
+    layer_height = params.get('layer_height', DEFAULT_PARAMS['layer_height'])
+    nozzle_temp = params.get('nozzle_temp', DEFAULT_PARAMS['nozzle_temp'])
+    bed_temp = params.get('bed_temp', DEFAULT_PARAMS['bed_temp'])
+    print_speed = params.get('print_speed', DEFAULT_PARAMS['print_speed'])
+    infill_density = params.get('infill_density', DEFAULT_PARAMS['infill_density'])
+    infill_pattern = params.get('infill_pattern', DEFAULT_PARAMS['infill_pattern'])
+    perimeters = params.get('perimeters', DEFAULT_PARAMS['perimeters'])
+    adaptive_line = ""
+    if params.get('adaptive_layers', DEFAULT_PARAMS['adaptive_layers']):
+        min_height = params.get('adaptive_min_height', DEFAULT_PARAMS['adaptive_min_height'])
+        max_height = params.get('adaptive_max_height', DEFAULT_PARAMS['adaptive_max_height'])
+        tolerance = params.get('adaptive_tolerance', DEFAULT_PARAMS['adaptive_tolerance'])
+        adaptive_line = f"; Layer adattivi: {min_height}-{max_height} mm, tolleranza {tolerance} mm\n"
+    arc_line = ""
+    if params.get('arc_fitting', DEFAULT_PARAMS['arc_fitting']):
+        arc_tolerance = params.get('arc_tolerance', DEFAULT_PARAMS['arc_tolerance'])
+        arc_line = f"; Archi G2/G3: tolleranza {arc_tolerance} mm\n"
     
     # Ottieni la data attuale
     now = datetime.now()
     date_str = now.strftime("%d/%m/%Y %H:%M:%S")
     
-    # Calcoliamo una stima approssimativa del tempo di stampa
-    # Basata sul volume, altezza layer e velocità
-    volume = stats['volume']
-    height = stats['dimensions']['height']
-    layer_count = math.ceil(height / layer_height)
-    
-    # Stima del tempo: volume proporzionale al tempo, ma la velocità lo riduce
-    estimated_time_min = (volume / 1000) * 0.5 * (60 / print_speed)
     estimated_hours = math.floor(estimated_time_min / 60)
     estimated_minutes = math.floor(estimated_time_min % 60)
     
-    # Genera l'anteprima del G-code
-    gcode = f"""; Pimp My Printer - G-code generato
+    return f"""; Pimp My Printer - G-code generato
 ; Data: {date_str}
 ; Slicer: Pimp My Printer API v1.0
 ;
 ; PARAMETRI DI STAMPA
 ; Layer Height: {layer_height} mm
-; Temperatura estrusore: {nozzle_temp}°C
+{adaptive_line}; Temperatura estrusore: {nozzle_temp}°C
 ; Temperatura piatto: {bed_temp}°C
 ; Velocità: {print_speed} mm/s
 ; Densità riempimento: {infill_density}%
 ; Pattern: {infill_pattern}
-;
+; Perimetri: {perimeters}
+{arc_line};
 ; STATISTICHE MODELLO
 ; Dimensioni: {stats['dimensions']['width']:.2f} x {stats['dimensions']['depth']:.2f} x {stats['dimensions']['height']:.2f} mm
 ; Volume: {stats['volume']:.2f} mm³
@@ -425,11 +1417,7 @@ def generate_gcode_preview(mesh, params, stats):
 M104 S{nozzle_temp} T0 ; Preriscaldamento estrusore
 M140 S{bed_temp} ; Preriscaldamento piatto
 M115 ; Ottieni info stampante
-M201 X500 Y500 Z100 E5000 ; Imposta accelerazione
-M203 X500 Y500 Z10 E50 ; Imposta velocità massima
-M204 P500 R1000 T500 ; Imposta accelerazione per movimenti
-M205 X8.00 Y8.00 Z0.40 E5.00 ; Imposta jerk
-M220 S100 ; Imposta moltiplicatore velocità al 100%
+{limits_gcode()}M220 S100 ; Imposta moltiplicatore velocità al 100%
 M221 S100 ; Imposta moltiplicatore estrusione al 100%
 G28 ; Home di tutti gli assi
 G29 ; Auto bed leveling (se disponibile)
@@ -452,12 +1440,18 @@ G92 E0 ; Azzera estrusore
 ; LAYER 1 - {layer_height}mm
 G1 Z{layer_height} F3000 ; Solleva a altezza layer
 
-; [... Il G-code completo continuerebbe con i movimenti effettivi della testina ...]
-; [... Questa è solo un'anteprima, il file completo includerebbe tutti i layer ...]
+"""
 
-; FINALIZZAZIONE
+def gcode_footer(top_z, print_time_s=None):
+    """
+    Chiusura del G-code: ritrazione, parcheggio e spegnimento
+    
+    top_z è la quota dell'ultimo layer. Se indicato, print_time_s (tempo calcolato dal planner di movimento) è
+    riportato in un commento finale.
+    """
+    footer = f"""; FINALIZZAZIONE
 G1 E-5 F2700 ; Ritrazione finale
-G1 Z{layer_count * layer_height + 10} F3000 ; Solleva Z di 10mm
+G1 Z{top_z + 10:.2f} F3000 ; Solleva Z di 10mm
 G1 X0 Y220 F3000 ; Parcheggia X Y
 M104 S0 ; Spegni estrusore
 M140 S0 ; Spegni piatto
@@ -466,10 +1460,12 @@ M84 ; Disabilita motori
 M300 P300 S4000 ; Beep di completamento (se supportato)
 ; STAMPA COMPLETATA
 """
-    
-    return gcode
+    if print_time_s is not None:
+        hours, remainder = divmod(int(round(print_time_s)), 3600)
+        footer += f"; Tempo di stampa calcolato: {hours}h {remainder // 60}m {remainder % 60}s\n"
+    return footer
 
-def generate_gcode(mesh, params, stats):
+def generate_gcode(mesh, params, stats, index=None, progress=None, sections=None):
     """
     Genera il G-code completo per il modello
     
@@ -477,209 +1473,409 @@ def generate_gcode(mesh, params, stats):
         mesh: Modello 3D in formato trimesh
         params: Parametri di stampa
         stats: Statistiche del modello
+        index: TriangleZIndex del mesh (opzionale, costruito se assente)
+        progress: Callback opzionale chiamata con (layer, layer_count) dopo
+            ogni layer
+        sections: SectionProfile del mesh (opzionale, calcolato se assente)
         
     Returns:
         Stringa contenente il G-code completo
     """
-    # Estrai i parametri
-    layer_height = params.get('layer_height', 0.2)
-    nozzle_temp = params.get('nozzle_temp', 210)
-    bed_temp = params.get('bed_temp', 60)
-    print_speed = params.get('print_speed', 60)
-    infill_density = params.get('infill_density', 20)
-    infill_pattern = params.get('infill_pattern', 'grid')
-    retraction_distance = params.get('retraction_distance', 5.0)
-    retraction_speed = params.get('retraction_speed', 45.0)
+    return "".join(iter_gcode(mesh, params, stats, index=index, progress=progress, sections=sections))
+
+def stream_gcode_to_file(path, chunks):
+    """
+    Scrive il G-code su file compresso in gzip un blocco alla volta,
+    restituendo i blocchi non compressi
+    
+    Il file viene scritto con un nome temporaneo e rinominato solo a
+    scrittura completata, così non è mai visibile a metà; se il consumatore
+    si interrompe il file parziale viene eliminato. L'intestazione gzip non
+    contiene nome né data, quindi lo stesso G-code produce sempre lo stesso
+    file.
+    
+    Il tempo passato a generare i blocchi e quello passato a comprimerli e
+    scriverli sono registrati come fasi 'generate' e 'write' (escluso il
+    tempo del consumatore, es. l'invio HTTP); i byte scritti sono quelli
+    compressi.
+    
+    Yields:
+        Blocchi del G-code codificati in UTF-8
+    """
+    tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+    generate_seconds = 0.0
+    write_seconds = 0.0
+    try:
+        with open(tmp_path, 'wb') as raw:
+            with gzip.GzipFile(filename='', mode='wb', fileobj=raw, compresslevel=GCODE_GZIP_LEVEL, mtime=0) as f:
+                started = time.perf_counter()
+                for chunk in chunks:
+                    data = chunk.encode('utf-8')
+                    generated = time.perf_counter()
+                    f.write(data)
+                    write_seconds += time.perf_counter() - generated
+                    generate_seconds += generated - started
+                    yield data
+                    started = time.perf_counter()
+                generated = time.perf_counter()
+            written = raw.tell()
+            write_seconds += time.perf_counter() - generated
+        os.replace(tmp_path, path)
+        record_stage('generate', generate_seconds)
+        record_stage('write', write_seconds)
+        record_bytes_written(written)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def write_gcode(path, chunks):
+    """
+    Scrive il G-code su file compresso in gzip un blocco alla volta
+    
+    Returns:
+        Numero di byte del G-code non compresso
+    """
+    return sum(len(data) for data in stream_gcode_to_file(path, chunks))
+
+def iter_toolpaths(mesh, params, index=None, layers=None, travel_optimizer=None, schedule=None,
+                   shell_cache=None):
+    """
+    Genera i percorsi utensile del modello un layer alla volta
+    
+    Args:
+        mesh: Modello 3D in formato trimesh
+        params: Parametri di stampa
+        index: TriangleZIndex del mesh (opzionale, costruito se assente)
+        layers: Layer già calcolati da iter_sliced_layers (opzionale,
+            altrimenti lo slicing procede insieme ai percorsi)
+        travel_optimizer: TravelOptimizer opzionale (per leggere gli
+            spostamenti risparmiati al termine); se assente è creato dai
+            parametri quando 'travel_optimization' è attivo
+        schedule: Quote dei layer da layer_schedule (opzionale, calcolate
+            dai parametri se assenti)
+        shell_cache: Dizionario opzionale condiviso tra più chiamate sullo
+            stesso mesh (vedi run_sweep): i perimetri dei layer con la quota
+            'plane' sono calcolati una volta per piano, numero di perimetri
+            e larghezza della linea
+        
+    Yields:
+        Tuple (z, toolpath) per layer; toolpath è un LayerToolpath con
+        perimetri e riempimento, None per i layer senza contorni o senza movimenti
+    """
+    layer_height = params.get('layer_height', DEFAULT_PARAMS['layer_height'])
+    print_speed = params.get('print_speed', DEFAULT_PARAMS['print_speed'])
+    infill_density = params.get('infill_density', DEFAULT_PARAMS['infill_density'])
+    infill = get_pattern(params.get('infill_pattern', DEFAULT_PARAMS['infill_pattern']))
+    perimeters = int(params.get('perimeters', DEFAULT_PARAMS['perimeters']))
     
     # Converti velocità da mm/s a mm/min
     print_speed_mmmin = print_speed * 60
-    travel_speed = 3000  # mm/min
-    
-    # Genera l'anteprima come base
-    gcode = generate_gcode_preview(mesh, params, stats)
     
     # Impostazioni di slicing
-    extrusion_width = layer_height * 1.2
-    extrusion_multiplier = 0.0432  # Volume per mm di filamento (1.75mm)
-    z_hop_height = 0.4  # mm di sollevamento Z dopo ritrazione
-    
-    # Parametri del modello
-    height = stats['dimensions']['height']
-    layer_count = math.ceil(height / layer_height)
-    
-    # Genera layer per layer (implementazione semplificata)
-    # Questo è un modello base che dovrebbe essere esteso con un vero e proprio
-    # algoritmo di slicing per generare percorsi più realistici
-    
-    # Per una API di produzione, sarebbe meglio integrare un slicer completo
-    # come CuraEngine o Slic3r tramite le loro librerie o chiamate di sistema
-    
-    # Qui generiamo solo un esempio di come potrebbe essere strutturato
-    # il G-code completo per un modello semplice
-    
-    # Calcola il perimetro (semplificato)
-    # In un sistema reale, questa parte userebbe algoritmi di slicing veri
-    # che analizzano il modello mesh per ogni layer
-    
-    # Per uno slice realistico, dovremmo:
-    # 1. Intersezionare il piano Z con il mesh per ogni layer
-    # 2. Generare percorsi di contorno e riempimento
-    # 3. Ottimizzare i percorsi per minimizzare i movimenti
-    
-    # Per questa API dimostrativa, creiamo un percorso sintetico 
-    # basato sulle dimensioni del modello
-    
-    # Funzione per calcolare l'estrusione
-    def calculate_extrusion(distance):
-        return distance * extrusion_width * layer_height * extrusion_multiplier
-    
-    # Genera un rettangolo come perimetro di base
-    # Nota: questo è un approccio molto semplificato
-    model_width = stats['dimensions']['width'] 
-    model_depth = stats['dimensions']['depth']
-    
-    # Riduzione per scalare rispetto alla dimensione del modello reale
-    # (in un sistema reale questo sarebbe gestito dallo slicer)
-    scaling_factor = 0.8
-    
-    # Genera i layer e aggiungi al G-code
-    z = layer_height
-    layer_gcode = []
-    
-    for layer in range(1, min(4, layer_count + 1)):  # Limite a max 3 layer per demo
-        layer_gcode.append(f"\n; LAYER {layer} - {z:.2f}mm")
-        layer_gcode.append(f"G1 Z{z:.2f} F{travel_speed} ; Move to layer height")
-        
-        # Perimetro
-        x_min = 10
-        y_min = 10
-        x_max = x_min + (model_width * scaling_factor)
-        y_max = y_min + (model_depth * scaling_factor)
-        
-        # Movimento al punto iniziale
-        layer_gcode.append(f"G1 X{x_min:.2f} Y{y_min:.2f} F{travel_speed} ; Move to start")
-        
-        # Estrusione del perimetro
-        perim_points = [
-            (x_min, y_min),
-            (x_max, y_min),
-            (x_max, y_max),
-            (x_min, y_max),
-            (x_min, y_min)
-        ]
-        
-        for i in range(1, len(perim_points)):
-            x1, y1 = perim_points[i-1]
-            x2, y2 = perim_points[i]
-            
-            # Calcola distanza
-            distance = math.sqrt((x2 - x1)**2 + (y2 - y1)**2)
-            extrusion = calculate_extrusion(distance)
-            
-            layer_gcode.append(f"G1 X{x2:.2f} Y{y2:.2f} E{extrusion:.4f} F{print_speed_mmmin} ; Perimeter")
-        
-        # Infill in base al pattern selezionato
-        infill_spacing = 5.0  # mm tra le linee
-        
-        if infill_pattern == 'grid':
-            # Linee orizzontali
-            for y in np.arange(y_min + infill_spacing, y_max, infill_spacing):
-                # Movimento all'inizio della linea
-                layer_gcode.append(f"G1 X{x_min:.2f} Y{y:.2f} F{travel_speed} ; Move to infill start")
-                
-                # Estrusione della linea
-                distance = x_max - x_min
-                extrusion = calculate_extrusion(distance)
-                layer_gcode.append(f"G1 X{x_max:.2f} Y{y:.2f} E{extrusion:.4f} F{print_speed_mmmin} ; Infill line")
-            
-            # Linee verticali
-            for x in np.arange(x_min + infill_spacing, x_max, infill_spacing):
-                # Movimento all'inizio della linea
-                layer_gcode.append(f"G1 X{x:.2f} Y{y_min:.2f} F{travel_speed} ; Move to infill start")
-                
-                # Estrusione della linea
-                distance = y_max - y_min
-                extrusion = calculate_extrusion(distance)
-                layer_gcode.append(f"G1 X{x:.2f} Y{y_max:.2f} E{extrusion:.4f} F{print_speed_mmmin} ; Infill line")
-        
-        elif infill_pattern == 'lines':
-            # Solo linee orizzontali
-            for y in np.arange(y_min + infill_spacing, y_max, infill_spacing):
-                # Alterniamo direzione
-                if ((y - y_min) / infill_spacing) % 2 == 0:
-                    # Movimento all'inizio della linea
-                    layer_gcode.append(f"G1 X{x_min:.2f} Y{y:.2f} F{travel_speed} ; Move to infill start")
-                    
-                    # Estrusione della linea
-                    distance = x_max - x_min
-                    extrusion = calculate_extrusion(distance)
-                    layer_gcode.append(f"G1 X{x_max:.2f} Y{y:.2f} E{extrusion:.4f} F{print_speed_mmmin} ; Infill line")
-                else:
-                    # Movimento all'inizio della linea (direzione opposta)
-                    layer_gcode.append(f"G1 X{x_max:.2f} Y{y:.2f} F{travel_speed} ; Move to infill start")
-                    
-                    # Estrusione della linea
-                    distance = x_max - x_min
-                    extrusion = calculate_extrusion(distance)
-                    layer_gcode.append(f"G1 X{x_min:.2f} Y{y:.2f} E{extrusion:.4f} F{print_speed_mmmin} ; Infill line")
-        
-        elif infill_pattern == 'triangles':
-            # Pattern triangolare semplificato
-            diagonal_spacing = infill_spacing * 1.5
-            
-            # Prima serie di diagonali (/)
-            for offset in np.arange(0, model_width + model_depth, diagonal_spacing):
-                start_x = max(x_min, x_min + offset - model_depth)
-                start_y = min(y_max, y_min + offset)
-                
-                if start_y > y_min and start_x < x_max:
-                    # Punto finale
-                    end_x = min(x_max, x_min + offset)
-                    end_y = max(y_min, y_max - (end_x - start_x))
-                    
-                    # Movimento all'inizio
-                    layer_gcode.append(f"G1 X{start_x:.2f} Y{start_y:.2f} F{travel_speed} ; Move to diagonal start")
-                    
-                    # Estrusione
-                    distance = math.sqrt((end_x - start_x)**2 + (end_y - start_y)**2)
-                    extrusion = calculate_extrusion(distance)
-                    layer_gcode.append(f"G1 X{end_x:.2f} Y{end_y:.2f} E{extrusion:.4f} F{print_speed_mmmin} ; Infill diagonal")
-            
-            # Seconda serie di diagonali (\)
-            for offset in np.arange(0, model_width + model_depth, diagonal_spacing):
-                start_x = min(x_max, x_min + offset)
-                start_y = y_min
-                
-                if start_x > x_min:
-                    # Punto finale
-                    end_x = max(x_min, start_x - (y_max - y_min))
-                    end_y = min(y_max, y_min + (start_x - end_x))
-                    
-                    # Movimento all'inizio
-                    layer_gcode.append(f"G1 X{start_x:.2f} Y{start_y:.2f} F{travel_speed} ; Move to diagonal start")
-                    
-                    # Estrusione
-                    distance = math.sqrt((end_x - start_x)**2 + (end_y - start_y)**2)
-                    extrusion = calculate_extrusion(distance)
-                    layer_gcode.append(f"G1 X{end_x:.2f} Y{end_y:.2f} E{extrusion:.4f} F{print_speed_mmmin} ; Infill diagonal")
+    extrusion_width = layer_height * EXTRUSION_WIDTH_FACTOR
+    
+    # Funzione per calcolare l'estrusione (altezza del layer corrente, che
+    # con i layer adattivi varia; la larghezza della linea resta fissa)
+    def calculate_extrusion(distance, height):
+        return distance * extrusion_width * height * EXTRUSION_MULTIPLIER
+    
+    # Posizionamento del modello sul piatto (angolo minimo in X=10, Y=10;
+    # i piatti di /api/slice/plate sono già disposti a partire da lì)
+    bed_offset = np.array([PLATE_MARGIN, PLATE_MARGIN]) - mesh.bounds[0][:2]
+    
+    # Slicing reale del mesh: contorni prodotti un layer alla volta
+    if layers is None:
+        if index is None:
+            index = TriangleZIndex.from_mesh(mesh)
+        if schedule is None:
+            schedule = layer_schedule(index, params)
+        layers = iter_sliced_layers(mesh, layer_height, index=index, schedule=schedule)
+    
+    if travel_optimizer is None:
+        travel_optimizer = make_travel_optimizer(params)
+    # Posizione XY della testina all'inizio del layer (fine della purge line,
+    # poi fine del layer precedente)
+    position = PURGE_END_POSITION[:2]
+    
+    for layer_data in layers:
+        z = layer_data['z']
+        height = layer_data['height']
+        contours = layer_data['contours']
+        if not contours:
+            yield z, None
+            continue
         
-        # Ritrazione alla fine del layer
-        layer_gcode.append(f"G1 E-{retraction_distance:.2f} F{retraction_speed * 60:.0f} ; Retract")
-        layer_gcode.append(f"G1 Z{z + z_hop_height:.2f} F{travel_speed} ; Z hop")
+        # Movimenti del layer in forma colonnare
+        toolpath = LayerToolpath(z)
+        
+        # Perimetri: offset dei contorni chiusi verso l'interno, dal più
+        # esterno; i contorni aperti hanno un solo passaggio sul contorno
+        shared = shell_cache is not None and 'plane' in layer_data
+        shell_key = (layer_data.get('plane'), perimeters, extrusion_width)
+        if shared and shell_key in shell_cache:
+            shells, inner = shell_cache[shell_key]
+        else:
+            polygons = [c['points'] + bed_offset for c in contours if c['closed']]
+            with stage('shells'):
+                shells, inner = perimeter_shells(polygons, perimeters, extrusion_width)
+            if shared:
+                shell_cache[shell_key] = shells, inner
+        loops = [points for shell in shells for points in shell]
+        loops += [c['points'] + bed_offset for c in contours if not c['closed']]
+        for points in loops:
+            toolpath.add(points[0, 0], points[0, 1], 0.0, TRAVEL_SPEED, MOVE_TRAVEL)
+            distances = np.hypot(*np.diff(points, axis=0).T)
+            toolpath.add(points[1:, 0], points[1:, 1], calculate_extrusion(distances, height),
+                         print_speed_mmmin, MOVE_PERIMETER)
+        
+        # Riempimento ritagliato sull'area interna all'ultimo perimetro
+        if infill is not None:
+            with stage('infill'):
+                families = infill_lines(
+                    infill, inner, z, extrusion_width, infill_density,
+                    min_length=extrusion_width,
+                )
+            for starts, ends in families:
+                distances = np.hypot(*(ends - starts).T)
+                toolpath.add_lines(
+                    starts, ends, TRAVEL_SPEED, print_speed_mmmin, calculate_extrusion(distances, height),
+                    infill.travel_type, infill.extrude_type,
+                )
+        
+        # Ordine di perimetri e riempimento che riduce gli spostamenti
+        if travel_optimizer is not None:
+            with stage('travel_optimization'):
+                toolpath = travel_optimizer.optimize(toolpath, position)
+        x, y = toolpath.columns()[:2]
+        if not len(x):
+            # Parti più sottili di una linea: nessun perimetro né riempimento
+            yield z, None
+            continue
+        position = (x[-1], y[-1])
+        
+        yield z, toolpath
+
+def replay_layer(estimator, z, toolpath, params):
+    """
+    Ripercorre nel planner di movimento i comandi emessi per un layer
+    
+    Stessa sequenza di iter_gcode: salita all'altezza del layer, movimenti
+    del percorso, ritrazione e sollevamento Z.
+    
+    Returns:
+        Tempo del layer in secondi
+    """
+    retraction_distance = params.get('retraction_distance', DEFAULT_PARAMS['retraction_distance'])
+    retraction_speed = params.get('retraction_speed', DEFAULT_PARAMS['retraction_speed'])
+    
+    x_start, y_start = estimator.position[:2]
+    if toolpath is None:
+        return estimator.add_layer([x_start], [y_start], [z], [0.0], [TRAVEL_SPEED])
+    
+    x, y, _, e, feed, _ = toolpath.columns()
+    return estimator.add_layer(
+        np.concatenate([[x_start], x, [x[-1], x[-1]]]),
+        np.concatenate([[y_start], y, [y[-1], y[-1]]]),
+        np.concatenate([[z], np.full(len(x), z), [z, z + Z_HOP_HEIGHT]]),
+        np.concatenate([[0.0], e, [-retraction_distance, 0.0]]),
+        np.concatenate([[TRAVEL_SPEED], feed, [retraction_speed * 60, TRAVEL_SPEED]]),
+    )
+
+def iter_cached_toolpaths(entry, params, schedule=None, travel_optimizer=None, layers=None,
+                          shell_cache=None):
+    """
+    Percorsi dei layer dalla cache della geometria, generati e salvati se assenti
+    
+    La chiave è il mesh più i parametri geometrici (vedi geometry_key): se
+    cambiano solo temperature, velocità o ritrazione i percorsi sono riletti
+    e vengono riassegnate solo le velocità, quindi resta da fare soltanto
+    l'emissione del G-code. Se la generazione si interrompe (ad esempio job
+    annullato) la voce incompleta è scartata.
+    
+    Args:
+        entry: MeshEntry del modello
+        params: Parametri di stampa
+        schedule: Quote dei layer da layer_schedule (opzionale)
+        travel_optimizer: TravelOptimizer opzionale; con i percorsi dalla
+            cache riceve gli spostamenti per layer salvati con la voce
+        layers: Layer già affettati secondo schedule (opzionale, ad esempio
+            da slice_schedules), usati solo se la voce è assente
+        shell_cache: Perimetri condivisi tra più varianti (vedi iter_toolpaths)
+        
+    Yields:
+        Tuple (z, toolpath) come iter_toolpaths
+    """
+    print_speed = params.get('print_speed', DEFAULT_PARAMS['print_speed'])
+    key = geometry_key(entry.mesh_id, params)
+    geometry = geometry_cache.get(key)
+    if geometry is not None:
+        if travel_optimizer is not None:
+            travel_optimizer.travel_before.extend(geometry.meta['travel_before'])
+            travel_optimizer.travel_after.extend(geometry.meta['travel_after'])
+        yield from geometry.toolpaths(TRAVEL_SPEED, print_speed * 60)
+        return
+    
+    if travel_optimizer is None:
+        travel_optimizer = make_travel_optimizer(params)
+    writer = geometry_cache.writer(key)
+    try:
+        for z, toolpath in iter_toolpaths(
+            entry.mesh, params, index=entry.index, layers=layers,
+            travel_optimizer=travel_optimizer, schedule=schedule, shell_cache=shell_cache
+        ):
+            writer.add(z, toolpath)
+            yield z, toolpath
+    except BaseException:
+        writer.abort()
+        raise
+    writer.commit(travel_optimizer)
+
+def iter_layer_range(entry, params, schedule, first, stop):
+    """
+    Percorsi dei soli layer da first a stop (escluso)
+    
+    Se la geometria del modello è in cache (dopo uno slicing o
+    un'anteprima con gli stessi parametri geometrici) i movimenti dei layer
+    sono letti dal memory-map; altrimenti sono affettati e generati solo i
+    piani richiesti, senza scrivere la voce in cache (che richiede tutti i
+    layer). In questo caso l'ordinamento degli spostamenti del primo layer
+    dell'intervallo parte dalla fine della purge line invece che dalla fine
+    del layer precedente: l'ordine dei percorsi può quindi differire da
+    quello del G-code, mentre la loro geometria è la stessa.
+    
+    Args:
+        entry: MeshEntry del modello
+        params: Parametri di stampa
+        schedule: Quote dei layer da layer_schedule
+        first: Primo layer
+        stop: Layer successivo all'ultimo
+        
+    Yields:
+        Tuple (z, toolpath) come iter_toolpaths
+    """
+    print_speed = params.get('print_speed', DEFAULT_PARAMS['print_speed'])
+    geometry = geometry_cache.get(geometry_key(entry.mesh_id, params))
+    if geometry is not None:
+        yield from geometry.toolpaths(TRAVEL_SPEED, print_speed * 60, first, stop)
+        return
+    
+    layer_z, planes = schedule
+    heights = np.diff(layer_z, prepend=0.0)
+    layers = (
+        {"z": float(z), "height": float(height), "contours": contours}
+        for z, height, contours in zip(
+            layer_z[first:stop], heights[first:stop], iter_layers(entry.index, planes[first:stop])
+        )
+    )
+    yield from iter_toolpaths(entry.mesh, params, index=entry.index, layers=layers)
+
+def estimate_print_time(mesh, params, index=None, schedule=None, toolpaths=None):
+    """
+    Calcola il tempo di stampa ripercorrendo i movimenti nel planner,
+    senza formattare il G-code
+    
+    Args:
+        toolpaths: Percorsi (z, toolpath) già pronti (opzionale, ad esempio
+            da iter_cached_toolpaths); altrimenti generati da iter_toolpaths
+    
+    Returns:
+        PrintTimeEstimator con i tempi per layer e totale
+    """
+    estimator = PrintTimeEstimator(PURGE_END_POSITION)
+    if toolpaths is None:
+        toolpaths = iter_toolpaths(mesh, params, index=index, schedule=schedule)
+    for z, toolpath in toolpaths:
+        replay_layer(estimator, z, toolpath, params)
+    return estimator
+
+def iter_gcode(mesh, params, stats, index=None, progress=None, estimator=None, arc_fitter=None,
+               travel_optimizer=None, schedule=None, toolpaths=None, sections=None):
+    """
+    Genera il G-code completo un layer alla volta
+    
+    Lo slicing procede a blocchi di layer, quindi la memoria occupata resta
+    costante indipendentemente dal numero di layer.
+    
+    Args:
+        mesh: Modello 3D in formato trimesh
+        params: Parametri di stampa
+        stats: Statistiche del modello
+        index: TriangleZIndex del mesh (opzionale, costruito se assente)
+        progress: Callback opzionale chiamata con (layer, layer_count) dopo
+            ogni layer
+        estimator: PrintTimeEstimator opzionale in cui ripercorrere i
+            movimenti emessi (per leggere i tempi al termine)
+        arc_fitter: ArcFitter opzionale (per leggere i contatori al
+            termine); se assente è creato dai parametri quando
+            'arc_fitting' è attivo
+        travel_optimizer: TravelOptimizer opzionale (vedi iter_toolpaths)
+        schedule: Quote dei layer da layer_schedule (opzionale, calcolate
+            dai parametri se assenti)
+        toolpaths: Percorsi (z, toolpath) già pronti, ad esempio da
+            iter_cached_toolpaths (opzionale, altrimenti generati da
+            iter_toolpaths)
+        sections: SectionProfile del mesh per le stime dell'intestazione
+            (opzionale, calcolato dai triangoli se assente)
         
-        # Incrementa altezza layer
-        z += layer_height
+    Yields:
+        Blocchi di testo: intestazione, un blocco per layer, chiusura
+    """
+    retraction_distance = params.get('retraction_distance', DEFAULT_PARAMS['retraction_distance'])
+    retraction_speed = params.get('retraction_speed', DEFAULT_PARAMS['retraction_speed'])
     
-    # Se il modello ha più di 3 layer, aggiungi un'indicazione che il G-code è troncato
-    if layer_count > 3:
-        layer_gcode.append("\n; [... G-code troncato per dimostrazione ...]")
-        layer_gcode.append(f"; [... Il modello completo avrebbe {layer_count} layer ...]")
+    if index is None:
+        index = TriangleZIndex.from_mesh(mesh)
+    if schedule is None:
+        schedule = layer_schedule(index, params)
+    layer_count = len(schedule[0])
+    if estimator is None:
+        estimator = PrintTimeEstimator(PURGE_END_POSITION)
+    if arc_fitter is None:
+        arc_fitter = make_arc_fitter(params)
+    
+    # Intestazione (la stessa dell'anteprima); i movimenti non sono ancora
+    # noti: materiale e tempo sono stimati dalle sezioni, il tempo calcolato
+    # dal planner è riportato nella chiusura
+    if sections is None:
+        sections = scan_mesh(mesh.triangles).sections()
+    material, print_time_s = estimate_material(sections, params, schedule)
+    yield gcode_header(params, dict(stats, **material), print_time_s / 60)
+    
+    if toolpaths is None:
+        toolpaths = iter_toolpaths(
+            mesh, params, index=index, travel_optimizer=travel_optimizer, schedule=schedule
+        )
+    for layer, (z, toolpath) in enumerate(toolpaths, start=1):
+        # Avanzamento per layer (può annullare il job sollevando un'eccezione)
+        if progress is not None:
+            progress(layer - 1, layer_count)
+        
+        layer_start = f"\n; LAYER {layer} - {z:.2f}mm\nG1 Z{z:.2f} F{TRAVEL_SPEED} ; Move to layer height\n"
+        replay_layer(estimator, z, toolpath, params)
+        
+        if toolpath is None:
+            yield layer_start
+            continue
+        
+        # Arc fitting dopo la stima dei tempi: il firmware suddivide comunque
+        # gli archi in segmenti brevi, simili a quelli originali
+        if arc_fitter is not None:
+            with stage('arc_fitting'):
+                toolpath = arc_fitter.fit(toolpath)
+        
+        # Ritrazione alla fine del layer
+        yield (
+            layer_start
+            + toolpath.to_gcode()
+            + f"G1 E-{retraction_distance:.2f} F{retraction_speed * 60:.0f} ; Retract\n"
+            + f"G1 Z{z + Z_HOP_HEIGHT:.2f} F{TRAVEL_SPEED} ; Z hop\n"
+        )
     
-    # Aggiungi i layer generati al G-code
-    gcode_parts = gcode.split("; [... Il G-code completo continuerebbe con i movimenti effettivi della testina ...]")
-    gcode = gcode_parts[0] + "\n".join(layer_gcode) + "\n" + gcode_parts[1].split("; FINALIZZAZIONE")[1]
+    if progress is not None:
+        progress(layer_count, layer_count)
     
-    return gcode
+    # Chiusura
+    yield "\n" + gcode_footer(float(schedule[0][-1]), estimator.total_time)
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
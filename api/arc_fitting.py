@@ -0,0 +1,314 @@
+"""
+Arc fitting: sostituzione di sequenze di segmenti G1 con archi G2/G3
+
+I contorni dei modelli curvi diventano migliaia di segmenti brevi, che
+gonfiano il file e saturano il buffer del planner della stampante. Dopo la
+generazione dei percorsi, le sequenze di movimenti di estrusione
+consecutivi (stesso tipo, stessa velocità) i cui punti stanno su una
+circonferenza entro la tolleranza vengono sostituite da un unico arco.
+
+Tutto il procedimento lavora sugli array colonnari del layer:
+
+1. per ogni vertice interno si calcola la circonferenza per i tre punti
+   (precedente, vertice, successivo); sequenze di vertici curvi con lo
+   stesso verso di rotazione (più i vertici allineati tra di essi) formano
+   i gruppi candidati. Il raggio dei singoli vertici non è confrontato:
+   con segmenti brevi anche un errore minimo dei punti lo altera molto;
+2. per ogni gruppo si stima il cerchio ai minimi quadrati (somme con
+   np.add.reduceat), con il centro spostato sull'asse della corda tra primo
+   e ultimo punto, così l'arco parte e arriva esattamente sui punti originali;
+3. i gruppi con punti, o punti medi dei segmenti, più lontani dell'arco
+   della tolleranza vengono divisi nel punto peggiore e riverificati, tutti
+   insieme, per un numero limitato di passate.
+"""
+import numpy as np
+
+from toolpath import COMMAND_ARC_CCW, COMMAND_ARC_CW, COMMAND_LINE, LayerToolpath, is_extrusion
+
+# Segmenti minimi sostituiti da un arco
+ARC_MIN_SEGMENTS = 3
+# Raggi ammessi (mm): oltre il massimo i segmenti sono praticamente
+# allineati, sotto il minimo l'arrotondamento delle coordinate pesa troppo
+ARC_MIN_RADIUS = 0.5
+ARC_MAX_RADIUS = 1000.0
+# Ampiezza massima di un arco (radianti): un contorno chiuso diventa più archi
+ARC_MAX_SWEEP = 1.5 * np.pi
+# Passate di verifica e divisione dei gruppi
+_MAX_SPLIT_ROUNDS = 16
+
+
+class ArcFitter:
+    """
+    Applica l'arc fitting ai layer e conta archi e segmenti rimossi
+
+    Args:
+        tolerance: Distanza massima (mm) tra l'arco e i punti, o i punti medi
+            dei segmenti, che sostituisce
+    """
+
+    def __init__(self, tolerance):
+        self.tolerance = float(tolerance)
+        self.arcs = 0
+        self.segments_removed = 0
+
+    def fit(self, toolpath):
+        """
+        Percorso del layer con gli archi al posto dei segmenti
+
+        Returns:
+            Nuovo LayerToolpath, oppure lo stesso se non ci sono archi
+        """
+        x, y, z, e, feed, move_type = toolpath.columns()
+        start, end, center_x, center_y = find_arcs(x, y, feed, move_type, self.tolerance)
+        if len(start) == 0:
+            return toolpath
+
+        # Movimenti interni agli archi (start+1 .. end-1) rimossi; il
+        # movimento end diventa l'arco, con l'estrusione di tutto il tratto
+        count = len(x)
+        inside = np.zeros(count + 1, dtype=np.int64)
+        np.add.at(inside, start + 1, 1)
+        np.add.at(inside, end, -1)
+        keep = np.cumsum(inside[:-1]) == 0
+
+        e = e.copy()
+        cumulative = np.concatenate([[0.0], np.cumsum(e)])
+        e[end] = cumulative[end + 1] - cumulative[start + 1]
+
+        # Verso dalla somma delle rotazioni ai vertici interni del tratto
+        # (tutte dello stesso segno, i vertici allineati valgono circa zero)
+        dx, dy = np.diff(x), np.diff(y)
+        cross = np.concatenate([[0.0], np.cumsum(dx[:-1] * dy[1:] - dy[:-1] * dx[1:])])
+        clockwise = cross[end - 1] - cross[start] < 0
+        command = np.full(count, COMMAND_LINE, dtype=np.int8)
+        command[end] = np.where(clockwise, COMMAND_ARC_CW, COMMAND_ARC_CCW)
+        i = np.zeros(count)
+        j = np.zeros(count)
+        i[end] = center_x - x[start]
+        j[end] = center_y - y[start]
+
+        self.arcs += len(start)
+        self.segments_removed += int((end - start - 1).sum())
+        return LayerToolpath.from_columns(
+            toolpath.z_value, x[keep], y[keep], e[keep], feed[keep], move_type[keep],
+            toolpath.feed_labels, command[keep], i[keep], j[keep],
+        )
+
+    def summary(self):
+        """Contatori serializzabili in JSON"""
+        return {
+            "tolerance": self.tolerance,
+            "arcs": self.arcs,
+            "segments_removed": self.segments_removed,
+        }
+
+
+def find_arcs(x, y, feed, move_type, tolerance):
+    """
+    Trova i tratti dei movimenti sostituibili con un arco
+
+    Il movimento k va dal punto k-1 al punto k; un tratto (start, end)
+    comprende i movimenti start+1 .. end.
+
+    Returns:
+        Array (start, end, center_x, center_y): indici dei punti estremi e
+        centro di ogni arco
+    """
+    count = len(x)
+    if count < ARC_MIN_SEGMENTS + 1:
+        return _no_arcs()
+
+    # Movimenti candidati: estrusioni di lunghezza non nulla (il primo
+    # movimento del layer parte da un punto non noto)
+    dx = np.diff(x, prepend=x[0])
+    dy = np.diff(y, prepend=y[0])
+    length = np.hypot(dx, dy)
+    eligible = is_extrusion(move_type) & (length > 0)
+    eligible[0] = False
+
+    # Vertici interni k (tra il movimento k e il k+1) e circonferenza per
+    # i punti k-1, k, k+1
+    k = np.arange(1, count - 1)
+    cross = dx[k] * dy[k + 1] - dy[k] * dx[k + 1]
+    radius = _circumradius(x[k - 1], y[k - 1], x[k], y[k], x[k + 1], y[k + 1])
+    member = (
+        eligible[k] & eligible[k + 1]
+        & (move_type[k] == move_type[k + 1]) & (feed[k] == feed[k + 1])
+        & (radius >= ARC_MIN_RADIUS)
+    )
+    # Vertici curvi, e vertici allineati (lo slicing aggiunge punti sulle
+    # corde, ad esempio sulle diagonali delle facce di un cilindro) che
+    # possono stare all'interno di un arco senza vincolarne il cerchio
+    curved = member & (radius <= ARC_MAX_RADIUS)
+
+    # Ogni vertice curvo è confrontato con il vertice curvo precedente: stesso
+    # verso di rotazione, senza vertici esclusi tra i due
+    positions = np.arange(len(k))
+    previous = np.maximum.accumulate(np.where(curved, positions, -1))
+    previous = np.concatenate([[-1], previous[:-1]])
+    excluded = np.cumsum(~member)
+    has_previous = curved & (previous >= 0)
+    has_previous[has_previous] &= excluded[positions[has_previous]] == excluded[previous[has_previous]]
+    compatible = np.sign(cross) == np.sign(cross[np.where(has_previous, previous, 0)])
+
+    # Gruppi: sequenze massimali di vertici ammessi e compatibili, ridotte
+    # dal primo all'ultimo vertice curvo; il gruppo dei vertici a..b copre
+    # i punti a-1 .. b+1
+    broken = np.concatenate([[True], ~member[:-1]]) | (has_previous & ~compatible)
+    group = np.cumsum(broken & member) - 1
+    group_curved = curved & (group >= 0)
+    if not group_curved.any():
+        return _no_arcs()
+    labels = group[group_curved]
+    boundaries = np.flatnonzero(np.concatenate([[True], labels[1:] != labels[:-1]]))
+    curved_positions = positions[group_curved]
+    first = curved_positions[boundaries]
+    last = curved_positions[np.concatenate([boundaries[1:], [len(labels)]]) - 1]
+    start = k[first] - 1
+    end = k[last] + 1
+    # Due gruppi adiacenti condividerebbero un movimento: il secondo parte
+    # dalla fine del primo
+    start[1:] = np.maximum(start[1:], end[:-1])
+    return _verify_and_split(x, y, start, end, tolerance)
+
+
+def _no_arcs():
+    empty = np.empty(0, dtype=np.int64)
+    return empty, empty, np.empty(0), np.empty(0)
+
+
+def _circumradius(ax, ay, bx, by, cx, cy):
+    """Raggio delle circonferenze per tre punti (inf se allineati)"""
+    # R = abc / (4·area), con il doppio dell'area dal prodotto vettoriale
+    ab = np.hypot(bx - ax, by - ay)
+    bc = np.hypot(cx - bx, cy - by)
+    ca = np.hypot(ax - cx, ay - cy)
+    area2 = np.abs((bx - ax) * (cy - ay) - (by - ay) * (cx - ax))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        radius = ab * bc * ca / (2.0 * area2)
+    radius[~np.isfinite(radius)] = np.inf
+    return radius
+
+
+def _group_points(start, end):
+    """Indici dei punti di ogni tratto concatenati, e inizio di ogni tratto"""
+    sizes = end - start + 1
+    group_start = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    points = np.arange(sizes.sum()) - np.repeat(group_start - start, sizes)
+    return points, group_start
+
+
+def _fit_centers(u, v, group_start, chord_x, chord_y):
+    """
+    Centri dei cerchi ai minimi quadrati (metodo di Kåsa) dei gruppi di
+    punti, in coordinate relative al primo punto di ogni gruppo, proiettati
+    sull'asse della corda
+    """
+    w = u * u + v * v
+    sums = [np.add.reduceat(values, group_start) for values in (u * u, u * v, v * v, u, v, u * w, v * w, w)]
+    suu, suv, svv, su, sv, suw, svw, sw = sums
+    n = np.diff(np.concatenate([group_start, [len(u)]])).astype(np.float64)
+    # Sistema normale per (2·cx, 2·cy, c) con u² + v² = 2·cx·u + 2·cy·v + c
+    matrix = np.stack([
+        np.stack([suu, suv, su], axis=-1),
+        np.stack([suv, svv, sv], axis=-1),
+        np.stack([su, sv, n], axis=-1),
+    ], axis=1)
+    rhs = np.stack([suw, svw, sw], axis=-1)
+    # Punti allineati: sistema singolare, centro non definito (NaN)
+    singular = ~(np.abs(np.linalg.det(matrix)) > 0)
+    matrix[singular] = np.eye(3)
+    solution = np.linalg.solve(matrix, rhs[..., None])[..., 0]
+    solution[singular] = np.nan
+    center_x = solution[:, 0] / 2.0
+    center_y = solution[:, 1] / 2.0
+
+    # Proiezione sull'asse della corda: punto medio più componente normale
+    chord = np.hypot(chord_x, chord_y)
+    normal_x = -chord_y / chord
+    normal_y = chord_x / chord
+    offset = (center_x - chord_x / 2.0) * normal_x + (center_y - chord_y / 2.0) * normal_y
+    return chord_x / 2.0 + offset * normal_x, chord_y / 2.0 + offset * normal_y
+
+
+def _verify_and_split(x, y, start, end, tolerance):
+    """
+    Verifica i tratti candidati e divide quelli fuori tolleranza
+
+    A ogni passata tutti i tratti ancora aperti sono verificati insieme;
+    quelli che non rispettano la tolleranza (o l'ampiezza massima) sono
+    divisi nel punto peggiore (o a metà) in due tratti che condividono
+    quel punto.
+    """
+    accepted = []
+    for _ in range(_MAX_SPLIT_ROUNDS):
+        enough = end - start >= ARC_MIN_SEGMENTS
+        start, end = start[enough], end[enough]
+        # Corda nulla (tratto chiuso): il centro non è definito, si divide
+        closed = (x[start] == x[end]) & (y[start] == y[end])
+        if len(start) == 0:
+            break
+
+        points, group_start = _group_points(start, end)
+        sizes = end - start + 1
+        local_x = x[points] - np.repeat(x[start], sizes)
+        local_y = y[points] - np.repeat(y[start], sizes)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            center_x, center_y = _fit_centers(
+                local_x, local_y, group_start, x[end] - x[start], y[end] - y[start]
+            )
+        radius = np.hypot(center_x, center_y)
+        center_x_points = np.repeat(center_x, sizes)
+        center_y_points = np.repeat(center_y, sizes)
+        radius_points = np.repeat(radius, sizes)
+
+        # Scostamento dei punti e dei punti medi dei segmenti (il punto medio
+        # dopo l'ultimo punto del gruppo non appartiene al gruppo)
+        deviation = np.abs(np.hypot(local_x - center_x_points, local_y - center_y_points) - radius_points)
+        mid_x = (local_x[:-1] + local_x[1:]) / 2.0
+        mid_y = (local_y[:-1] + local_y[1:]) / 2.0
+        mid_deviation = np.abs(
+            np.hypot(mid_x - center_x_points[:-1], mid_y - center_y_points[:-1]) - radius_points[:-1]
+        )
+        last_point = np.concatenate([group_start[1:], [len(points)]]) - 1
+        mid_deviation = np.append(mid_deviation, 0.0)
+        mid_deviation[last_point] = 0.0
+        worst = np.maximum(deviation, mid_deviation)
+
+        # Ampiezza: somma degli angoli sottesi dai segmenti
+        chord = np.hypot(np.diff(local_x), np.diff(local_y))
+        with np.errstate(invalid='ignore'):
+            angle = 2.0 * np.arcsin(np.minimum(chord / (2.0 * radius_points[:-1]), 1.0))
+        angle = np.append(angle, 0.0)
+        angle[last_point] = 0.0
+        sweep = np.add.reduceat(angle, group_start)
+
+        group_worst = np.maximum.reduceat(np.where(np.isfinite(worst), worst, np.inf), group_start)
+        too_wide = closed | ~(sweep <= ARC_MAX_SWEEP)
+        good = (
+            ~too_wide & (group_worst <= tolerance)
+            & (radius >= ARC_MIN_RADIUS) & (radius <= ARC_MAX_RADIUS)
+        )
+        accepted.append((start[good], end[good], center_x[good] + x[start[good]], center_y[good] + y[start[good]]))
+
+        # Punto di divisione: il peggiore tra quelli interni, o il centrale
+        # per gli archi troppo ampi
+        interior = np.ones(len(points), dtype=bool)
+        interior[group_start] = False
+        interior[last_point] = False
+        score = np.where(interior, np.where(np.isfinite(worst), worst, np.inf), -1.0)
+        is_max = score == np.repeat(np.maximum.reduceat(score, group_start), sizes)
+        split = np.minimum.reduceat(np.where(is_max, points, len(x)), group_start)
+        split = np.where(too_wide, (start + end) // 2, split)
+
+        failed = ~good
+        start, end, split = start[failed], end[failed], split[failed]
+        start, end = np.concatenate([start, split]), np.concatenate([split, end])
+        order = np.argsort(start, kind='stable')
+        start, end = start[order], end[order]
+
+    if not accepted:
+        return _no_arcs()
+    start, end, center_x, center_y = (np.concatenate(columns) for columns in zip(*accepted))
+    order = np.argsort(start, kind='stable')
+    return start[order], end[order], center_x[order], center_y[order]
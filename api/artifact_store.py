@@ -0,0 +1,246 @@
+"""
+Archivio dei G-code generati con quota, scadenza e pulizia in background
+
+Ogni G-code è salvato compresso in gzip in una sottodirectory di due
+caratteri dell'ID (artifacts/ab/<id>.gcode.gz), così il download trova il
+file con un percorso calcolato e le directory restano piccole. Accanto al
+file c'è un piccolo indice JSON (<id>.json) con dimensione su disco e
+decompressa, creazione, hash dei parametri e statistiche; l'ultimo accesso è
+il tempo di modifica dell'indice.
+
+Le richieste si limitano a scrivere e leggere: scadenza (TTL) e rispetto
+della quota in byte sono applicati da un thread di pulizia periodico
+(Sweeper), svegliato in anticipo quando la quota viene superata.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_DIR = 'artifacts'
+ARTIFACT_SUFFIX = '.gcode.gz'
+
+_ARTIFACT_ID_RE = re.compile(r'^[0-9a-f-]{8,64}$')
+
+
+class ArtifactStore:
+    """
+    Archivio su disco dei G-code generati
+
+    Args:
+        directory: Directory base (la sottodirectory artifacts/ è creata qui)
+        max_bytes: Quota in byte dei G-code di questo nodo
+        max_age: Secondi dall'ultimo accesso dopo i quali un G-code scade
+    """
+
+    def __init__(self, directory, max_bytes, max_age):
+        self.directory = os.path.join(directory, ARTIFACT_DIR)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.evictions = 0
+        self.sweeper = None
+        # Stima dei byte occupati, aggiornata da ogni pulizia e ogni aggiunta
+        self._estimated_bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def is_valid_id(artifact_id):
+        return bool(_ARTIFACT_ID_RE.match(artifact_id or ''))
+
+    def _base(self, artifact_id):
+        return os.path.join(self.directory, artifact_id[:2], artifact_id)
+
+    def path_for(self, artifact_id):
+        """Percorso del file gzip di un artefatto (crea la sottodirectory)"""
+        base = self._base(artifact_id)
+        os.makedirs(os.path.dirname(base), exist_ok=True)
+        return f"{base}{ARTIFACT_SUFFIX}"
+
+    def register(self, artifact_id, filename, params_hash, stats, content_length):
+        """
+        Registra nell'indice un G-code appena scritto in path_for(artifact_id)
+
+        Args:
+            content_length: Dimensione in byte del G-code decompresso
+
+        Returns:
+            Metadati dell'artefatto
+        """
+        path = f"{self._base(artifact_id)}{ARTIFACT_SUFFIX}"
+        meta = {
+            "gcode_id": artifact_id,
+            "filename": filename,
+            "size": os.path.getsize(path),
+            "content_length": content_length,
+            "created": time.time(),
+            "params_hash": params_hash,
+            "stats": stats,
+        }
+        meta_path = f"{self._base(artifact_id)}.json"
+        tmp_path = f"{meta_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+
+        with self._lock:
+            self._estimated_bytes += meta["size"]
+            over_quota = self._estimated_bytes > self.max_bytes
+        if over_quota and self.sweeper is not None:
+            self.sweeper.wake()
+        return meta
+
+    def get(self, artifact_id, touch=True):
+        """
+        Metadati di un artefatto presente e non scaduto
+
+        Args:
+            touch: Se True aggiorna l'ultimo accesso
+
+        Returns:
+            Dizionario dei metadati (con 'path') oppure None
+        """
+        if not self.is_valid_id(artifact_id):
+            return None
+        base = self._base(artifact_id)
+        try:
+            with open(f"{base}.json") as f:
+                meta = json.load(f)
+            accessed = os.path.getmtime(f"{base}.json")
+        except (OSError, ValueError):
+            return None
+        if time.time() - accessed > self.max_age or not os.path.exists(f"{base}{ARTIFACT_SUFFIX}"):
+            # Scaduto: sarà rimosso dalla prossima pulizia
+            return None
+        if touch:
+            try:
+                os.utime(f"{base}.json")
+            except OSError:
+                pass
+        meta["path"] = f"{base}{ARTIFACT_SUFFIX}"
+        meta["last_accessed"] = time.time() if touch else accessed
+        return meta
+
+    def sweep(self):
+        """
+        Rimuove gli artefatti scaduti, incompleti e, oltre la quota, quelli
+        usati meno di recente
+
+        Eseguita dallo Sweeper, mai durante una richiesta.
+        """
+        now = time.time()
+        entries = []
+        removed = 0
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for item in os.scandir(shard.path):
+                name = item.name
+                if name.endswith('.tmp'):
+                    # File temporanei di scritture interrotte da più di max_age
+                    removed += self._remove_stale_tmp(item, now)
+                    continue
+                if not name.endswith(ARTIFACT_SUFFIX):
+                    continue
+                artifact_id = name[:-len(ARTIFACT_SUFFIX)]
+                meta_path = os.path.join(shard.path, f"{artifact_id}.json")
+                try:
+                    accessed = os.path.getmtime(meta_path)
+                    size = item.stat().st_size
+                except OSError:
+                    # G-code senza indice: scritto e mai registrato
+                    if now - item.stat().st_mtime > self.max_age:
+                        removed += self._remove(artifact_id)
+                    continue
+                if now - accessed > self.max_age:
+                    removed += self._remove(artifact_id)
+                    continue
+                entries.append((accessed, size, artifact_id))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, artifact_id in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            removed += self._remove(artifact_id)
+            total -= size
+
+        with self._lock:
+            self._estimated_bytes = total
+            self.evictions += removed
+        if removed:
+            logger.info("Pulizia degli artefatti", extra={"removed": removed, "bytes": total})
+        return removed
+
+    def _remove(self, artifact_id):
+        base = self._base(artifact_id)
+        for path in (f"{base}{ARTIFACT_SUFFIX}", f"{base}.json"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return 1
+
+    def _remove_stale_tmp(self, item, now):
+        try:
+            if now - item.stat().st_mtime > self.max_age:
+                os.remove(item.path)
+        except OSError:
+            pass
+        return 0
+
+    def stats(self):
+        """Contatori dell'archivio per questo processo"""
+        with self._lock:
+            return {
+                "bytes": self._estimated_bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+            }
+
+
+class Sweeper:
+    """
+    Thread di pulizia periodica
+
+    Esegue le funzioni indicate ogni interval secondi, o subito dopo wake().
+    Il thread è avviato al primo ensure_started() nel processo corrente, così
+    non viene duplicato nei processi figli del pool dei job né perso dopo il
+    fork dei worker del server.
+    """
+
+    def __init__(self, interval, tasks):
+        self.interval = interval
+        self.tasks = list(tasks)
+        self._wake = threading.Event()
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='sweeper', daemon=True).start()
+
+    def wake(self):
+        """Anticipa la prossima pulizia"""
+        self._wake.set()
+
+    def run_once(self):
+        for task in self.tasks:
+            try:
+                task()
+            except Exception:
+                logger.exception("Errore nella pulizia", extra={"task": getattr(task, '__qualname__', str(task))})
+
+    def _run(self):
+        while True:
+            self.run_once()
+            self._wake.wait(self.interval)
+            self._wake.clear()
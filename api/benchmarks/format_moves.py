@@ -0,0 +1,66 @@
+"""
+Benchmark della formattazione dei movimenti in G-code
+
+Confronta la formattazione di riferimento (una f-string per movimento) con
+quella vettoriale di toolpath.format_moves su movimenti sintetici, e
+verifica che l'output sia identico byte per byte.
+
+Uso (dalla cartella api):
+    python benchmarks/format_moves.py [--moves 200000] [--repeat 3]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from toolpath import format_moves, format_moves_reference  # noqa: E402
+
+
+def synthetic_moves(count, seed=0):
+    """Movimenti casuali con lo stesso miscuglio di tipi e velocità dello slicer"""
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(10.0, 230.0, count)
+    y = rng.uniform(10.0, 230.0, count)
+    move_type = rng.integers(0, 6, count).astype(np.int8)
+    e = np.where(move_type % 2 == 1, rng.uniform(0.0, 0.5, count), 0.0)
+    feed_labels = {3000.0: '3000', 3600.0: '3600'}
+    feed = np.where(move_type % 2 == 1, 3600.0, 3000.0)
+    return x, y, e, feed, move_type, feed_labels
+
+
+def best_time(function, args, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--moves', type=int, default=200_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    moves = synthetic_moves(args.moves)
+    reference_time, reference = best_time(format_moves_reference, moves, args.repeat)
+    vector_time, vectorized = best_time(format_moves, moves, args.repeat)
+
+    if vectorized != reference:
+        print("ERRORE: l'output vettoriale differisce dal riferimento")
+        sys.exit(1)
+
+    print(f"Movimenti: {args.moves}  ({len(reference.encode()) / 1e6:.1f} MB di G-code)")
+    print(f"Riferimento (f-string): {reference_time * 1000:.1f} ms")
+    print(f"Vettoriale (NumPy):     {vector_time * 1000:.1f} ms")
+    print(f"Speedup: {reference_time / vector_time:.1f}x, output identico")
+
+
+if __name__ == '__main__':
+    main()
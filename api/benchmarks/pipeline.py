@@ -0,0 +1,420 @@
+"""
+Benchmark della pipeline di slicing: caricamento → statistiche → slicing →
+perimetri → riempimento → percorsi → formattazione → scrittura
+
+Genera mesh sintetici (cubi, sfere, tori) di dimensione crescente, li
+serializza in STL binario e ASCII e misura separatamente tempo e picco di
+memoria di ogni fase. I risultati sono salvati in JSON; il comando compare
+confronta due esecuzioni e segnala le regressioni.
+
+Uso (dalla cartella api):
+    python benchmarks/pipeline.py run --output risultati.json
+    python benchmarks/pipeline.py run --quick --shapes sphere
+    python benchmarks/pipeline.py compare base.json nuovo.json --threshold 0.1
+"""
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import trimesh
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+from infill import get_pattern, infill_lines  # noqa: E402
+from polygon_offset import perimeter_shells  # noqa: E402
+from print_time import PrintTimeEstimator  # noqa: E402
+from slicer import TriangleZIndex, iter_sliced_layers  # noqa: E402
+from stl_loader import STL_HEADER_SIZE, STL_RECORD_DTYPE, load_mesh  # noqa: E402
+
+SHAPES = ('cube', 'sphere', 'torus')
+FORMATS = ('binary', 'ascii')
+SIZES = (1_000, 10_000, 100_000, 1_000_000, 5_000_000)
+QUICK_SIZES = (1_000, 10_000, 100_000)
+
+# Oltre questa dimensione il file ASCII (circa 250 byte per triangolo) non
+# viene generato, salvo diversa indicazione
+ASCII_MAX_TRIANGLES = 1_000_000
+
+# Dimensione dei modelli (mm): circa 200 layer con l'altezza predefinita
+MODEL_SIZE = 40.0
+
+STAGES = ('parse', 'stats', 'slice', 'shells', 'infill', 'toolpaths', 'format', 'write', 'print_time')
+
+# Fasi già comprese nel tempo di un'altra fase (perimetri e riempimento sono
+# calcolati anche dentro toolpaths): escluse dal tempo totale
+NESTED_STAGES = ('shells', 'infill')
+
+
+# --- Mesh sintetici ---------------------------------------------------------
+
+def _grid_faces(rows, cols, wrap_cols, wrap_rows=False):
+    """Facce (due triangoli per cella) di una griglia di vertici rows x cols"""
+    row_cells = rows if wrap_rows else rows - 1
+    col_cells = cols if wrap_cols else cols - 1
+    r, c = np.meshgrid(np.arange(row_cells), np.arange(col_cells), indexing='ij')
+    r, c = r.ravel(), c.ravel()
+    r1 = (r + 1) % rows
+    c1 = (c + 1) % cols
+    a = r * cols + c
+    b = r * cols + c1
+    d = r1 * cols + c
+    e = r1 * cols + c1
+    return np.concatenate([np.column_stack([a, d, b]), np.column_stack([b, d, e])])
+
+
+def make_cube(triangles):
+    """Cubo con ogni faccia suddivisa in una griglia n x n (12·n² triangoli)"""
+    n = max(1, int(round(math.sqrt(triangles / 12))))
+    t = np.linspace(-0.5, 0.5, n + 1)
+    u, v = np.meshgrid(t, t, indexing='ij')
+    u, v = u.ravel(), v.ravel()
+    half = np.full_like(u, 0.5)
+    faces_list = []
+    vertices_list = []
+    offset = 0
+    grid = _grid_faces(n + 1, n + 1, wrap_cols=False)
+    # (coordinate della faccia, orientamento verso l'esterno)
+    for points, flip in (
+        ((u, v, half), False), ((u, v, -half), True),
+        ((u, half, v), True), ((u, -half, v), False),
+        ((half, u, v), False), ((-half, u, v), True),
+    ):
+        vertices_list.append(np.column_stack(points))
+        faces_list.append((grid[:, ::-1] if flip else grid) + offset)
+        offset += len(u)
+    vertices = np.vstack(vertices_list) * MODEL_SIZE
+    return _outward(trimesh.Trimesh(vertices=vertices, faces=np.vstack(faces_list), process=False))
+
+
+def make_sphere(triangles):
+    """Sfera UV con due poli (circa 2·anelli·colonne triangoli)"""
+    rings = max(2, int(round(math.sqrt(triangles / 4))))
+    cols = 2 * rings
+    theta = np.linspace(0, math.pi, rings + 2)[1:-1]
+    phi = np.linspace(0, 2 * math.pi, cols, endpoint=False)
+    theta, phi = np.meshgrid(theta, phi, indexing='ij')
+    radius = MODEL_SIZE / 2
+    vertices = np.vstack([
+        [[0.0, 0.0, radius]],
+        np.column_stack([
+            (radius * np.sin(theta) * np.cos(phi)).ravel(),
+            (radius * np.sin(theta) * np.sin(phi)).ravel(),
+            (radius * np.cos(theta)).ravel(),
+        ]),
+        [[0.0, 0.0, -radius]],
+    ])
+    south = len(vertices) - 1
+    ring = np.arange(cols)
+    last = (rings - 1) * cols
+    faces = np.vstack([
+        _grid_faces(rings, cols, wrap_cols=True) + 1,
+        np.column_stack([np.zeros(cols, dtype=int), ring + 1, (ring + 1) % cols + 1]),
+        np.column_stack([np.full(cols, south), last + (ring + 1) % cols + 1, last + ring + 1]),
+    ])
+    return _outward(trimesh.Trimesh(vertices=vertices, faces=faces, process=False))
+
+
+def make_torus(triangles):
+    """Toro ad alta risoluzione (2·segmenti maggiori·segmenti minori triangoli)"""
+    minor = max(3, int(round(math.sqrt(triangles / 8))))
+    major = 4 * minor
+    u = np.linspace(0, 2 * math.pi, major, endpoint=False)
+    v = np.linspace(0, 2 * math.pi, minor, endpoint=False)
+    u, v = np.meshgrid(u, v, indexing='ij')
+    major_radius = MODEL_SIZE * 0.35
+    minor_radius = MODEL_SIZE * 0.15
+    ring = major_radius + minor_radius * np.cos(v)
+    vertices = np.column_stack([
+        (ring * np.cos(u)).ravel(),
+        (ring * np.sin(u)).ravel(),
+        (minor_radius * np.sin(v)).ravel(),
+    ])
+    faces = _grid_faces(major, minor, wrap_cols=True, wrap_rows=True)
+    return _outward(trimesh.Trimesh(vertices=vertices, faces=faces, process=False))
+
+
+def _outward(mesh):
+    """Orienta le facce verso l'esterno (volume positivo)"""
+    if mesh.volume < 0:
+        mesh = trimesh.Trimesh(vertices=mesh.vertices, faces=mesh.faces[:, ::-1], process=False)
+    return mesh
+
+
+MESH_FACTORIES = {'cube': make_cube, 'sphere': make_sphere, 'torus': make_torus}
+
+
+def stl_bytes(mesh, fmt):
+    """Serializza il mesh in STL binario o ASCII"""
+    triangles = np.asarray(mesh.vertices, dtype=np.float32)[mesh.faces]
+    if fmt == 'binary':
+        records = np.zeros(len(triangles), dtype=STL_RECORD_DTYPE)
+        records['vertices'] = triangles
+        header = b'pimp_my_printer benchmark'.ljust(STL_HEADER_SIZE, b' ')
+        count = np.array([len(triangles)], dtype='<u4').tobytes()
+        return header + count + records.tobytes()
+
+    buffer = io.BytesIO()
+    buffer.write(b'solid benchmark\n')
+    facet = (
+        'facet normal 0 0 0\n outer loop\n'
+        '  vertex %.6e %.6e %.6e\n  vertex %.6e %.6e %.6e\n  vertex %.6e %.6e %.6e\n'
+        ' endloop\nendfacet'
+    )
+    np.savetxt(buffer, triangles.reshape(-1, 9), fmt=facet)
+    buffer.write(b'endsolid benchmark\n')
+    return buffer.getvalue()
+
+
+# --- Misure -------------------------------------------------------------------
+
+def measure(function, repeat, memory):
+    """
+    Esegue una fase e ne misura il tempo migliore e il picco di memoria
+
+    Il picco è misurato con tracemalloc (allocazioni Python e NumPy) in
+    un'esecuzione separata, così il tracciamento non altera i tempi.
+
+    Returns:
+        Tupla (risultato, misure)
+    """
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        result = None
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+
+    measures = {"time_s": round(best, 6)}
+    if memory:
+        tracemalloc.start()
+        try:
+            function()
+            measures["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 3)
+        finally:
+            tracemalloc.stop()
+    return result, measures
+
+
+def run_case(shape, triangles, fmt, params, repeat, memory):
+    """Misura tutte le fasi della pipeline per un mesh sintetico"""
+    source = MESH_FACTORIES[shape](triangles)
+    data = stl_bytes(source, fmt)
+    del source
+
+    stages = {}
+
+    mesh, stages['parse'] = measure(lambda: load_mesh(data), repeat, memory)
+
+    stats, stages['stats'] = measure(lambda: app.calculate_model_stats(mesh), repeat, memory)
+
+    layer_height = params['layer_height']
+
+    def slice_stage():
+        index = TriangleZIndex.from_mesh(mesh)
+        schedule = app.layer_schedule(index, params)
+        return index, list(iter_sliced_layers(mesh, layer_height, index=index, schedule=schedule))
+    (index, layers), stages['slice'] = measure(slice_stage, repeat, memory)
+
+    # Perimetri da soli, con gli stessi parametri di iter_toolpaths
+    perimeters = int(params.get('perimeters', app.DEFAULT_PARAMS['perimeters']))
+    extrusion_width = layer_height * 1.2
+
+    def shells_stage():
+        inner_areas = []
+        for layer in layers:
+            polygons = [c['points'] for c in layer['contours'] if c['closed']]
+            inner_areas.append(perimeter_shells(polygons, perimeters, extrusion_width)[1])
+        return inner_areas
+    inner_areas, stages['shells'] = measure(shells_stage, repeat, memory)
+    stages['shells']['per_layer_ms'] = round(stages['shells']['time_s'] * 1000 / max(len(layers), 1), 3)
+
+    # Riempimento da solo, sull'area interna all'ultimo perimetro come in
+    # iter_toolpaths
+    infill = get_pattern(params.get('infill_pattern', app.DEFAULT_PARAMS['infill_pattern']))
+    infill_density = params.get('infill_density', app.DEFAULT_PARAMS['infill_density'])
+
+    def infill_stage():
+        if infill is None:
+            return
+        for layer, inner in zip(layers, inner_areas):
+            infill_lines(infill, inner, layer['z'], extrusion_width, infill_density, min_length=extrusion_width)
+    _, stages['infill'] = measure(infill_stage, repeat, memory)
+    stages['infill']['per_layer_ms'] = round(stages['infill']['time_s'] * 1000 / max(len(layers), 1), 3)
+
+    toolpaths, stages['toolpaths'] = measure(
+        lambda: list(app.iter_toolpaths(mesh, params, index=index, layers=layers)),
+        repeat, memory,
+    )
+    chunks, stages['format'] = measure(
+        lambda: [toolpath.to_gcode() for _, toolpath in toolpaths if toolpath is not None],
+        repeat, memory,
+    )
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'benchmark.gcode')
+        gcode_bytes, stages['write'] = measure(lambda: app.write_gcode(path, chunks), repeat, memory)
+
+    def print_time_stage():
+        estimator = PrintTimeEstimator(app.PURGE_END_POSITION)
+        for z, toolpath in toolpaths:
+            app.replay_layer(estimator, z, toolpath, params)
+        return estimator.total_time
+    print_time_s, stages['print_time'] = measure(print_time_stage, repeat, memory)
+
+    return {
+        "shape": shape,
+        "triangles": int(len(mesh.faces)),
+        "requested_triangles": triangles,
+        "format": fmt,
+        "stl_bytes": len(data),
+        "layers": len(layers),
+        "moves": int(sum(len(toolpath) for _, toolpath in toolpaths if toolpath is not None)),
+        "gcode_bytes": int(gcode_bytes),
+        "print_time_s": round(print_time_s, 3),
+        "stages": stages,
+        "total_s": round(sum(
+            stage["time_s"] for name, stage in stages.items() if name not in NESTED_STAGES
+        ), 6),
+    }
+
+
+def run(args):
+    sizes = QUICK_SIZES if args.quick else tuple(int(float(s)) for s in args.sizes.split(','))
+    params = app.normalize_params(json.loads(args.params))
+    results = []
+    for shape in args.shapes.split(','):
+        for triangles in sizes:
+            for fmt in args.formats.split(','):
+                if fmt == 'ascii' and triangles > args.ascii_max:
+                    continue
+                result = run_case(shape, triangles, fmt, params, args.repeat, not args.no_memory)
+                results.append(result)
+                timings = "  ".join(
+                    f"{name} {stage['time_s'] * 1000:.1f}ms" for name, stage in result['stages'].items()
+                )
+                shells_ms = result['stages']['shells']['per_layer_ms']
+                infill_ms = result['stages']['infill']['per_layer_ms']
+                print(f"{shape:6} {result['triangles']:>9} {fmt:6}  {timings}  "
+                      f"(perimetri {shells_ms:.2f}ms/layer, riempimento {infill_ms:.2f}ms/layer)", flush=True)
+
+    report = {
+        "meta": {
+            "date": datetime.now().isoformat(timespec='seconds'),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "trimesh": trimesh.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "params": params,
+            "repeat": args.repeat,
+            "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        },
+        "results": results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Risultati salvati in {args.output}")
+
+
+# --- Confronto -----------------------------------------------------------------
+
+def _case_key(result):
+    return (result['shape'], result['requested_triangles'], result['format'])
+
+
+def compare(args):
+    """
+    Confronta due esecuzioni fase per fase
+
+    Una fase è in regressione se tempo (o picco di memoria) cresce più della
+    soglia relativa e più della soglia assoluta, per ignorare il rumore
+    sulle fasi molto brevi.
+
+    Returns:
+        Codice di uscita: 1 se ci sono regressioni
+    """
+    with open(args.base) as f:
+        base = {_case_key(r): r for r in json.load(f)['results']}
+    with open(args.new) as f:
+        new = {_case_key(r): r for r in json.load(f)['results']}
+
+    regressions = 0
+    for key in sorted(base.keys() & new.keys()):
+        shape, triangles, fmt = key
+        for stage in STAGES:
+            before = base[key]['stages'].get(stage)
+            after = new[key]['stages'].get(stage)
+            if before is None or after is None:
+                continue
+            flags = []
+            for metric, minimum in (('time_s', args.min_time), ('peak_mb', args.min_memory)):
+                if metric not in before or metric not in after:
+                    continue
+                old, current = before[metric], after[metric]
+                if current > old * (1 + args.threshold) and current - old > minimum:
+                    flags.append(metric)
+            ratio = after['time_s'] / before['time_s'] if before['time_s'] else float('inf')
+            marker = "REGRESSIONE " + ",".join(flags) if flags else ""
+            regressions += bool(flags)
+            print(
+                f"{shape:6} {triangles:>9} {fmt:6} {stage:10} "
+                f"{before['time_s'] * 1000:10.1f}ms -> {after['time_s'] * 1000:10.1f}ms "
+                f"({ratio:5.2f}x) {marker}"
+            )
+
+    for key in sorted(base.keys() ^ new.keys()):
+        print(f"{' '.join(map(str, key))}: presente in una sola esecuzione")
+
+    print(f"Regressioni: {regressions}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="Esegue il benchmark")
+    run_parser.add_argument('--output', default='benchmark.json')
+    run_parser.add_argument('--shapes', default=','.join(SHAPES))
+    run_parser.add_argument('--sizes', default=','.join(str(s) for s in SIZES),
+                            help="Numero di triangoli, separati da virgola")
+    run_parser.add_argument('--quick', action='store_true',
+                            help="Solo i mesh piccoli (fino a 100k triangoli)")
+    run_parser.add_argument('--formats', default=','.join(FORMATS))
+    run_parser.add_argument('--ascii-max', type=int, default=ASCII_MAX_TRIANGLES)
+    run_parser.add_argument('--params', default='{}', help="Parametri di stampa in JSON")
+    run_parser.add_argument('--repeat', type=int, default=1)
+    run_parser.add_argument('--no-memory', action='store_true',
+                            help="Non misura il picco di memoria (più veloce)")
+
+    compare_parser = commands.add_parser('compare', help="Confronta due esecuzioni")
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=0.10,
+                                help="Aumento relativo oltre il quale segnalare (0.10 = 10%%)")
+    compare_parser.add_argument('--min-time', type=float, default=0.005,
+                                help="Aumento minimo in secondi da considerare")
+    compare_parser.add_argument('--min-memory', type=float, default=1.0,
+                                help="Aumento minimo del picco in MB da considerare")
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        run(args)
+    else:
+        sys.exit(compare(args))
+
+
+if __name__ == '__main__':
+    main()
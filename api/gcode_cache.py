@@ -0,0 +1,153 @@
+"""
+Cache dei G-code generati, indirizzata per contenuto
+
+La chiave è l'hash dei byte del file STL (l'ID del mesh) più i parametri di
+stampa normalizzati: la stessa combinazione restituisce subito il G-code già
+generato. Le voci sono salvate su disco (condivise tra i worker) e puntano ai
+G-code dell'archivio degli artefatti (vedi artifact_store).
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+CACHE_PREFIX = 'cache_'
+
+
+def cache_key(mesh_id, params):
+    """
+    Calcola la chiave di cache per un mesh e i suoi parametri
+
+    Args:
+        mesh_id: Hash del contenuto del file STL (vedi mesh_store.mesh_id_for)
+        params: Parametri di stampa già normalizzati
+
+    Returns:
+        Stringa esadecimale SHA-256
+    """
+    digest = hashlib.sha256()
+    digest.update(mesh_id.encode())
+    digest.update(b'\0')
+    digest.update(json.dumps(params, sort_keys=True, separators=(',', ':')).encode())
+    return digest.hexdigest()
+
+
+class GcodeCache:
+    """
+    Cache su disco dei risultati di /api/slice
+
+    Ogni voce è un piccolo file JSON (cache_<chiave>.json) che punta a un
+    G-code dell'archivio degli artefatti; il tempo di ultima modifica del JSON
+    registra l'ultimo accesso. Quota e rimozione dei G-code spettano
+    all'archivio: una voce il cui G-code è stato rimosso è un miss.
+
+    Args:
+        directory: Directory delle voci della cache
+        artifacts: ArtifactStore in cui sono salvati i G-code
+        max_age: Secondi dall'ultimo accesso dopo i quali una voce scade
+    """
+
+    def __init__(self, directory, artifacts, max_age):
+        self.directory = directory
+        self.artifacts = artifacts
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, f"{CACHE_PREFIX}{key}.json")
+
+    def lookup(self, key):
+        """
+        Cerca una voce valida nella cache
+
+        Returns:
+            Dizionario della voce (gcode_id, filename, stats) con i metadati
+            dell'artefatto in 'artifact', oppure None
+        """
+        path = self._entry_path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+            expired = time.time() - os.path.getmtime(path) > self.max_age
+        except (OSError, ValueError):
+            entry = None
+            expired = False
+
+        # Il G-code può essere stato rimosso dall'archivio: la voce resta
+        # fino alla prossima pulizia, ma non è più valida
+        artifact = None
+        if entry is not None and not expired:
+            artifact = self.artifacts.get(entry['gcode_id'])
+
+        with self._lock:
+            if artifact is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        # Aggiorna l'ultimo accesso
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return dict(entry, artifact=artifact)
+
+    def store(self, key, gcode_id, filename, stats, content_length):
+        """
+        Registra nell'archivio un G-code appena scritto e lo indicizza con la chiave
+
+        Args:
+            content_length: Dimensione in byte del G-code decompresso
+        """
+        self.artifacts.register(gcode_id, filename, key, stats, content_length)
+        entry = {"gcode_id": gcode_id, "filename": filename, "stats": stats}
+        path = self._entry_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+    def evict(self):
+        """
+        Rimuove le voci scadute e quelle il cui G-code non è più in archivio
+
+        Eseguita dallo Sweeper, mai durante una richiesta.
+        """
+        now = time.time()
+        for item in os.scandir(self.directory):
+            if not (item.name.startswith(CACHE_PREFIX) and item.name.endswith('.json')):
+                continue
+            try:
+                accessed = item.stat().st_mtime
+                with open(item.path) as f:
+                    entry = json.load(f)
+                stale = (
+                    now - accessed > self.max_age
+                    or self.artifacts.get(entry['gcode_id'], touch=False) is None
+                )
+            except (OSError, ValueError, KeyError):
+                stale = True
+            if stale:
+                self._remove(item.path)
+
+    def _remove(self, path):
+        """Elimina una voce (il G-code resta all'archivio)"""
+        try:
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            self.evictions += 1
+
+    def stats(self):
+        """Contatori della cache per questo processo"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
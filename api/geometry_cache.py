@@ -0,0 +1,295 @@
+"""
+Cache della geometria dei layer, indirizzata per contenuto
+
+I percorsi dei layer (perimetri, riempimento, ordine degli spostamenti)
+dipendono solo dal mesh e dai parametri geometrici; temperature, velocità e
+ritrazione cambiano solo l'emissione del G-code. Per ogni combinazione
+mesh + parametri geometrici i movimenti di tutti i layer sono salvati senza
+velocità in un file di record (x, y, e, tipo di movimento), scritto un layer
+alla volta durante lo slicing e riletto con memory-map; le velocità sono
+ricostruite dal tipo di movimento. Un file JSON con quote e indici dei layer,
+scritto per ultimo, segna la voce come completa. I file sono condivisi tra i
+worker e i processi dei job; sopra il disco c'è una LRU in memoria.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+from toolpath import LayerToolpath, is_extrusion
+
+GEOMETRY_PREFIX = 'geometry_'
+
+# Record di un movimento senza velocità
+GEOMETRY_RECORD_DTYPE = np.dtype([('x', '<f8'), ('y', '<f8'), ('e', '<f8'), ('type', 'i1')])
+
+
+class LayerGeometry:
+    """
+    Movimenti di tutti i layer di un modello, senza velocità
+
+    Args:
+        records: Array (o memory-map) di GEOMETRY_RECORD_DTYPE con i
+            movimenti di tutti i layer, in ordine
+        meta: Dizionario con 'z' e 'offsets' (inizio dei movimenti di ogni
+            layer, più la fine), 'present' (False per i layer senza
+            contorni) e gli spostamenti 'travel_before' / 'travel_after'
+            registrati dall'ordinamento (liste vuote se disattivato)
+    """
+
+    def __init__(self, records, meta):
+        self.records = records
+        self.meta = meta
+        # Ultimo aggiornamento della data di modifica dei file (vedi GeometryCache.get)
+        self.touched = time.time()
+
+    def __len__(self):
+        return len(self.meta['z'])
+
+    def toolpaths(self, feed_travel, feed_extrude, first=0, stop=None):
+        """
+        Percorsi dei layer con le velocità indicate
+
+        Args:
+            feed_travel: Velocità degli spostamenti in mm/min
+            feed_extrude: Velocità di estrusione in mm/min
+            first: Primo layer da restituire (predefinito: il primo)
+            stop: Layer successivo all'ultimo (predefinito: tutti); dal
+                memory-map sono letti solo i record dei layer richiesti
+
+        Yields:
+            Tuple (z, toolpath) come iter_toolpaths
+        """
+        # Stesse etichette, nello stesso ordine, di LayerToolpath.add
+        feed_labels = {float(feed_travel): str(feed_travel)}
+        feed_labels.setdefault(float(feed_extrude), str(feed_extrude))
+        offsets = self.meta['offsets']
+        if stop is None:
+            stop = len(self)
+        for layer in range(first, stop):
+            z = self.meta['z'][layer]
+            if not self.meta['present'][layer]:
+                yield z, None
+                continue
+            moves = self.records[offsets[layer]:offsets[layer + 1]]
+            move_type = np.array(moves['type'])
+            feed = np.where(is_extrusion(move_type), float(feed_extrude), float(feed_travel))
+            yield z, LayerToolpath.from_columns(
+                z, np.array(moves['x']), np.array(moves['y']), np.array(moves['e']),
+                feed, move_type, feed_labels,
+            )
+
+
+class GeometryWriter:
+    """
+    Scrive una voce della cache un layer alla volta
+
+    I record sono scritti su un file temporaneo; commit lo rende visibile
+    scrivendo per ultimo il JSON, abort lo elimina (ad esempio quando il
+    job viene annullato a metà).
+    """
+
+    def __init__(self, cache, key):
+        self.cache = cache
+        self.key = key
+        self.records_path, self.meta_path = cache._paths(key)
+        self._tmp_path = f"{self.records_path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+        self._file = open(self._tmp_path, 'wb')
+        self._meta = {"z": [], "offsets": [0], "present": []}
+
+    def add(self, z, toolpath):
+        """Aggiunge i movimenti di un layer (toolpath None senza contorni)"""
+        count = 0
+        if toolpath is not None:
+            x, y, _, e, _, move_type = toolpath.columns()
+            moves = np.empty(len(x), dtype=GEOMETRY_RECORD_DTYPE)
+            moves['x'], moves['y'], moves['e'], moves['type'] = x, y, e, move_type
+            self._file.write(moves.tobytes())
+            count = len(moves)
+        self._meta['z'].append(float(z))
+        self._meta['offsets'].append(self._meta['offsets'][-1] + count)
+        self._meta['present'].append(toolpath is not None)
+
+    def commit(self, travel_optimizer=None):
+        """
+        Completa la voce e la registra nella cache
+
+        Args:
+            travel_optimizer: TravelOptimizer usato per i percorsi, di cui
+                sono salvati gli spostamenti per layer
+
+        Returns:
+            LayerGeometry della voce
+        """
+        self._file.close()
+        os.replace(self._tmp_path, self.records_path)
+        if travel_optimizer is not None:
+            self._meta['travel_before'] = [float(d) for d in travel_optimizer.travel_before]
+            self._meta['travel_after'] = [float(d) for d in travel_optimizer.travel_after]
+        else:
+            self._meta['travel_before'] = []
+            self._meta['travel_after'] = []
+        tmp_path = f"{self.meta_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self._meta, f)
+        os.replace(tmp_path, self.meta_path)
+        return self.cache._load(self.key)
+
+    def abort(self):
+        """Scarta la voce incompleta"""
+        self._file.close()
+        try:
+            os.remove(self._tmp_path)
+        except OSError:
+            pass
+
+
+class GeometryCache:
+    """
+    Cache su disco della geometria dei layer con LRU in memoria
+
+    Args:
+        directory: Directory dei file .bin e .json
+        max_items: Numero massimo di voci tenute in memoria
+        max_age: Secondi dopo l'ultimo accesso oltre i quali una voce viene
+            rimossa dal disco
+    """
+
+    def __init__(self, directory, max_items, max_age):
+        self.directory = directory
+        self.max_items = max_items
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, f"{GEOMETRY_PREFIX}{key}")
+        return f"{base}.bin", f"{base}.json"
+
+    def get(self, key):
+        """
+        Restituisce la geometria con la chiave indicata, dalla memoria o dal disco
+
+        Anche quando la voce è in memoria la data di modifica dei file viene
+        aggiornata, al più una volta ogni max_age / 10 secondi, così evict
+        non rimuove le voci usate di continuo.
+
+        Returns:
+            LayerGeometry oppure None se la voce non è presente
+        """
+        with self._lock:
+            geometry = self._entries.get(key)
+            if geometry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if geometry is not None:
+            self._touch(key, geometry)
+            return geometry
+
+        geometry = self._load(key)
+        with self._lock:
+            if geometry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return geometry
+
+    def contains(self, key):
+        """True se la voce è presente, senza caricarla né contarla"""
+        with self._lock:
+            if key in self._entries:
+                return True
+        return os.path.exists(self._paths(key)[1])
+
+    def writer(self, key):
+        """GeometryWriter per una nuova voce"""
+        return GeometryWriter(self, key)
+
+    def _touch(self, key, geometry):
+        now = time.time()
+        if now - geometry.touched < self.max_age / 10:
+            return
+        geometry.touched = now
+        for path in self._paths(key):
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+
+    def _load(self, key):
+        records_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta['offsets'][-1] > 0:
+                records = np.memmap(records_path, dtype=GEOMETRY_RECORD_DTYPE, mode='r')
+            else:
+                records = np.empty(0, dtype=GEOMETRY_RECORD_DTYPE)
+        except (OSError, ValueError, KeyError):
+            return None
+        if len(records) != meta['offsets'][-1]:
+            return None
+
+        for path in (records_path, meta_path):
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+
+        geometry = LayerGeometry(records, meta)
+        with self._lock:
+            self._entries[key] = geometry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+        return geometry
+
+    def evict(self):
+        """
+        Rimuove dal disco le voci non usate da più di max_age secondi
+
+        Eseguita dallo Sweeper, mai durante una richiesta.
+        """
+        now = time.time()
+        for item in os.scandir(self.directory):
+            if not item.name.startswith(GEOMETRY_PREFIX):
+                continue
+            try:
+                expired = now - item.stat().st_mtime > self.max_age
+            except OSError:
+                continue
+            if not expired:
+                continue
+            if item.name.endswith('.tmp'):
+                # Scrittura interrotta senza abort (processo terminato)
+                try:
+                    os.remove(item.path)
+                except OSError:
+                    pass
+                continue
+            if not item.name.endswith('.json'):
+                continue
+            key = item.name[len(GEOMETRY_PREFIX):-len('.json')]
+            with self._lock:
+                self._entries.pop(key, None)
+            # Prima il JSON: senza di esso la voce non è più valida
+            for path in reversed(self._paths(key)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def stats(self):
+        """Contatori della cache per questo processo"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "in_memory": len(self._entries),
+            }
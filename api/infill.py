@@ -0,0 +1,206 @@
+"""
+Generatore del riempimento per Pimp My Printer
+
+Ogni pattern è un insieme di famiglie di linee parallele (angolo e
+sfasamento). Le linee di tutte le famiglie sono calcolate come array e
+ritagliate sui contorni chiusi del layer con un'unica intersezione
+vettoriale tra le scanline e i lati dei poligoni: le intersezioni di ogni
+scanline, ordinate, si accoppiano a due a due (regola pari-dispari), così
+i fori del modello restano vuoti.
+
+Le scanline sono allineate a una griglia assoluta del piatto, quindi le
+linee di layer successivi si sovrappongono e si sostengono a vicenda.
+"""
+import math
+from collections import namedtuple
+
+import numpy as np
+
+from toolpath import MOVE_INFILL_TRAVEL, MOVE_INFILL, MOVE_DIAGONAL_TRAVEL, MOVE_DIAGONAL
+
+# Pattern registrato: families(z) restituisce le famiglie di linee del layer
+# come sequenza di (angolo in gradi, sfasamento in mm delle scanline)
+InfillPattern = namedtuple('InfillPattern', ['families', 'travel_type', 'extrude_type'])
+
+INFILL_PATTERNS = {}
+
+
+def register_pattern(name, families, travel_type=MOVE_INFILL_TRAVEL, extrude_type=MOVE_INFILL):
+    """
+    Registra un pattern di riempimento
+
+    Args:
+        name: Nome accettato dal parametro 'infill_pattern' (senza
+            distinzione tra maiuscole e minuscole)
+        families: Funzione z -> sequenza di (angolo in gradi, sfasamento in
+            mm) delle famiglie di linee del layer
+        travel_type, extrude_type: Tipi di movimento delle linee
+    """
+    INFILL_PATTERNS[name.lower()] = InfillPattern(families, travel_type, extrude_type)
+
+
+def get_pattern(name):
+    """Pattern registrato con questo nome, None se sconosciuto"""
+    return INFILL_PATTERNS.get(str(name).lower())
+
+
+def line_spacing(family_count, extrusion_width, density):
+    """
+    Distanza tra le linee di una famiglia per ottenere la densità richiesta
+
+    Con n famiglie ogni famiglia copre 1/n della densità: a densità d (in %)
+    la distanza è extrusion_width * n * 100 / d.
+
+    Returns:
+        Distanza in mm, None se la densità non è positiva
+    """
+    if density <= 0 or family_count == 0:
+        return None
+    return extrusion_width * family_count * 100 / min(density, 100)
+
+
+def polygon_edges(polygons):
+    """
+    Lati di tutti i contorni chiusi del layer
+
+    Args:
+        polygons: Array (N, 2) dei punti di ogni contorno, con l'ultimo
+            punto uguale al primo
+
+    Returns:
+        Tupla (starts, ends) di array (E, 2)
+    """
+    polygons = [p for p in polygons if len(p) > 3]
+    if not polygons:
+        empty = np.empty((0, 2))
+        return empty, empty
+    return (
+        np.concatenate([p[:-1] for p in polygons]),
+        np.concatenate([p[1:] for p in polygons]),
+    )
+
+
+def clip_scanlines(edge_starts, edge_ends, angle, offset, spacing, min_length=0.0):
+    """
+    Linee di una famiglia ritagliate sui poligoni
+
+    Nel sistema ruotato di -angle le scanline sono orizzontali a quota
+    offset + k * spacing. Ogni lato attraversa le scanline con quota in
+    [min, max) (semiaperto, così un vertice sulla scanline è contato una
+    volta sola); le intersezioni sono calcolate tutte insieme con np.repeat
+    e accoppiate dopo un unico ordinamento per (scanline, ascissa).
+
+    Args:
+        edge_starts, edge_ends: Lati dei poligoni da polygon_edges
+        angle: Direzione delle linee in gradi
+        offset: Sfasamento delle scanline in mm
+        spacing: Distanza tra le scanline in mm
+        min_length: Le linee più corte sono scartate
+
+    Returns:
+        Tupla (starts, ends) di array (N, 2); le linee di scanline
+        consecutive hanno verso alternato
+    """
+    theta = math.radians(angle)
+    cos, sin = math.cos(theta), math.sin(theta)
+    ua = edge_starts[:, 0] * cos + edge_starts[:, 1] * sin
+    ub = edge_ends[:, 0] * cos + edge_ends[:, 1] * sin
+    va = edge_starts[:, 1] * cos - edge_starts[:, 0] * sin
+    vb = edge_ends[:, 1] * cos - edge_ends[:, 0] * sin
+
+    # Scanline attraversate da ogni lato: k in [k_low, k_high)
+    k_low = np.ceil((np.minimum(va, vb) - offset) / spacing).astype(np.int64)
+    k_high = np.ceil((np.maximum(va, vb) - offset) / spacing).astype(np.int64)
+    counts = np.maximum(k_high - k_low, 0)
+    total = int(counts.sum())
+    if total == 0:
+        empty = np.empty((0, 2))
+        return empty, empty
+
+    edge = np.repeat(np.arange(len(counts)), counts)
+    first = np.cumsum(counts) - counts
+    k = k_low[edge] + np.arange(total) - np.repeat(first, counts)
+    v = offset + k * spacing
+    t = (v - va[edge]) / (vb[edge] - va[edge])
+    u = ua[edge] + t * (ub[edge] - ua[edge])
+
+    order = np.lexsort((u, k))
+    k = k[order]
+    u = u[order]
+
+    # Scanline con un numero dispari di intersezioni (contorni degeneri):
+    # l'accoppiamento sarebbe ambiguo, vengono saltate
+    per_line = np.unique(k, return_counts=True)[1]
+    odd = per_line % 2 == 1
+    if odd.any():
+        keep = np.repeat(~odd, per_line)
+        k = k[keep]
+        u = u[keep]
+
+    k = k[0::2]
+    u_start = u[0::2]
+    u_end = u[1::2]
+    keep = u_end - u_start > min_length
+    k, u_start, u_end = k[keep], u_start[keep], u_end[keep]
+
+    # Verso alternato tra scanline consecutive
+    reverse = k % 2 == 1
+    u_start, u_end = np.where(reverse, u_end, u_start), np.where(reverse, u_start, u_end)
+    v = offset + k * spacing
+    starts = np.column_stack([u_start * cos - v * sin, u_start * sin + v * cos])
+    ends = np.column_stack([u_end * cos - v * sin, u_end * sin + v * cos])
+    return starts, ends
+
+
+def infill_lines(pattern, polygons, z, extrusion_width, density, min_length=0.0):
+    """
+    Linee di riempimento di un layer
+
+    Args:
+        pattern: InfillPattern da get_pattern
+        polygons: Contorni chiusi del layer (vedi polygon_edges)
+        z: Quota del layer
+        extrusion_width: Larghezza della linea estrusa in mm
+        density: Densità del riempimento in %
+        min_length: Le linee più corte sono scartate
+
+    Returns:
+        Lista di tuple (starts, ends), una per famiglia di linee
+    """
+    families = pattern.families(z)
+    spacing = line_spacing(len(families), extrusion_width, density)
+    if spacing is None:
+        return []
+    edge_starts, edge_ends = polygon_edges(polygons)
+    if len(edge_starts) == 0:
+        return []
+    return [
+        clip_scanlines(edge_starts, edge_ends, angle, shift % spacing, spacing, min_length)
+        for angle, shift in families
+    ]
+
+
+def _grid(z):
+    return ((0.0, 0.0), (90.0, 0.0))
+
+
+def _lines(z):
+    return ((0.0, 0.0),)
+
+
+def _triangles(z):
+    # Tre famiglie a 60° che passano per gli stessi nodi: triangoli equilateri
+    return ((0.0, 0.0), (60.0, 0.0), (120.0, 0.0))
+
+
+def _cubic(z):
+    # Sezioni di cubi appoggiati su un vertice: le normali orizzontali delle
+    # tre famiglie di facce sono a 120° e le linee scorrono di z / sqrt(2)
+    shift = z / math.sqrt(2)
+    return ((0.0, shift), (120.0, shift), (240.0, shift))
+
+
+register_pattern('grid', _grid)
+register_pattern('lines', _lines)
+register_pattern('triangles', _triangles, MOVE_DIAGONAL_TRAVEL, MOVE_DIAGONAL)
+register_pattern('cubic', _cubic)
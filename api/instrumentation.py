@@ -0,0 +1,238 @@
+"""
+Log strutturati, tempi delle fasi e metriche in formato Prometheus
+
+I log sono emessi con il modulo logging (livello da LOG_LEVEL) come una
+riga JSON per evento, con i campi passati in extra. I tempi delle fasi di
+slicing (upload, parsing, statistiche, generazione, scrittura) finiscono in
+istogrammi esposti da /api/metrics e, per la richiesta o il job in corso,
+in un raccoglitore per thread riportato nel log finale.
+"""
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+# Limiti superiori (secondi) degli intervalli degli istogrammi di durata
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# Attributi standard dei LogRecord, esclusi dai campi strutturati
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Una riga JSON per evento, con i campi passati tramite extra"""
+
+    def format(self, record):
+        event = {
+            "time": self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                event[key] = value
+        if record.exc_info:
+            event["exception"] = self.formatException(record.exc_info)
+        return json.dumps(event, ensure_ascii=False, default=str)
+
+
+def configure_logging():
+    """Configura il logger radice (livello da LOG_LEVEL, predefinito INFO)"""
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter())
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{value}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class Histogram:
+    """Istogramma cumulativo con etichette, come quelli di Prometheus"""
+
+    def __init__(self, name, help_text, labels=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+        for key, (counts, total, count) in series:
+            for bound, bucket_count in zip(self.buckets, counts):
+                labels = _format_labels(self.labels + ('le',), key + (repr(float(bound)),))
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            labels = _format_labels(self.labels + ('le',), key + ('+Inf',))
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Counter:
+    """Contatore monotono senza etichette"""
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter",
+                f"{self.name} {self.value}"]
+
+
+class CallbackMetric:
+    """Metrica letta al momento dell'esposizione da una funzione"""
+
+    def __init__(self, name, kind, help_text, function):
+        self.name = name
+        self.kind = kind
+        self.help_text = help_text
+        self.function = function
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}",
+                f"{self.name} {self.function()}"]
+
+
+class Registry:
+    """Insieme delle metriche di questo processo"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def histogram(self, name, help_text, labels=(), buckets=DURATION_BUCKETS):
+        return self._add(Histogram(name, help_text, labels, buckets))
+
+    def counter(self, name, help_text):
+        return self._add(Counter(name, help_text))
+
+    def callback(self, name, kind, help_text, function):
+        """Registra una metrica (gauge o counter) calcolata su richiesta"""
+        return self._add(CallbackMetric(name, kind, help_text, function))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Testo nel formato di esposizione di Prometheus (0.0.4)"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'pmp_stage_duration_seconds', "Durata delle fasi di slicing", labels=('stage',),
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    'pmp_request_duration_seconds', "Durata delle richieste HTTP", labels=('endpoint', 'status'),
+)
+GCODE_BYTES_WRITTEN = REGISTRY.counter(
+    'pmp_gcode_bytes_written_total', "Byte di G-code scritti su disco",
+)
+
+_local = threading.local()
+
+
+class StageCollector:
+    """Tempi delle fasi e byte scritti da una richiesta o da un job"""
+
+    def __init__(self):
+        self.stages = {}
+        self.bytes_written = 0
+
+    def as_dict(self):
+        return {"stages": dict(self.stages), "bytes_written": self.bytes_written}
+
+
+@contextlib.contextmanager
+def collect_stages():
+    """
+    Raccoglie i tempi delle fasi eseguite nel thread corrente
+
+    Yields:
+        StageCollector riempito fino all'uscita dal blocco
+    """
+    collector = StageCollector()
+    previous = getattr(_local, 'collector', None)
+    _local.collector = collector
+    try:
+        yield collector
+    finally:
+        _local.collector = previous
+
+
+def _current_collector():
+    return getattr(_local, 'collector', None)
+
+
+def record_stage(stage, seconds):
+    """Registra la durata di una fase nell'istogramma e nel raccoglitore"""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    collector = _current_collector()
+    if collector is not None:
+        collector.stages[stage] = collector.stages.get(stage, 0.0) + seconds
+
+
+def record_bytes_written(count):
+    """Registra i byte di G-code scritti su disco"""
+    GCODE_BYTES_WRITTEN.inc(count)
+    collector = _current_collector()
+    if collector is not None:
+        collector.bytes_written += count
+
+
+def record_collected(data):
+    """
+    Registra in questo processo le misure raccolte altrove (es. nel
+    processo di un job), nel formato di StageCollector.as_dict
+    """
+    for name, seconds in data.get("stages", {}).items():
+        STAGE_SECONDS.observe(seconds, stage=name)
+    GCODE_BYTES_WRITTEN.inc(data.get("bytes_written", 0))
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Misura la durata del blocco come fase name"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
@@ -0,0 +1,263 @@
+"""
+Coda asincrona dei job di slicing
+
+I job vengono eseguiti su un pool di processi limitato, con una profondità
+massima della coda. Lo stato di ogni job (in coda, in esecuzione, completato,
+annullato, fallito) e l'avanzamento per layer sono salvati in piccoli file
+JSON, così sono leggibili da qualsiasi worker del server; l'annullamento è
+un file marcatore controllato dal processo di slicing a ogni layer.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from instrumentation import collect_stages, record_collected
+
+JOB_PREFIX = 'job_'
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_COMPLETED = 'completed'
+STATUS_CANCELLED = 'cancelled'
+STATUS_FAILED = 'failed'
+
+FINAL_STATUSES = (STATUS_COMPLETED, STATUS_CANCELLED, STATUS_FAILED)
+
+# Intervallo minimo (secondi) tra due scritture dello stato di avanzamento
+PROGRESS_INTERVAL = 0.5
+
+logger = logging.getLogger(__name__)
+
+
+class JobCancelled(Exception):
+    """Sollevata nel processo di slicing quando il job viene annullato"""
+
+
+class QueueFullError(Exception):
+    """La coda dei job ha raggiunto la profondità massima"""
+
+
+def _state_path(directory, job_id):
+    return os.path.join(directory, f"{JOB_PREFIX}{job_id}.json")
+
+
+def _cancel_path(directory, job_id):
+    return os.path.join(directory, f"{JOB_PREFIX}{job_id}.cancel")
+
+
+def read_state(directory, job_id):
+    """Legge lo stato di un job, None se il job non esiste"""
+    try:
+        with open(_state_path(directory, job_id)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_state(directory, job_id, **fields):
+    """Aggiorna in modo atomico lo stato di un job"""
+    state = read_state(directory, job_id) or {"job_id": job_id}
+    state.update(fields)
+    state["updated_at"] = time.time()
+    path = _state_path(directory, job_id)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+    return state
+
+
+def is_cancelled(directory, job_id):
+    return os.path.exists(_cancel_path(directory, job_id))
+
+
+class JobProgress:
+    """
+    Callback di avanzamento per il processo di slicing
+
+    Chiamata con (layer, layer_count) dopo ogni layer: aggiorna lo stato del
+    job al massimo ogni PROGRESS_INTERVAL secondi e solleva JobCancelled se
+    il job è stato annullato.
+    """
+
+    def __init__(self, directory, job_id):
+        self.directory = directory
+        self.job_id = job_id
+        self._last_write = 0.0
+
+    def __call__(self, layer, layer_count):
+        now = time.monotonic()
+        if layer < layer_count and now - self._last_write < PROGRESS_INTERVAL:
+            return
+        self._last_write = now
+        if is_cancelled(self.directory, self.job_id):
+            raise JobCancelled()
+        write_state(
+            self.directory, self.job_id,
+            layers_done=layer,
+            layer_count=layer_count,
+            progress=layer / layer_count if layer_count else 1.0,
+        )
+
+
+def _run_job(target, directory, job_id, args):
+    """
+    Esegue un job nel processo del pool e ne registra l'esito
+
+    Returns:
+        Tempi delle fasi e byte scritti dal job (StageCollector.as_dict),
+        da registrare nelle metriche del processo server
+    """
+    if is_cancelled(directory, job_id):
+        write_state(directory, job_id, status=STATUS_CANCELLED)
+        return None
+    write_state(directory, job_id, status=STATUS_RUNNING, started_at=time.time())
+    started = time.perf_counter()
+    with collect_stages() as collector:
+        try:
+            result = target(*args, progress=JobProgress(directory, job_id))
+        except JobCancelled:
+            logger.info("Job annullato", extra={"job_id": job_id})
+            write_state(directory, job_id, status=STATUS_CANCELLED)
+        except Exception as e:
+            logger.exception("Job fallito", extra={"job_id": job_id})
+            write_state(directory, job_id, status=STATUS_FAILED, error=str(e))
+        else:
+            write_state(
+                directory, job_id,
+                status=STATUS_COMPLETED, progress=1.0, result=result,
+                finished_at=time.time(),
+            )
+    logger.info("Job concluso", extra={
+        "job_id": job_id,
+        "duration_s": round(time.perf_counter() - started, 6),
+        "stages": {name: round(seconds, 6) for name, seconds in collector.stages.items()},
+        "bytes_written": collector.bytes_written,
+    })
+    return collector.as_dict()
+
+
+def _record_job_metrics(future):
+    """Callback del future: porta nel processo server le misure del job"""
+    if future.cancelled() or future.exception() is not None:
+        return
+    measures = future.result()
+    if measures is not None:
+        record_collected(measures)
+
+
+class JobManager:
+    """
+    Gestore dei job di slicing per questo processo server
+
+    Args:
+        directory: Directory dei file di stato dei job
+        max_workers: Numero di processi del pool
+        max_queue: Numero massimo di job in coda o in esecuzione
+        max_age: Secondi dopo i quali lo stato di un job concluso viene rimosso
+    """
+
+    def __init__(self, directory, max_workers, max_queue, max_age):
+        self.directory = directory
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.max_age = max_age
+        self._executor = None
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Creato al primo job, dopo l'eventuale fork dei worker del server;
+        # 'spawn' evita di duplicare i thread del server nei processi figli
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return self._executor
+
+    def pending(self):
+        """Numero di job in coda o in esecuzione"""
+        with self._lock:
+            self._futures = {k: f for k, f in self._futures.items() if not f.done()}
+            return len(self._futures)
+
+    def create(self, **fields):
+        """Registra un nuovo job, già concluso o da eseguire"""
+        job_id = str(uuid.uuid4())
+        state = {"status": STATUS_QUEUED, "progress": 0.0, "created_at": time.time()}
+        state.update(fields)
+        write_state(self.directory, job_id, **state)
+        return job_id
+
+    def submit(self, target, *args, **fields):
+        """
+        Accoda un job sul pool di processi
+
+        target viene chiamata nel processo del pool come
+        target(*args, progress=callback) e deve restituire un risultato
+        serializzabile in JSON.
+
+        Returns:
+            ID del job
+
+        Raises:
+            QueueFullError: se la coda ha raggiunto la profondità massima
+        """
+        if self.pending() >= self.max_queue:
+            raise QueueFullError()
+
+        job_id = self.create(**fields)
+        future = self._get_executor().submit(_run_job, target, self.directory, job_id, args)
+        future.add_done_callback(_record_job_metrics)
+        with self._lock:
+            self._futures[job_id] = future
+        return job_id
+
+    def status(self, job_id):
+        return read_state(self.directory, job_id)
+
+    def cancel(self, job_id):
+        """
+        Richiede l'annullamento di un job
+
+        Returns:
+            Stato aggiornato del job, None se il job non esiste
+        """
+        state = read_state(self.directory, job_id)
+        if state is None or state.get("status") in FINAL_STATUSES:
+            return state
+
+        with open(_cancel_path(self.directory, job_id), 'w'):
+            pass
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None and future.cancel():
+            # Non ancora avviato: rimosso direttamente dalla coda
+            return write_state(self.directory, job_id, status=STATUS_CANCELLED)
+        return state
+
+    def sweep(self):
+        """
+        Rimuove i file dei job conclusi da più di max_age secondi
+
+        Eseguita dallo Sweeper, mai durante una richiesta.
+        """
+        now = time.time()
+        for item in os.scandir(self.directory):
+            if not item.name.startswith(JOB_PREFIX):
+                continue
+            try:
+                expired = now - item.stat().st_mtime > self.max_age
+            except OSError:
+                continue
+            if expired:
+                try:
+                    os.remove(item.path)
+                except OSError:
+                    pass
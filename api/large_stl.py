@@ -0,0 +1,406 @@
+"""
+Percorso a memoria limitata per i file STL binari molto grandi
+
+Il file caricato resta su disco ed è letto con memory-map a blocchi di
+triangoli di dimensione fissa: le statistiche del modello (vedi
+mesh_stats.MeshScanner) sono calcolate senza costruire il mesh, e i
+triangoli sono ripartiti in bande Z scritte su disco. Lo slicing carica una
+banda alla volta, quindi la memoria dipende dalla dimensione delle bande e
+non da quella del modello. Un budget sul picco di memoria residente (RSS)
+dimensiona le bande ed è controllato a ogni blocco e a ogni banda.
+"""
+import hashlib
+import json
+import mmap
+import os
+import resource
+
+import numpy as np
+
+from mesh_stats import MeshScanner
+from slicer import (
+    TriangleZIndex, adaptive_height_limits, compute_layer_planes, iter_layers, stack_adaptive_layers,
+)
+from stl_loader import STL_HEADER_SIZE, STL_RECORD_DTYPE, STLFormatError
+
+# Triangoli letti per blocco nelle scansioni del file (circa 13 MB di
+# record, meno di 100 MB di temporanei)
+CHUNK_TRIANGLES = 262_144
+
+# Memoria stimata per triangolo di una banda durante lo slicing: vertici
+# float64 ordinati, intervalli Z, permutazione e temporanei
+BAND_BYTES_PER_TRIANGLE = 400
+
+# Sotto questa dimensione le bande non riducono più la memoria in modo utile
+MIN_BAND_TRIANGLES = 100_000
+
+# Risoluzione dell'istogramma delle quote usato per scegliere le bande
+BAND_HISTOGRAM_BINS = 4096
+
+# Blocchi letti da save_upload
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+
+BAND_META = 'bands.json'
+
+MB = 1024 * 1024
+
+
+class MemoryBudgetError(MemoryError):
+    """La memoria residente del processo ha superato il budget"""
+
+
+def current_rss():
+    """Memoria residente del processo in byte"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # Senza /proc: picco dall'avvio del processo (KB su Linux)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def peak_rss():
+    """Picco di memoria residente (VmHWM) in byte, None se non disponibile"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """Azzera il picco di memoria residente del processo (Linux), True se riuscito"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+class MemoryBudget:
+    """
+    Budget sul picco di memoria residente del processo
+
+    Su Linux il picco è quello misurato dal kernel (VmHWM, azzerato da
+    reset); altrimenti è campionato a ogni check. Il budget è verificato da
+    check ai confini dei blocchi e delle bande. Il picco è del processo:
+    esatto nei processi dei job, indicativo nel server con richieste
+    concorrenti.
+
+    Args:
+        limit: Byte massimi di memoria residente
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.peak = 0
+        self._kernel_peak = False
+
+    def reset(self):
+        """Riparte dalla memoria residente attuale (inizio di un'operazione)"""
+        self._kernel_peak = reset_peak_rss()
+        self.peak = current_rss()
+
+    def check(self):
+        """
+        Aggiorna il picco e verifica il budget
+
+        Raises:
+            MemoryBudgetError: se il picco di memoria residente supera il budget
+        """
+        rss = current_rss()
+        self.peak = max(self.peak, rss)
+        if self._kernel_peak:
+            self.peak = max(self.peak, peak_rss() or 0)
+        if self.peak > self.limit:
+            raise MemoryBudgetError(
+                f"Picco di memoria residente di {self.peak / MB:.0f} MB oltre il budget di {self.limit / MB:.0f} MB"
+            )
+        return rss
+
+    def band_triangles(self):
+        """Triangoli per banda che restano entro metà della memoria libera nel budget"""
+        free = self.limit - current_rss()
+        return max(MIN_BAND_TRIANGLES, int(free // 2 // BAND_BYTES_PER_TRIANGLE))
+
+    def summary(self):
+        """Budget e picco di memoria residente in MB"""
+        if self._kernel_peak:
+            self.peak = max(self.peak, peak_rss() or 0)
+        return {
+            "budget_mb": round(self.limit / MB, 1),
+            "peak_rss_mb": round(self.peak / MB, 1),
+        }
+
+
+def save_upload(stream, path):
+    """
+    Copia un file caricato su disco a blocchi calcolandone l'hash
+
+    Returns:
+        Hash SHA-256 del contenuto (lo stesso di mesh_store.mesh_id_for)
+    """
+    digest = hashlib.sha256()
+    with open(path, 'wb') as f:
+        while True:
+            block = stream.read(UPLOAD_CHUNK_SIZE)
+            if not block:
+                break
+            digest.update(block)
+            f.write(block)
+    return digest.hexdigest()
+
+
+def is_binary_stl_file(path):
+    """Come stl_loader.is_binary_stl, ma leggendo solo l'intestazione del file"""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        header = f.read(STL_HEADER_SIZE + 4)
+    if len(header) < STL_HEADER_SIZE + 4:
+        return False
+    count = int(np.frombuffer(header, dtype='<u4', count=1, offset=STL_HEADER_SIZE)[0])
+    return size == STL_HEADER_SIZE + 4 + count * STL_RECORD_DTYPE.itemsize
+
+
+class MappedSTL:
+    """
+    Triangoli di un file STL binario su disco, mappati in memoria
+
+    Le pagine del file lette da un blocco sono rilasciate subito dopo la
+    copia (madvise), così la memoria residente non cresce con le scansioni.
+
+    Raises:
+        STLFormatError: se il file non è un STL binario valido
+    """
+
+    def __init__(self, path):
+        if not is_binary_stl_file(path):
+            raise STLFormatError("Il file non è un STL binario: dimensione non coerente con il numero di triangoli")
+        count = (os.path.getsize(path) - STL_HEADER_SIZE - 4) // STL_RECORD_DTYPE.itemsize
+        if count == 0:
+            raise STLFormatError("Il file STL non contiene triangoli")
+        with open(path, 'rb') as f:
+            self._mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        records = np.frombuffer(self._mapping, dtype=STL_RECORD_DTYPE, count=count, offset=STL_HEADER_SIZE + 4)
+        self.triangles = records['vertices']
+
+    def __len__(self):
+        return len(self.triangles)
+
+    def chunks(self, budget):
+        """Blocchi di CHUNK_TRIANGLES triangoli copiati in memoria, uno alla volta"""
+        record_size = STL_RECORD_DTYPE.itemsize
+        for begin in range(0, len(self.triangles), CHUNK_TRIANGLES):
+            chunk = np.array(self.triangles[begin:begin + CHUNK_TRIANGLES])
+            self._release(STL_HEADER_SIZE + 4 + begin * record_size, len(chunk) * record_size)
+            budget.check()
+            yield chunk
+
+    def _release(self, offset, length):
+        if not hasattr(self._mapping, 'madvise'):
+            return
+        start = offset - offset % mmap.PAGESIZE
+        self._mapping.madvise(mmap.MADV_DONTNEED, start, offset + length - start)
+
+
+def scan_triangles(stl, budget):
+    """
+    Statistiche dei triangoli in una passata a blocchi
+
+    Args:
+        stl: MappedSTL del file
+        budget: MemoryBudget
+
+    Returns:
+        MeshScanner con ingombro, volume con segno, superficie e sezioni
+
+    Raises:
+        STLFormatError: se il file contiene coordinate non finite
+    """
+    scanner = MeshScanner()
+    for chunk in stl.chunks(budget):
+        if not np.isfinite(chunk).all():
+            raise STLFormatError("Il file STL contiene coordinate non finite")
+        scanner.add(chunk)
+    return scanner
+
+
+class OutOfCoreMesh:
+    """
+    Mesh fuori memoria, al posto dell'oggetto trimesh
+
+    La pipeline di slicing usa del mesh solo l'ingombro; i triangoli sono
+    nelle bande di BandedTriangleIndex.
+    """
+
+    def __init__(self, bounds, triangle_count):
+        self.bounds = np.asarray(bounds, dtype=np.float64)
+        self.triangle_count = triangle_count
+
+    @property
+    def extents(self):
+        return self.bounds[1] - self.bounds[0]
+
+
+class BandedTriangleIndex:
+    """
+    Indice Z dei triangoli ripartiti in bande su disco
+
+    La banda b copre le quote [edges[b], edges[b + 1]] e contiene tutti i
+    triangoli che la attraversano (quelli più alti di una banda sono ripetuti
+    in ognuna), quindi ogni piano di taglio si risolve con una sola banda.
+    Fornisce le operazioni di TriangleZIndex usate dalla pipeline; lo slicing
+    carica e indicizza una banda alla volta.
+
+    Args:
+        directory: Directory dei file delle bande
+        meta: Dizionario con 'edges', 'counts', 'bounds' e 'triangle_count'
+        budget: MemoryBudget controllato a ogni banda caricata
+    """
+
+    def __init__(self, directory, meta, budget):
+        self.directory = directory
+        self.edges = np.asarray(meta['edges'], dtype=np.float64)
+        self.counts = list(meta['counts'])
+        self.bounds = np.asarray(meta['bounds'], dtype=np.float64)
+        self.triangle_count = int(meta['triangle_count'])
+        self.z_min = float(self.bounds[0][2])
+        self.z_max = float(self.bounds[1][2])
+        self.budget = budget
+
+    @classmethod
+    def build(cls, stl, bounds, directory, budget, invert=False):
+        """
+        Ripartisce i triangoli in bande Z scritte in directory
+
+        Le bande sono scelte sull'istogramma delle quote minime in modo da
+        contenere circa budget.band_triangles() triangoli ciascuna; il file
+        dei metadati è scritto per ultimo.
+
+        Args:
+            stl: MappedSTL del file
+            bounds: Ingombro da scan_triangles
+            directory: Directory delle bande (creata se assente)
+            budget: MemoryBudget
+            invert: Se True inverte l'orientamento dei triangoli (mesh con
+                volume negativo, vedi app.calculate_model_stats)
+
+        Returns:
+            BandedTriangleIndex
+        """
+        z_min, z_max = float(bounds[0][2]), float(bounds[1][2])
+        span = max(z_max - z_min, 1e-9)
+        band_triangles = budget.band_triangles()
+
+        # Istogramma delle quote minime: tagli con circa band_triangles
+        # triangoli per banda
+        histogram = np.zeros(BAND_HISTOGRAM_BINS, dtype=np.int64)
+        for chunk in stl.chunks(budget):
+            bins = ((chunk[:, :, 2].min(axis=1) - z_min) / span * BAND_HISTOGRAM_BINS).astype(np.int64)
+            histogram += np.bincount(np.clip(bins, 0, BAND_HISTOGRAM_BINS - 1), minlength=BAND_HISTOGRAM_BINS)
+        band_count = max(1, -(-len(stl) // band_triangles))
+        targets = np.arange(1, band_count) * (len(stl) / band_count)
+        cuts = np.unique(np.searchsorted(np.cumsum(histogram), targets) + 1)
+        cuts = cuts[cuts < BAND_HISTOGRAM_BINS]
+        edges = np.concatenate([[z_min], z_min + cuts * (span / BAND_HISTOGRAM_BINS), [z_max]])
+
+        os.makedirs(directory, exist_ok=True)
+        counts = [0] * (len(edges) - 1)
+        files = [open(cls._band_path(directory, band), 'wb') for band in range(len(counts))]
+        try:
+            for chunk in stl.chunks(budget):
+                if invert:
+                    chunk = chunk[:, ::-1]
+                z = chunk[:, :, 2]
+                # Prima e ultima banda attraversata da ogni triangolo
+                first = np.searchsorted(edges[1:], z.min(axis=1), side='left')
+                last = np.searchsorted(edges[:-1], z.max(axis=1), side='right') - 1
+                first = np.clip(first, 0, len(counts) - 1)
+                last = np.clip(last, first, len(counts) - 1)
+                for band in range(int(first.min()), int(last.max()) + 1):
+                    selected = chunk[(first <= band) & (last >= band)]
+                    files[band].write(np.ascontiguousarray(selected, dtype=np.float32).tobytes())
+                    counts[band] += len(selected)
+        finally:
+            for f in files:
+                f.close()
+
+        meta = {
+            "edges": [float(e) for e in edges],
+            "counts": counts,
+            "bounds": np.asarray(bounds, dtype=np.float64).tolist(),
+            "triangle_count": len(stl),
+        }
+        tmp_path = os.path.join(directory, f"{BAND_META}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(directory, BAND_META))
+        return cls(directory, meta, budget)
+
+    @classmethod
+    def open(cls, directory, budget):
+        """
+        Riapre un indice scritto da build
+
+        Returns:
+            BandedTriangleIndex oppure None se l'indice è incompleto
+        """
+        try:
+            with open(os.path.join(directory, BAND_META)) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return cls(directory, meta, budget)
+
+    @staticmethod
+    def _band_path(directory, band):
+        return os.path.join(directory, f"band_{band:05d}.bin")
+
+    def __len__(self):
+        return self.triangle_count
+
+    def band_triangles(self, band):
+        """Triangoli di una banda, letti dal disco"""
+        return np.fromfile(self._band_path(self.directory, band), dtype=np.float32).reshape(-1, 3, 3)
+
+    def layer_planes(self, layer_height):
+        """Quote dei layer e dei piani di taglio per l'altezza indicata"""
+        return compute_layer_planes(self.z_min, self.z_max, layer_height)
+
+    def adaptive_layer_planes(self, min_height, max_height, tolerance, first_height=None):
+        """Quote dei layer adattivi, con l'istogramma delle altezze ammesse calcolato per banda"""
+        limit = None
+        for band in range(len(self.counts)):
+            band_limit = adaptive_height_limits(
+                self.band_triangles(band), self.z_min, self.z_max, min_height, max_height, tolerance
+            )
+            self.budget.check()
+            limit = band_limit if limit is None else np.minimum(limit, band_limit)
+        return stack_adaptive_layers(limit, self.z_min, min_height, max_height, first_height)
+
+    def iter_layers(self, planes, workers=1):
+        """
+        Contorni dei layer, una banda alla volta (vedi slicer.iter_layers)
+
+        I piani consecutivi della stessa banda sono affettati con un
+        TriangleZIndex della sola banda; con i piani in ordine crescente
+        ogni banda è letta una volta.
+        """
+        planes = np.asarray(planes, dtype=np.float64)
+        if not len(planes):
+            return
+        bands = np.clip(np.searchsorted(self.edges, planes, side='right') - 1, 0, len(self.counts) - 1)
+        for group in np.split(np.arange(len(planes)), np.flatnonzero(np.diff(bands)) + 1):
+            band = int(bands[group[0]])
+            if self.counts[band] == 0:
+                for _ in group:
+                    yield []
+                continue
+            index = TriangleZIndex(self.band_triangles(band))
+            self.budget.check()
+            yield from iter_layers(index, planes[group], workers)
+            del index
@@ -0,0 +1,336 @@
+"""
+Statistiche del modello e stime di materiale
+
+Ingombro, volume con segno, superficie e profilo delle sezioni orizzontali
+(area e lunghezza dei contorni su una griglia di quote) sono calcolati in
+una sola passata vettoriale sull'array dei triangoli, anche a blocchi per i
+file letti fuori memoria. I controlli topologici (chiusura del mesh,
+coerenza dell'orientamento) sono separati e si eseguono solo su richiesta.
+
+Peso e filamento sono calcolati dai volumi estrusi dei perimetri e del
+riempimento: contati sui percorsi generati oppure, prima dello slicing,
+stimati per layer dal profilo delle sezioni.
+"""
+import math
+
+import numpy as np
+
+from toolpath import MOVE_PERIMETER, is_extrusion
+
+# Passo (mm) della griglia di quote del profilo delle sezioni
+SECTION_STEP = 0.1
+
+# Coppie (piano, triangolo) elaborate insieme: circa 100 byte di
+# temporanei per coppia
+SECTION_PAIRS_PER_CHUNK = 262_144
+
+# Densità del PLA in g/cm³ e diametro del filamento in mm
+FILAMENT_DENSITY = 1.24
+FILAMENT_DIAMETER = 1.75
+
+
+class SectionProfile:
+    """
+    Area e lunghezza dei contorni delle sezioni del modello alle quote z
+
+    Args:
+        z: Array ordinato delle quote della griglia
+        area: Area della sezione a ogni quota in mm²
+        perimeter: Lunghezza dei contorni a ogni quota in mm
+    """
+
+    def __init__(self, z, area, perimeter):
+        self.z = np.asarray(z, dtype=np.float64)
+        self.area = np.asarray(area, dtype=np.float64)
+        self.perimeter = np.asarray(perimeter, dtype=np.float64)
+
+    def at(self, planes):
+        """
+        Area e lunghezza dei contorni ai piani indicati, interpolate sulla griglia
+
+        Returns:
+            Tupla (area, perimeter) di array come planes
+        """
+        planes = np.asarray(planes, dtype=np.float64)
+        if len(self.z) == 0:
+            return np.zeros(len(planes)), np.zeros(len(planes))
+        return np.interp(planes, self.z, self.area), np.interp(planes, self.z, self.perimeter)
+
+    def save(self, path):
+        """Salva il profilo in un file .npy (quote, aree, lunghezze)"""
+        np.save(path, np.stack([self.z, self.area, self.perimeter]))
+
+    @classmethod
+    def load(cls, path):
+        """Rilegge un profilo salvato con save"""
+        z, area, perimeter = np.load(path)
+        return cls(z, area, perimeter)
+
+
+class MeshScanner:
+    """
+    Statistiche dei triangoli accumulate in una passata, anche a blocchi
+
+    Il volume è la somma dei tetraedri con segno tra ogni triangolo e un
+    punto di riferimento (il primo vertice, per limitare la cancellazione
+    numerica): positivo per i mesh chiusi orientati verso l'esterno,
+    negativo per quelli invertiti. Le sezioni sono calcolate sui piani
+    k * step: ogni triangolo contribuisce, per ogni piano che attraversa, il
+    termine della formula di Gauss e la lunghezza del suo segmento, quindi
+    il risultato non dipende dalla suddivisione in blocchi.
+
+    Args:
+        step: Passo della griglia delle sezioni in mm
+    """
+
+    def __init__(self, step=SECTION_STEP):
+        self.step = step
+        self.triangle_count = 0
+        self.volume = 0.0
+        self.surface_area = 0.0
+        self.bounds = np.array([np.full(3, np.inf), np.full(3, -np.inf)])
+        self._origin = None
+        self._k0 = 0
+        self._area = np.zeros(0)
+        self._perimeter = np.zeros(0)
+
+    def add(self, triangles):
+        """
+        Aggiunge un blocco di triangoli
+
+        Args:
+            triangles: Array (N, 3, 3) dei vertici dei triangoli
+        """
+        triangles = np.asarray(triangles, dtype=np.float64)
+        if len(triangles) == 0:
+            return
+        if self._origin is None:
+            self._origin = triangles[0, 0].copy()
+        self.triangle_count += len(triangles)
+        self.bounds[0] = np.minimum(self.bounds[0], triangles.min(axis=(0, 1)))
+        self.bounds[1] = np.maximum(self.bounds[1], triangles.max(axis=(0, 1)))
+
+        v = triangles - self._origin
+        normals = np.cross(v[:, 1] - v[:, 0], v[:, 2] - v[:, 0])
+        self.surface_area += 0.5 * float(np.sqrt(np.einsum('ij,ij->i', normals, normals)).sum())
+        self.volume += float(np.einsum('ij,ij->', v[:, 0], np.cross(v[:, 1], v[:, 2]))) / 6.0
+
+        # Piani k * step con z_min <= piano < z_max (stessa regola dello slicing)
+        z = triangles[:, :, 2]
+        first = np.ceil(z.min(axis=1) / self.step).astype(np.int64)
+        last = np.ceil(z.max(axis=1) / self.step).astype(np.int64)
+        counts = np.maximum(last - first, 0)
+        crossing = counts > 0
+        if not crossing.any():
+            return
+        # Vertici ordinati per Z (a, b, c): il segmento va dal lato lungo ac
+        # al lato corto ab o bc, con pendenze dx/dz e dy/dz costanti
+        v, normals, first, counts = v[crossing], normals[crossing], first[crossing], counts[crossing]
+        v = np.take_along_axis(v, np.argsort(v[:, :, 2], axis=1)[:, :, None], axis=1)
+        a, b, c = v[:, 0], v[:, 1], v[:, 2]
+        long_slope = _slope(a, c)
+        columns = [
+            a[:, 0], a[:, 1], a[:, 2], b[:, 0], b[:, 1], b[:, 2],
+            long_slope[:, 0], long_slope[:, 1],
+        ]
+        columns += list(_slope(a, b).T) + list(_slope(b, c).T)
+        # Verso del segmento (materiale a sinistra, come nello slicing):
+        # lo stesso per tutti i piani del triangolo, dal lato lungo verso b
+        direction = b[:, :2] - (a[:, :2] + long_slope * (b[:, 2] - a[:, 2])[:, None])
+        columns.append(np.where(direction[:, 1] * normals[:, 0] - direction[:, 0] * normals[:, 1] < 0, -0.5, 0.5))
+        ends = np.cumsum(counts)
+
+        # Blocchi di triangoli con al più SECTION_PAIRS_PER_CHUNK coppie
+        begin = 0
+        while begin < len(v):
+            done = ends[begin - 1] if begin else 0
+            stop = max(int(np.searchsorted(ends, done + SECTION_PAIRS_PER_CHUNK, side='right')), begin + 1)
+            self._add_sections([column[begin:stop] for column in columns], first[begin:stop], counts[begin:stop])
+            begin = stop
+
+    def _add_sections(self, columns, first, counts):
+        total = int(counts.sum())
+        k = np.repeat(first, counts) + np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        plane = k * self.step - self._origin[2]
+        (ax, ay, az, bx, by, bz, lx, ly, abx, aby, bcx, bcy, half_sign) = (
+            np.repeat(column, counts) for column in columns
+        )
+
+        # Estremi sul lato lungo e sul lato corto attraversato
+        start_x = ax + lx * (plane - az)
+        start_y = ay + ly * (plane - az)
+        lower = plane < bz
+        end_x = np.where(lower, ax + abx * (plane - az), bx + bcx * (plane - bz))
+        end_y = np.where(lower, ay + aby * (plane - az), by + bcy * (plane - bz))
+
+        # Termine di Gauss (x_a * y_b - x_b * y_a) / 2 e lunghezza del segmento
+        area = half_sign * (start_x * end_y - end_x * start_y)
+        length = np.hypot(end_x - start_x, end_y - start_y)
+
+        lo, hi = int(k.min()), int(k.max()) + 1
+        if len(self._area) == 0:
+            self._k0 = lo
+        if lo < self._k0 or hi > self._k0 + len(self._area):
+            new_k0 = min(lo, self._k0)
+            size = max(hi, self._k0 + len(self._area)) - new_k0
+            self._area = self._grow(self._area, new_k0, size)
+            self._perimeter = self._grow(self._perimeter, new_k0, size)
+            self._k0 = new_k0
+        self._area += np.bincount(k - self._k0, weights=area, minlength=len(self._area))
+        self._perimeter += np.bincount(k - self._k0, weights=length, minlength=len(self._perimeter))
+
+    def _grow(self, values, new_k0, size):
+        grown = np.zeros(size)
+        offset = self._k0 - new_k0
+        grown[offset:offset + len(values)] = values
+        return grown
+
+    def sections(self):
+        """
+        Profilo delle sezioni
+
+        Le aree hanno il segno del volume: per un mesh invertito sono
+        riportate come per il mesh corretto.
+        """
+        z = (self._k0 + np.arange(len(self._area))) * self.step
+        sign = -1.0 if self.volume < 0 else 1.0
+        return SectionProfile(z, np.maximum(self._area * sign, 0.0), self._perimeter)
+
+
+def _slope(low, high):
+    """Pendenze (dx/dz, dy/dz) dei lati da low a high, nulle per i lati orizzontali"""
+    dz = high[:, 2] - low[:, 2]
+    return (high[:, :2] - low[:, :2]) / np.where(dz == 0, 1.0, dz)[:, None]
+
+
+def scan_mesh(triangles, step=SECTION_STEP):
+    """MeshScanner con tutti i triangoli di un mesh in memoria"""
+    scanner = MeshScanner(step)
+    scanner.add(triangles)
+    return scanner
+
+
+def mesh_topology(faces):
+    """
+    Controlli topologici del mesh dai lati delle facce
+
+    Ogni lato di un mesh chiuso e orientato in modo coerente è condiviso da
+    esattamente due facce, percorso una volta in ogni verso.
+
+    Args:
+        faces: Array (F, 3) degli indici dei vertici (vertici già uniti)
+
+    Returns:
+        Dizionario con 'watertight', 'winding_consistent', il numero di
+        lati di bordo ('boundary_edges', usati da una sola faccia) e non
+        manifold ('non_manifold_edges', più di due facce) e la
+        caratteristica di Eulero V - E + F
+    """
+    faces = np.asarray(faces, dtype=np.int64)
+    start = faces.ravel()
+    end = np.roll(faces, -1, axis=1).ravel()
+    # Chiave del lato non orientato: vertice minore * V + vertice maggiore
+    vertex_count = int(faces.max()) + 1 if len(faces) else 0
+    keys = np.minimum(start, end) * vertex_count + np.maximum(start, end)
+    unique, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+
+    # Verso di percorrenza di ogni lato: +1 dal vertice minore, -1 al contrario
+    balance = np.bincount(inverse, weights=np.where(start < end, 1, -1), minlength=len(unique))
+    manifold = counts == 2
+
+    boundary = int((counts == 1).sum())
+    non_manifold = int((counts > 2).sum())
+    used_vertices = int(np.count_nonzero(np.bincount(start, minlength=vertex_count)))
+    return {
+        "watertight": bool(boundary == 0 and non_manifold == 0),
+        "winding_consistent": bool(np.all(balance[manifold] == 0)),
+        "boundary_edges": boundary,
+        "non_manifold_edges": non_manifold,
+        "euler_number": int(used_vertices - len(unique) + len(faces)),
+    }
+
+
+def layer_extrusion(sections, planes, heights, extrusion_width, perimeters, infill_fraction):
+    """
+    Stima dei volumi estrusi per layer dal profilo delle sezioni
+
+    I perimetri coprono una fascia larga perimeters * extrusion_width lungo
+    i contorni (al più l'intera sezione), il riempimento la frazione
+    infill_fraction dell'area restante.
+
+    Args:
+        sections: SectionProfile del modello
+        planes: Quote dei piani di taglio dei layer
+        heights: Altezze dei layer
+        extrusion_width: Larghezza della linea in mm
+        perimeters: Numero di perimetri
+        infill_fraction: Frazione dell'area interna coperta dal riempimento
+
+    Returns:
+        Tupla (perimeters, infill) di array con i volumi per layer in mm³
+    """
+    area, perimeter = sections.at(planes)
+    shells = np.minimum(area, perimeter * perimeters * extrusion_width)
+    infill = (area - shells) * infill_fraction
+    heights = np.asarray(heights, dtype=np.float64)
+    return shells * heights, infill * heights
+
+
+def material_stats(perimeter_volume, infill_volume):
+    """
+    Peso e filamento dai volumi estrusi
+
+    Args:
+        perimeter_volume: Volume estruso dai perimetri in mm³
+        infill_volume: Volume estruso dal riempimento in mm³
+
+    Returns:
+        Dizionario con 'estimated_weight_g', 'estimated_filament_m' e i
+        volumi in 'extrusion'
+    """
+    volume = perimeter_volume + infill_volume
+    filament_section_area = math.pi * (FILAMENT_DIAMETER / 2) ** 2
+    return {
+        # Da mm³ a cm³ dividendo per 1000
+        "estimated_weight_g": float(volume / 1000 * FILAMENT_DENSITY),
+        "estimated_filament_m": float(volume / filament_section_area / 1000),
+        "extrusion": {
+            "perimeters_mm3": round(float(perimeter_volume), 3),
+            "infill_mm3": round(float(infill_volume), 3),
+            "total_mm3": round(float(volume), 3),
+        },
+    }
+
+
+class ExtrusionCounter:
+    """
+    Volumi estrusi dai percorsi generati, per perimetri e riempimento
+
+    Args:
+        extrusion_multiplier: Rapporto tra l'estrusione E dei movimenti e
+            il volume depositato in mm³
+    """
+
+    def __init__(self, extrusion_multiplier):
+        self.extrusion_multiplier = extrusion_multiplier
+        self.perimeter_volume = 0.0
+        self.infill_volume = 0.0
+
+    def count(self, toolpaths):
+        """
+        Conta i volumi dei percorsi mentre vengono consumati
+
+        Yields:
+            Le stesse tuple (z, toolpath) ricevute
+        """
+        for z, toolpath in toolpaths:
+            if toolpath is not None:
+                _, _, _, e, _, move_type = toolpath.columns()
+                perimeter = move_type == MOVE_PERIMETER
+                self.perimeter_volume += float(e[perimeter].sum()) / self.extrusion_multiplier
+                self.infill_volume += float(e[is_extrusion(move_type) & ~perimeter].sum()) / self.extrusion_multiplier
+            yield z, toolpath
+
+    def summary(self):
+        """Peso, filamento e volumi (vedi material_stats)"""
+        return material_stats(self.perimeter_volume, self.infill_volume)
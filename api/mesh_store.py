@@ -0,0 +1,298 @@
+"""
+Archivio dei mesh già caricati, indirizzato per contenuto
+
+I vertici (float32) e le facce (int32) di ogni mesh sono salvati come file
+.npy e riletti con memory-map, insieme al profilo delle sezioni (vedi
+mesh_stats); sopra il disco c'è una LRU in memoria con il mesh pronto, le
+statistiche e l'indice Z dei triangoli. /api/preview e
+/api/slice condividono così il parsing, e il client può riferirsi a un mesh
+già inviato tramite il suo ID invece di ricaricarlo.
+
+I mesh caricati con il percorso a memoria limitata (vedi large_stl) non
+hanno vertici e facce: al loro posto c'è la directory delle bande Z.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import trimesh
+
+from large_stl import BandedTriangleIndex, MemoryBudget, OutOfCoreMesh
+from mesh_stats import SectionProfile, scan_mesh
+from slicer import TriangleZIndex
+
+MESH_PREFIX = 'mesh_'
+
+_MESH_ID_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def mesh_id_for(stl_data):
+    """ID del mesh: hash SHA-256 dei byte del file STL"""
+    return hashlib.sha256(stl_data).hexdigest()
+
+
+class MeshEntry:
+    """Mesh caricato con le relative statistiche, il profilo delle sezioni e l'indice Z"""
+
+    def __init__(self, mesh_id, mesh, stats, index=None, sections=None):
+        self.mesh_id = mesh_id
+        self.mesh = mesh
+        self.stats = stats
+        self._index = index
+        self._sections = sections
+        # Ultimo aggiornamento della data di modifica dei file (vedi MeshStore.get)
+        self.touched = time.time()
+
+    @property
+    def index(self):
+        """TriangleZIndex del mesh, costruito al primo utilizzo"""
+        if self._index is None:
+            self._index = TriangleZIndex.from_mesh(self.mesh)
+        return self._index
+
+    @property
+    def sections(self):
+        """SectionProfile del mesh, calcolato al primo utilizzo se non salvato"""
+        if self._sections is None:
+            self._sections = scan_mesh(self.mesh.triangles).sections()
+        return self._sections
+
+
+class MeshStore:
+    """
+    Archivio dei mesh su disco con LRU in memoria
+
+    Args:
+        directory: Directory dei file .npy e .json
+        max_items: Numero massimo di mesh tenuti in memoria
+        max_age: Secondi dopo l'ultimo accesso oltre i quali un mesh viene
+            rimosso dal disco
+        memory_budget: Byte di memoria residente ammessi durante lo slicing
+            dei mesh fuori memoria (vedi large_stl.MemoryBudget)
+    """
+
+    def __init__(self, directory, max_items, max_age, memory_budget=None):
+        self.directory = directory
+        self.max_items = max_items
+        self.max_age = max_age
+        self.memory_budget = memory_budget
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_valid_id(mesh_id):
+        return bool(_MESH_ID_RE.match(mesh_id or ''))
+
+    def _paths(self, mesh_id):
+        base = os.path.join(self.directory, f"{MESH_PREFIX}{mesh_id}")
+        return f"{base}_vertices.npy", f"{base}_faces.npy", f"{base}_stats.json", f"{base}_sections.npy"
+
+    def banded_directory(self, mesh_id):
+        """Directory delle bande Z di un mesh fuori memoria"""
+        return os.path.join(self.directory, f"{MESH_PREFIX}{mesh_id}_bands")
+
+    def get(self, mesh_id):
+        """
+        Restituisce il mesh con l'ID indicato, dalla memoria o dal disco
+
+        Anche quando il mesh è in memoria la data di modifica dei file viene
+        aggiornata, al più una volta ogni max_age / 10 secondi, così evict
+        non rimuove i mesh usati di continuo.
+
+        Returns:
+            MeshEntry oppure None se il mesh non è presente
+        """
+        if not self.is_valid_id(mesh_id):
+            return None
+
+        with self._lock:
+            entry = self._entries.get(mesh_id)
+            if entry is not None:
+                self._entries.move_to_end(mesh_id)
+                self.hits += 1
+        if entry is not None:
+            self._touch(entry)
+            return entry
+
+        entry = self._load(mesh_id)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self._remember(entry)
+        return entry
+
+    def put(self, mesh_id, mesh, stats, sections=None):
+        """
+        Registra un mesh appena caricato, le sue statistiche e il profilo
+        delle sezioni (opzionale, calcolato al primo utilizzo se assente)
+
+        Returns:
+            MeshEntry registrato
+        """
+        vertices_path, faces_path, stats_path, sections_path = self._paths(mesh_id)
+        if not os.path.exists(stats_path):
+            # Il file delle statistiche è scritto per ultimo: segna la voce completa
+            self._save_array(vertices_path, np.asarray(mesh.vertices, dtype=np.float32))
+            self._save_array(faces_path, np.asarray(mesh.faces, dtype=np.int32))
+            if sections is not None:
+                self._save_sections(sections_path, sections)
+            self._save_stats(stats_path, stats)
+
+        entry = MeshEntry(mesh_id, mesh, stats, sections=sections)
+        self._remember(entry)
+        return entry
+
+    def put_banded(self, mesh_id, index, stats, sections):
+        """
+        Registra un mesh fuori memoria, con le bande già scritte in
+        banded_directory, le sue statistiche e il profilo delle sezioni
+
+        Returns:
+            MeshEntry registrato
+        """
+        _, _, stats_path, sections_path = self._paths(mesh_id)
+        self._save_sections(sections_path, sections)
+        self._save_stats(stats_path, stats)
+
+        entry = MeshEntry(mesh_id, OutOfCoreMesh(index.bounds, len(index)), stats, index=index, sections=sections)
+        self._remember(entry)
+        return entry
+
+    @staticmethod
+    def _save_array(path, array):
+        tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+        np.save(tmp_path, array)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _save_sections(path, sections):
+        tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+        sections.save(tmp_path)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _save_stats(path, stats):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(stats, f)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _load_sections(path):
+        try:
+            return SectionProfile.load(path)
+        except (OSError, ValueError):
+            return None
+
+    def _load(self, mesh_id):
+        vertices_path, faces_path, stats_path, sections_path = self._paths(mesh_id)
+        try:
+            with open(stats_path) as f:
+                stats = json.load(f)
+            if 'out_of_core' in stats:
+                return self._load_banded(mesh_id, stats)
+            vertices = np.load(vertices_path, mmap_mode='r')
+            faces = np.load(faces_path, mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        # Voci salvate senza profilo: ricalcolato dal mesh al primo utilizzo
+        sections = self._load_sections(sections_path)
+
+        for path in self._paths(mesh_id):
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+
+        mesh = trimesh.Trimesh(vertices=vertices, faces=faces, process=False)
+        return MeshEntry(mesh_id, mesh, stats, sections=sections)
+
+    def _load_banded(self, mesh_id, stats):
+        _, _, stats_path, sections_path = self._paths(mesh_id)
+        index = BandedTriangleIndex.open(self.banded_directory(mesh_id), MemoryBudget(self.memory_budget))
+        # Senza triangoli in memoria il profilo non si può ricalcolare
+        sections = self._load_sections(sections_path)
+        if index is None or sections is None:
+            return None
+        for path in (stats_path, sections_path):
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        return MeshEntry(mesh_id, OutOfCoreMesh(index.bounds, len(index)), stats, index=index, sections=sections)
+
+    def _touch(self, entry):
+        now = time.time()
+        if now - entry.touched < self.max_age / 10:
+            return
+        entry.touched = now
+        for path in self._paths(entry.mesh_id):
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+
+    def _remember(self, entry):
+        with self._lock:
+            self._entries[entry.mesh_id] = entry
+            self._entries.move_to_end(entry.mesh_id)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+
+    def evict(self):
+        """
+        Rimuove dal disco i mesh non usati da più di max_age secondi
+
+        Eseguita dallo Sweeper, mai durante una richiesta.
+        """
+        now = time.time()
+        for item in os.scandir(self.directory):
+            if not item.name.startswith(MESH_PREFIX):
+                continue
+            if item.name.endswith('_bands'):
+                # Bande di un caricamento interrotto, senza statistiche
+                mesh_id = item.name[len(MESH_PREFIX):-len('_bands')]
+                try:
+                    orphan = (not os.path.exists(self._paths(mesh_id)[2])
+                              and now - item.stat().st_mtime > self.max_age)
+                except OSError:
+                    continue
+                if orphan:
+                    shutil.rmtree(item.path, ignore_errors=True)
+                continue
+            if not item.name.endswith('_stats.json'):
+                continue
+            try:
+                expired = now - item.stat().st_mtime > self.max_age
+            except OSError:
+                continue
+            if not expired:
+                continue
+            mesh_id = item.name[len(MESH_PREFIX):-len('_stats.json')]
+            with self._lock:
+                self._entries.pop(mesh_id, None)
+            for path in self._paths(mesh_id):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            shutil.rmtree(self.banded_directory(mesh_id), ignore_errors=True)
+
+    def stats(self):
+        """Contatori dell'archivio per questo processo"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "in_memory": len(self._entries),
+            }
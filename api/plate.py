@@ -0,0 +1,142 @@
+"""
+Disposizione di più modelli sul piatto di stampa
+
+I pezzi di un piatto (più modelli, ognuno in una o più copie) sono disposti
+per ingombro in pianta con un impacchettamento a ripiani (first-fit
+decreasing height): i rettangoli di ingombro, con il lato lungo lungo X,
+sono ordinati per profondità decrescente e collocati nel primo ripiano con
+spazio libero, aprendo un nuovo ripiano sopra l'ultimo quando serve. I
+pezzi collocati formano un unico mesh, affettato come un modello singolo:
+ogni layer contiene i contorni di tutti i pezzi.
+"""
+import hashlib
+import json
+
+import numpy as np
+import trimesh
+
+
+class PlateFullError(ValueError):
+    """I pezzi non entrano nell'area utile del piatto"""
+
+
+def plate_id(parts, width, depth, spacing, margin):
+    """
+    ID del mesh di un piatto: hash dei modelli, delle copie e del piatto
+
+    Args:
+        parts: Lista di tuple (mesh_id, copie)
+
+    Returns:
+        Stringa esadecimale SHA-256, nello stesso formato degli ID dei mesh
+    """
+    payload = json.dumps({
+        "parts": [[mesh_id, int(copies)] for mesh_id, copies in parts],
+        "plate": [float(width), float(depth), float(spacing), float(margin)],
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def pack_rectangles(sizes, width, depth, spacing):
+    """
+    Dispone rettangoli su un'area con l'impacchettamento a ripiani
+
+    Args:
+        sizes: Lista di tuple (larghezza, profondità) dei rettangoli
+        width: Larghezza dell'area in mm
+        depth: Profondità dell'area in mm
+        spacing: Distanza minima tra due rettangoli in mm
+
+    Returns:
+        Lista di tuple (x, y, ruotato) nell'ordine dei rettangoli: angolo
+        minimo nell'area e True se il rettangolo è ruotato di 90°
+
+    Raises:
+        PlateFullError: se i rettangoli non entrano nell'area
+    """
+    # Lato lungo lungo X: ripiani più bassi e meno spazio perso
+    oriented = []
+    for w, d in sizes:
+        rotated = d > w and d <= width
+        oriented.append((d, w, rotated) if rotated else (w, d, False))
+
+    order = sorted(range(len(sizes)), key=lambda i: (-oriented[i][1], -oriented[i][0]))
+    placements = [None] * len(sizes)
+    shelves = []  # [y, profondità, x libera]
+    top = 0.0
+    for i in order:
+        w, d, rotated = oriented[i]
+        if w > width or d > depth:
+            raise PlateFullError(f"Pezzo di {w:.1f} x {d:.1f} mm più grande del piatto")
+        for shelf in shelves:
+            if shelf[2] + w <= width and d <= shelf[1]:
+                break
+        else:
+            y = top + spacing if shelves else 0.0
+            if y + d > depth:
+                raise PlateFullError("I pezzi non entrano nel piatto")
+            shelf = [y, d, 0.0]
+            shelves.append(shelf)
+            top = y + d
+        placements[i] = (shelf[2], shelf[0], rotated)
+        shelf[2] += w + spacing
+    return placements
+
+
+def arrange_plate(meshes, copies, width, depth, spacing, margin):
+    """
+    Dispone le copie dei modelli sul piatto e le unisce in un solo mesh
+
+    Ogni copia poggia sul piatto (Z minima 0) e ha l'ingombro in pianta
+    dentro l'area utile [margin, width - margin] x [margin, depth - margin].
+
+    Args:
+        meshes: Lista di oggetti trimesh
+        copies: Numero di copie di ogni modello
+        width: Larghezza del piatto in mm
+        depth: Profondità del piatto in mm
+        spacing: Distanza minima tra due pezzi in mm
+        margin: Distanza dei pezzi dal bordo del piatto in mm
+
+    Returns:
+        Tupla (mesh, layout): il mesh del piatto e, per ogni pezzo, un
+        dizionario con modello, copia, posizione e ingombro sul piatto
+
+    Raises:
+        PlateFullError: se i pezzi non entrano nel piatto
+    """
+    pieces = [(part, copy) for part, count in enumerate(copies) for copy in range(int(count))]
+    extents = [meshes[part].bounds[1] - meshes[part].bounds[0] for part, _ in pieces]
+    placements = pack_rectangles(
+        [(float(e[0]), float(e[1])) for e in extents],
+        width - 2 * margin, depth - 2 * margin, spacing,
+    )
+
+    vertices = []
+    faces = []
+    layout = []
+    vertex_count = 0
+    for (part, copy), extent, (x, y, rotated) in zip(pieces, extents, placements):
+        mesh = meshes[part]
+        placed = np.array(mesh.vertices, dtype=np.float64) - mesh.bounds[0]
+        if rotated:
+            # Rotazione di 90° attorno a Z, riportata nel primo quadrante
+            placed[:, 0], placed[:, 1] = extent[1] - placed[:, 1], placed[:, 0].copy()
+        placed[:, 0] += margin + x
+        placed[:, 1] += margin + y
+        vertices.append(placed)
+        faces.append(np.asarray(mesh.faces, dtype=np.int64) + vertex_count)
+        vertex_count += len(placed)
+        size_x, size_y = (extent[1], extent[0]) if rotated else (extent[0], extent[1])
+        layout.append({
+            "part": part,
+            "copy": copy,
+            "x": round(float(margin + x), 3),
+            "y": round(float(margin + y), 3),
+            "width": round(float(size_x), 3),
+            "depth": round(float(size_y), 3),
+            "rotated": rotated,
+        })
+
+    plate = trimesh.Trimesh(vertices=np.concatenate(vertices), faces=np.concatenate(faces), process=False)
+    return plate, layout
@@ -0,0 +1,642 @@
+"""
+Offset vettoriale dei contorni dei layer per Pimp My Printer
+
+L'offset di un insieme di contorni chiusi (verso l'interno per distanze
+positive) è calcolato in tre passi, tutti su array NumPy:
+
+1. offset grezzo: ogni lato è spostato alla sua sinistra, cioè verso
+   l'interno per i contorni esterni antiorari e per i fori orari, e i
+   vertici sono uniti con uno spigolo vivo (miter) oppure, oltre
+   MITER_LIMIT, tagliati alla distanza dell'offset (square);
+2. pulizia: le intersezioni tra i lati grezzi, cercate solo tra i lati che
+   condividono una cella di un indice a griglia, dividono i lati in pezzi.
+   Mentre la distanza cresce da 0 a d ogni lato grezzo spazza una zona (il
+   quadrilatero tra il lato d'origine e la sua posizione finale); restano i
+   pezzi che nessuna zona ha raggiunto e che stanno dalla parte giusta dei
+   contorni d'origine. I pezzi rovesciati rispetto al lato d'origine stanno
+   nella propria zona, quelli che hanno superato un'altra parte del contorno
+   nella zona di quella: le anse invertite spariscono anche dove il numero
+   di avvolgimento dell'offset grezzo le farebbe sembrare bordo, e le parti
+   che si separano diventano isole distinte;
+3. i pezzi rimasti sono ricuciti in contorni chiusi con stitch_segments.
+
+Zone e numeri di avvolgimento sono valutati per molti punti insieme, con un
+indice a griglia delle zone e uno a fasce orizzontali dei lati.
+"""
+import numpy as np
+
+from slicer import stitch_segments
+
+# Oltre questo multiplo della distanza lo spigolo vivo è tagliato. Verso
+# l'interno riguarda gli angoli concavi, dove lo spigolo vivo allontana il
+# perimetro dalla parete: restano vivi gli angoli fino a circa 96°
+MITER_LIMIT = 1.5
+
+# Contorni di area inferiore (mm²) sono residui numerici e vengono scartati
+MIN_LOOP_AREA = 1e-4
+
+# Lunghezza minima (mm) dei lati e dei pezzi considerati
+_MIN_EDGE = 1e-9
+
+# Distanza (mm) entro cui un'intersezione coincide con un vertice
+_SNAP = 1e-7
+
+# Distanza (mm) dal punto medio di un pezzo, verso l'area che il pezzo
+# delimita, del punto su cui è verificato: fuori dal bordo delle zone
+_PROBE = 1e-6
+
+# Lati medi per cella/fascia degli indici spaziali
+_EDGES_PER_BUCKET = 4
+
+# Coppie (punto, lato) o (punto, zona) esaminate insieme: limita la memoria
+# dei temporanei sui layer molto complessi
+_MAX_WINDING_PAIRS = 500_000
+
+
+def offset_polygons(polygons, distances):
+    """
+    Offset di un insieme di contorni chiusi a una o più distanze
+
+    Le distanze sono elaborate insieme: la copia per ogni distanza è
+    traslata in Y in una fascia propria, così gli indici spaziali non
+    mescolano le copie e il costo fisso delle operazioni NumPy si paga una
+    volta sola per layer.
+
+    Args:
+        polygons: Array (N, 2) dei punti di ogni contorno, con l'ultimo
+            punto uguale al primo; l'orientamento non conta
+        distances: Distanze in mm, positive verso l'interno
+
+    Returns:
+        Per ogni distanza la lista dei contorni chiusi (ultimo punto uguale
+        al primo), antiorari quelli esterni e orari i fori
+    """
+    loops = orient_polygons(polygons)
+    if not loops or len(distances) == 0:
+        return [[] for _ in distances]
+
+    points = np.concatenate(loops)
+    reach = max(abs(d) for d in distances) * MITER_LIMIT
+    bottom = float(points[:, 1].min()) - reach - 1.0
+    band = float(points[:, 1].max()) + reach + 1.0 - bottom
+    parts = []
+    units = {}
+    for index, distance in enumerate(distances):
+        sign = 1.0 if distance >= 0 else -1.0
+        if sign not in units:
+            units[sign] = _raw_offset(loops, sign)
+        base, direction, successor = units[sign]
+        origins = base + np.array([0.0, index * band])
+        parts.append((origins, origins + abs(distance) * direction, successor))
+    first = np.cumsum([0] + [len(part[0]) for part in parts[:-1]])
+    origins = np.concatenate([part[0] for part in parts])
+    starts = np.concatenate([part[1] for part in parts])
+    successor = np.concatenate([part[2] + offset for part, offset in zip(parts, first)])
+    ends = starts[successor]
+    # Zona spazzata da ogni lato grezzo: origini dei suoi estremi e
+    # posizione finale, percorse in ordine
+    zones = np.stack([origins, origins[successor], ends, starts], axis=1)
+    starts, ends = _split_at_intersections(starts, ends, successor)
+
+    # Pezzi sovrapposti (da lati grezzi collineari) riuniti in uno solo con
+    # molteplicità pari al saldo dei versi
+    forward = (starts[:, 0] < ends[:, 0]) | ((starts[:, 0] == ends[:, 0]) & (starts[:, 1] < ends[:, 1]))
+    pieces, group = np.unique(
+        np.where(forward[:, None], np.column_stack([starts, ends]), np.column_stack([ends, starts])),
+        axis=0, return_inverse=True,
+    )
+    weight = np.bincount(group.reshape(-1), weights=np.where(forward, 1, -1), minlength=len(pieces))
+    pieces, weight = pieces[weight != 0], weight[weight != 0]
+    starts = np.where((weight > 0)[:, None], pieces[:, :2], pieces[:, 2:])
+    ends = np.where((weight > 0)[:, None], pieces[:, 2:], pieces[:, :2])
+
+    # Pezzi validi, percorsi nel verso dei lati grezzi (area a sinistra): un
+    # punto appena a sinistra (a destra per l'offset verso l'esterno) non
+    # sta in nessuna zona e sta dentro (fuori) i contorni d'origine. La
+    # validità cambia solo dove un pezzo incontra un altro lato grezzo:
+    # basta verificare un pezzo per catena
+    chain = _chain_labels(starts, ends)
+    heads = np.flatnonzero(chain == np.arange(len(chain)))
+    a, b = starts[heads], ends[heads]
+    middle = (a + b) / 2
+    index = np.floor((middle[:, 1] - bottom) / band).astype(np.int64)
+    side = np.where(np.asarray(distances, dtype=np.float64)[index] >= 0, 1.0, -1.0)
+    tangent = (b - a) / np.hypot(*(b - a).T)[:, None]
+    probe = middle + (side * _PROBE)[:, None] * np.column_stack([-tangent[:, 1], tangent[:, 0]])
+    source = np.column_stack([np.zeros(len(probe)), index * band])
+    winding, _ = _winding(
+        probe - source, points, np.concatenate([np.roll(loop, -1, axis=0) for loop in loops]),
+        np.ones(len(points), dtype=np.int64),
+    )
+    valid = np.zeros(len(chain), dtype=bool)
+    valid[heads] = ((winding > 0) == (side > 0)) & ~_inside_zones(probe, zones)
+    valid = valid[chain]
+    starts, ends = starts[valid], ends[valid]
+
+    # Ricucitura separata per ogni distanza (la fascia dà l'indice)
+    index = np.floor((starts[:, 1] - bottom) / band).astype(np.int64)
+    layers = stitch_segments(index, starts, ends, len(distances))
+    results = []
+    for index, contours in enumerate(layers):
+        shift = np.array([0.0, index * band])
+        results.append([
+            contour['points'] - shift for contour in contours
+            if contour['closed'] and abs(_signed_area(contour['points'])) > MIN_LOOP_AREA
+        ])
+    return results
+
+
+def perimeter_shells(polygons, count, width):
+    """
+    Linee medie dei perimetri di un layer e area interna per il riempimento
+
+    Il perimetro k (0 il più esterno) è l'offset dei contorni di
+    (k + 0.5) * width, così il bordo esterno del primo coincide con il
+    contorno del modello. L'area interna è l'offset di count * width (il
+    bordo interno dell'ultimo perimetro), o di mezza larghezza senza
+    perimetri: le estremità arrotondate delle linee di riempimento si
+    saldano così ai perimetri.
+
+    Args:
+        polygons: Contorni chiusi del layer
+        count: Numero di perimetri
+        width: Larghezza della linea estrusa in mm
+
+    Returns:
+        Tupla (shells, inner): lista dei perimetri non vuoti, ognuno una
+        lista di contorni chiusi, e contorni dell'area interna
+    """
+    distances = [(shell + 0.5) * width for shell in range(count)]
+    *shells, inner = offset_polygons(polygons, distances + [max(count, 0.5) * width])
+    return [loops for loops in shells if loops], inner
+
+
+def orient_polygons(polygons):
+    """
+    Contorni orientati con l'interno a sinistra (regola pari-dispari)
+
+    Per ogni contorno si valuta il lato più lungo: se appena alla sua
+    sinistra si è fuori dall'area (numero pari di attraversamenti) il
+    contorno è invertito. Corregge i mesh con normali incoerenti.
+
+    Returns:
+        Lista di array (M, 2) senza il punto di chiusura ripetuto
+    """
+    loops = []
+    for polygon in polygons:
+        points = np.asarray(polygon, dtype=np.float64)
+        # Punti consecutivi coincidenti (e punto di chiusura) rimossi
+        step = np.hypot(*(np.roll(points, -1, axis=0) - points).T)
+        points = points[step > _MIN_EDGE]
+        if len(points) >= 3:
+            loops.append(points)
+    if not loops:
+        return []
+
+    starts = np.concatenate(loops)
+    ends = np.concatenate([np.roll(loop, -1, axis=0) for loop in loops])
+    first = np.cumsum([0] + [len(loop) for loop in loops[:-1]])
+    longest = np.array([
+        offset + int(np.argmax(np.hypot(*(np.roll(loop, -1, axis=0) - loop).T)))
+        for offset, loop in zip(first, loops)
+    ])
+    _, _, crossings = _side_windings(starts, ends, np.ones(len(starts), dtype=np.int64), longest)
+    return [loop if inside else loop[::-1] for loop, inside in zip(loops, crossings % 2 == 1)]
+
+
+def _signed_area(points):
+    return 0.5 * float(np.sum(points[:-1, 0] * points[1:, 1] - points[1:, 0] * points[:-1, 1]))
+
+
+def _raw_offset(loops, sign):
+    """
+    Offset grezzo di tutti i contorni per distanza unitaria
+
+    Con il verso fissato i punti dell'offset grezzo sono lineari nella
+    distanza: per la distanza d valgono base + |d| * direction.
+
+    Args:
+        sign: +1 verso l'interno, -1 verso l'esterno
+
+    Returns:
+        Tupla (base, direction, successor): vertice d'origine e spostamento
+        unitario di ogni punto (P, 2) e indice del punto successivo nello
+        stesso contorno
+    """
+    sizes = np.array([len(loop) for loop in loops])
+    points = np.concatenate(loops)
+    first = np.repeat(np.cumsum(sizes) - sizes, sizes)
+    local = np.arange(len(points)) - first
+    following = first + (local + 1) % np.repeat(sizes, sizes)
+    previous = first + (local - 1) % np.repeat(sizes, sizes)
+
+    # Direzione e normale sinistra unitarie di ogni lato (dal vertice al
+    # successivo); per ogni vertice il lato entrante e quello uscente
+    edge = points[following] - points
+    tangent = edge / np.hypot(edge[:, 0], edge[:, 1])[:, None]
+    normal = np.column_stack([-tangent[:, 1], tangent[:, 0]])
+    t_in, t_out = tangent[previous], tangent
+    o_in, o_out = sign * normal[previous], sign * normal
+
+    # Spigolo vivo v + (o_in + o_out) / (1 + cos), lungo sqrt(2 / (1 + cos)).
+    # Oltre MITER_LIMIT: se i lati spostati si incrociano bastano i loro
+    # estremi (l'ansa è rimossa dalla pulizia e resta lo spigolo esatto),
+    # altrimenti lo spigolo è tagliato a distanza 1 dal vertice lungo la
+    # bisettrice
+    denominator = 1 + np.sum(normal[previous] * normal, axis=1)
+    miter = denominator >= 2 / MITER_LIMIT ** 2
+    crossing = (t_in[:, 0] * t_out[:, 1] - t_in[:, 1] * t_out[:, 0]) * sign > 0
+    square = ~miter & ~crossing
+
+    counts = np.where(miter, 1, 2)
+    out_first = np.cumsum(counts) - counts
+    base = np.repeat(points, counts, axis=0)
+    direction = np.empty_like(base)
+    safe = np.where(miter, denominator, 1.0)
+    direction[out_first] = np.where(miter[:, None], (o_in + o_out) / safe[:, None], o_in)
+    direction[out_first[~miter] + 1] = o_out[~miter]
+
+    # Taglio: bisettrice b (lungo il lato entrante se i lati sono opposti)
+    bisector = o_in[square] + o_out[square]
+    size = np.hypot(bisector[:, 0], bisector[:, 1])
+    opposite = size < 1e-9
+    bisector = np.where(
+        opposite[:, None], t_in[square], bisector / np.where(opposite, 1.0, size)[:, None]
+    )
+    along_in = (1 - np.sum(o_in[square] * bisector, axis=1)) / np.sum(t_in[square] * bisector, axis=1)
+    along_out = (1 - np.sum(o_out[square] * bisector, axis=1)) / np.sum(t_out[square] * bisector, axis=1)
+    direction[out_first[square]] += along_in[:, None] * t_in[square]
+    direction[out_first[square] + 1] += along_out[:, None] * t_out[square]
+
+    # Lati grezzi: ogni punto al successivo dello stesso contorno
+    out_sizes = np.add.reduceat(counts, np.cumsum(sizes) - sizes)
+    out_start = np.repeat(np.cumsum(out_sizes) - out_sizes, out_sizes)
+    out_local = np.arange(len(base)) - out_start
+    successor = out_start + (out_local + 1) % np.repeat(out_sizes, out_sizes)
+    return base, direction, successor
+
+
+def _split_at_intersections(starts, ends, successor):
+    """
+    Divide i lati nei punti in cui si intersecano
+
+    Il punto di intersezione è calcolato una volta per coppia e usato per
+    entrambi i lati, così i pezzi si ricuciono esattamente.
+
+    Returns:
+        Tupla (starts, ends) dei pezzi
+    """
+    count = len(starts)
+    first, second = _candidate_pairs(starts, ends)
+    # I lati consecutivi condividono il vertice: non sono intersezioni
+    adjacent = (successor[first] == second) | (successor[second] == first)
+    first, second = first[~adjacent], second[~adjacent]
+
+    p, r = starts[first], ends[first] - starts[first]
+    q, s = starts[second], ends[second] - starts[second]
+    r_length = np.hypot(r[:, 0], r[:, 1])
+    s_length = np.hypot(s[:, 0], s[:, 1])
+    denominator = r[:, 0] * s[:, 1] - r[:, 1] * s[:, 0]
+    parallel = np.abs(denominator) < 1e-12 * r_length * s_length
+    denominator = np.where(parallel, 1.0, denominator)
+    qp = q - p
+    t = (qp[:, 0] * s[:, 1] - qp[:, 1] * s[:, 0]) / denominator
+    u = (qp[:, 0] * r[:, 1] - qp[:, 1] * r[:, 0]) / denominator
+    t_margin = _SNAP / r_length
+    u_margin = _SNAP / s_length
+    hit = (
+        ~parallel & (t >= -t_margin) & (t <= 1 + t_margin)
+        & (u >= -u_margin) & (u <= 1 + u_margin)
+    )
+    t, u = np.clip(t, 0, 1), np.clip(u, 0, 1)
+    crossing = p[hit] + t[hit, None] * r[hit]
+
+    # Intersezioni su un estremo: si usa il vertice esatto, così le anse
+    # degeneri si annullano e i pezzi si ricuciono sul vertice
+    for param, length, edge in ((t, r_length, first), (u, s_length, second)):
+        for end, vertex in ((0.0, starts), (1.0, ends)):
+            snap = np.abs(param[hit] - end) * length[hit] < _SNAP
+            crossing[snap] = vertex[edge[hit][snap]]
+
+    # Lati collineari sovrapposti: ognuno è diviso negli estremi dell'altro
+    # che cadono al suo interno
+    collinear = parallel & (np.abs(qp[:, 0] * r[:, 1] - qp[:, 1] * r[:, 0]) < 1e-9 * r_length)
+    split_edge = [first[hit], second[hit]]
+    split_param = [t[hit], u[hit]]
+    split_point = [crossing, crossing]
+    for edge_index, origin, vector, squared, others in (
+        (first, p, r, r_length ** 2, (starts[second], ends[second])),
+        (second, q, s, s_length ** 2, (starts[first], ends[first])),
+    ):
+        for other in others:
+            param = np.sum((other - origin) * vector, axis=1) / squared
+            inside = collinear & (param > 0) & (param < 1)
+            split_edge.append(edge_index[inside])
+            split_param.append(param[inside])
+            split_point.append(other[inside])
+
+    # Punti di ogni lato ordinati per parametro: estremi e divisioni
+    edge = np.concatenate([np.arange(count), np.arange(count)] + split_edge)
+    param = np.concatenate([np.zeros(count), np.ones(count)] + split_param)
+    point = np.concatenate([starts, ends] + split_point)
+    order = np.lexsort((param, edge))
+    edge, point = edge[order], point[order]
+
+    same = edge[1:] == edge[:-1]
+    piece_starts, piece_ends = point[:-1][same], point[1:][same]
+    length = np.hypot(*(piece_ends - piece_starts).T)
+    keep = length > _MIN_EDGE
+    return piece_starts[keep], piece_ends[keep]
+
+
+def _candidate_pairs(starts, ends):
+    """
+    Coppie di lati che condividono una cella della griglia
+
+    La cella è lunga quanto _EDGES_PER_BUCKET lati medi. I lati più lunghi
+    di una cella sono divisi in tratti lunghi al più una cella, ognuno
+    registrato nelle (al più quattro) celle del suo riquadro: il costo resta
+    lineare nella lunghezza anche per i lati lunghi e obliqui.
+
+    Returns:
+        Tupla (first, second) di indici, con first < second
+    """
+    vector = ends - starts
+    length = np.hypot(vector[:, 0], vector[:, 1])
+    cell = max(float(np.mean(length)) * _EDGES_PER_BUCKET, _MIN_EDGE)
+    pieces = np.maximum(np.ceil(length / cell).astype(np.int64), 1)
+    parent = np.repeat(np.arange(len(starts)), pieces)
+    step = np.arange(int(pieces.sum())) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+    a = starts[parent] + (step / pieces[parent])[:, None] * vector[parent]
+    b = starts[parent] + ((step + 1) / pieces[parent])[:, None] * vector[parent]
+
+    origin = np.minimum(starts, ends).min(axis=0)
+    cell_low = np.floor((np.minimum(a, b) - origin) / cell).astype(np.int64)
+    cell_high = np.floor((np.maximum(a, b) - origin) / cell).astype(np.int64)
+    span = cell_high - cell_low + 1
+    counts = span[:, 0] * span[:, 1]
+
+    piece = np.repeat(np.arange(len(parent)), counts)
+    local = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+    cell_x = cell_low[piece, 0] + local % span[piece, 0]
+    cell_y = cell_low[piece, 1] + local // span[piece, 0]
+    key = cell_x * (int(cell_high[:, 1].max()) + 1) + cell_y
+    edge = parent[piece]
+
+    order = np.argsort(key, kind='stable')
+    key, edge = key[order], edge[order]
+    group_end = np.searchsorted(key, key, side='right')
+
+    # Ogni elemento si accoppia con i successivi della stessa cella
+    partners = group_end - np.arange(len(key)) - 1
+    left = np.repeat(np.arange(len(key)), partners)
+    right = left + 1 + np.arange(int(partners.sum())) - np.repeat(np.cumsum(partners) - partners, partners)
+    first = np.minimum(edge[left], edge[right])
+    second = np.maximum(edge[left], edge[right])
+    # Scarta subito le coppie i cui riquadri non si toccano: l'ordinamento
+    # che elimina i doppioni lavora così su molte meno coppie
+    low = np.minimum(starts, ends) - _SNAP
+    high = np.maximum(starts, ends) + _SNAP
+    near = (first != second) & np.all(
+        (low[first] <= high[second]) & (low[second] <= high[first]), axis=1
+    )
+    first, second = first[near], second[near]
+
+    # Le coppie che condividono più celle (o tratti dello stesso lato nella
+    # stessa cella) compaiono più volte
+    unique = np.unique(first * len(starts) + second)
+    return unique // len(starts), unique % len(starts)
+
+
+def _chain_labels(starts, ends):
+    """
+    Catene di pezzi consecutivi senza diramazioni
+
+    Due pezzi sono nella stessa catena se uno finisce dove l'altro inizia e
+    in quel punto non arrivano né partono altri pezzi. Il minimo indice di
+    ogni catena si propaga con salti raddoppiati in avanti e poi indietro,
+    così anche le catene chiuse si etichettano in log2(N) passi.
+
+    Returns:
+        Array (N,) con il minimo indice dei pezzi della catena di ogni pezzo
+    """
+    count = len(starts)
+    pieces = np.arange(count)
+    if count == 0:
+        return pieces
+    # Punti uguali (coordinate identiche) come numeri complessi: un solo
+    # ordinamento su un array piatto
+    points = np.concatenate([starts, ends])
+    _, node = np.unique(points[:, 0] + 1j * points[:, 1], return_inverse=True)
+    start_node, end_node = node[:count], node[count:]
+    nodes = int(node.max()) + 1
+    simple = (np.bincount(start_node, minlength=nodes) == 1) & (np.bincount(end_node, minlength=nodes) == 1)
+    leaving = np.zeros(nodes, dtype=np.int64)
+    leaving[start_node] = pieces
+    following = np.where(simple[end_node], leaving[end_node], pieces)
+    preceding = pieces.copy()
+    preceding[following] = pieces
+
+    label = pieces
+    for jump in (following, preceding):
+        for _ in range(max(count - 1, 1).bit_length()):
+            label = np.minimum(label, label[jump])
+            jump = jump[jump]
+    return label
+
+
+def _inside_zones(points, zones):
+    """
+    Punti interni ad almeno una zona spazzata dai lati grezzi
+
+    Una zona è il quadrilatero (origine, origine del successivo, fine,
+    inizio) di un lato grezzo: diventa un triangolo se i due estremi
+    partono dallo stesso vertice e un farfallino se il lato si rovescia, e
+    in tutti i casi la regola pari-dispari ne dà l'interno.
+
+    Con poche coppie (punto, zona) ogni punto è confrontato con il riquadro
+    di tutte le zone. Altrimenti le zone lunghe sono divise lungo il lato in
+    tratti lunghi al più una cella di una griglia (ogni tratto è la zona
+    spazzata da una parte del lato), ognuno registrato in tutte le celle
+    del suo riquadro, e ogni punto si confronta con le zone della sua cella.
+
+    Args:
+        points: Array (P, 2) dei punti
+        zones: Array (Z, 4, 2) dei vertici delle zone
+
+    Returns:
+        Array (P,) booleano
+    """
+    count = len(points)
+    if count == 0 or len(zones) == 0:
+        return np.zeros(count, dtype=bool)
+    if count * len(zones) <= _MAX_WINDING_PAIRS:
+        low, high = zones.min(axis=1), zones.max(axis=1)
+        near = np.all((low <= points[:, None]) & (points[:, None] <= high), axis=2)
+        point, zone = np.nonzero(near)
+        inside = _quad_contains(points[point], zones[zone])
+        return np.bincount(point[inside], minlength=count) > 0
+
+    length = np.maximum(
+        np.hypot(*(zones[:, 1] - zones[:, 0]).T), np.hypot(*(zones[:, 2] - zones[:, 3]).T)
+    )
+    reach = np.maximum(
+        np.hypot(*(zones[:, 3] - zones[:, 0]).T), np.hypot(*(zones[:, 2] - zones[:, 1]).T)
+    )
+    cell = max(float(np.mean(length)), float(np.mean(reach)), _MIN_EDGE)
+    pieces = np.maximum(np.ceil(length / cell).astype(np.int64), 1)
+    parent = np.repeat(np.arange(len(zones)), pieces)
+    step = np.arange(int(pieces.sum())) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+    low = (step / pieces[parent])[:, None]
+    high = ((step + 1) / pieces[parent])[:, None]
+    zone = zones[parent]
+    corners = np.stack([
+        zone[:, 0] + low * (zone[:, 1] - zone[:, 0]),
+        zone[:, 0] + high * (zone[:, 1] - zone[:, 0]),
+        zone[:, 3] + high * (zone[:, 2] - zone[:, 3]),
+        zone[:, 3] + low * (zone[:, 2] - zone[:, 3]),
+    ], axis=1)
+
+    origin = np.minimum(corners.min(axis=(0, 1)), points.min(axis=0))
+    cell_low = np.floor((corners.min(axis=1) - origin) / cell).astype(np.int64)
+    cell_high = np.floor((corners.max(axis=1) - origin) / cell).astype(np.int64)
+    point_cell = np.floor((points - origin) / cell).astype(np.int64)
+    rows = int(max(cell_high[:, 1].max(), point_cell[:, 1].max())) + 1
+    span = cell_high - cell_low + 1
+    counts = span[:, 0] * span[:, 1]
+    piece = np.repeat(np.arange(len(corners)), counts)
+    local = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+    key = (cell_low[piece, 0] + local % span[piece, 0]) * rows + cell_low[piece, 1] + local // span[piece, 0]
+    order = np.argsort(key, kind='stable')
+    key, piece = key[order], piece[order]
+
+    point_key = point_cell[:, 0] * rows + point_cell[:, 1]
+    first = np.searchsorted(key, point_key, side='left')
+    candidates = np.searchsorted(key, point_key, side='right') - first
+
+    # Coppie (punto, zona) a blocchi di punti consecutivi
+    result = np.zeros(count, dtype=bool)
+    cumulative = np.cumsum(candidates)
+    cuts = np.searchsorted(cumulative, np.arange(_MAX_WINDING_PAIRS, int(cumulative[-1]), _MAX_WINDING_PAIRS))
+    for start, stop in zip(np.concatenate([[0], cuts]), np.concatenate([cuts, [count]])):
+        block = candidates[start:stop]
+        point = np.repeat(np.arange(start, stop), block)
+        offset = np.arange(int(block.sum())) - np.repeat(np.cumsum(block) - block, block)
+        inside = _quad_contains(points[point], corners[piece[first[point] + offset]])
+        result[start:stop] = np.bincount(point[inside] - start, minlength=stop - start) > 0
+    return result
+
+
+def _quad_contains(points, quads):
+    """Punto i interno al quadrilatero i (regola pari-dispari), per coppie"""
+    inside = np.zeros(len(points), dtype=bool)
+    for k in range(4):
+        a, b = quads[:, k], quads[:, (k + 1) % 4]
+        cross = (b[:, 0] - a[:, 0]) * (points[:, 1] - a[:, 1]) - (points[:, 0] - a[:, 0]) * (b[:, 1] - a[:, 1])
+        straddle = (a[:, 1] > points[:, 1]) != (b[:, 1] > points[:, 1])
+        inside ^= straddle & ((cross > 0) == (b[:, 1] > a[:, 1]))
+    return inside
+
+
+def _side_windings(starts, ends, weights, edges=None):
+    """
+    Avvolgimento subito a sinistra e subito a destra di alcuni lati
+
+    L'avvolgimento è calcolato nel punto medio del lato escludendo il lato
+    stesso, che nessun altro lato attraversa (sono già divisi nelle
+    intersezioni); con la regola semiaperta il punto medio conta come un
+    punto appena sopra di esso. Il contributo del lato è poi aggiunto dalla
+    parte giusta: niente sonde spostate di una distanza fissa, che
+    sbaglierebbero sulle anse più strette di quella distanza.
+
+    Args:
+        weights: Molteplicità di ogni lato
+        edges: Indici dei lati da valutare (tutti se None)
+
+    Returns:
+        Tupla (left, right, crossings): avvolgimento a sinistra e a destra e
+        attraversamenti a sinistra (per la regola pari-dispari)
+    """
+    if edges is None:
+        edges = np.arange(len(starts))
+    a, b = starts[edges], ends[edges]
+    winding, crossings = _winding((a + b) / 2, starts, ends, weights, skip=edges)
+    weight = weights[edges]
+    dx = b[:, 0] - a[:, 0]
+    dy = b[:, 1] - a[:, 1]
+    # Lato ascendente: conta a sinistra; discendente: a destra; orizzontale:
+    # il punto medio vale come "sopra", cioè a sinistra se va verso +X
+    own_left = (dy > 0) | ((dy == 0) & (dx < 0))
+    own_right = (dy < 0) | ((dy == 0) & (dx > 0))
+    left = winding + np.where(own_left, weight, 0)
+    right = winding - np.where(own_right, weight, 0)
+    return left, right, crossings + own_left
+
+
+def _winding(points, starts, ends, weights, skip=None):
+    """
+    Numero di avvolgimento e di attraversamenti di molti punti
+
+    I lati sono registrati nelle fasce orizzontali che coprono; per ogni
+    punto si esaminano solo i lati della sua fascia, con la regola del
+    semiasse verso +X (lato ascendente a destra del punto +1, discendente
+    -1, moltiplicati per il peso del lato).
+
+    Args:
+        weights: Peso di ogni lato nell'avvolgimento
+        skip: Per ogni punto, indice di un lato da ignorare
+
+    Returns:
+        Tupla (winding, crossings) di array (P,) interi
+    """
+    count = len(points)
+    # I lati orizzontali non attraversano mai il semiasse: fuori dall'indice
+    # (sui contorni con lunghi tratti allineati affollerebbero una fascia)
+    sloped = np.flatnonzero(starts[:, 1] != ends[:, 1])
+    if count == 0 or len(sloped) == 0:
+        zeros = np.zeros(count, dtype=np.int64)
+        return zeros, zeros
+    y_low = np.minimum(starts[sloped, 1], ends[sloped, 1])
+    y_high = np.maximum(starts[sloped, 1], ends[sloped, 1])
+    bottom = float(y_low.min())
+    bands = max(len(sloped) // _EDGES_PER_BUCKET, 1)
+    height = max((float(y_high.max()) - bottom) / bands, _MIN_EDGE)
+
+    band_low = np.floor((y_low - bottom) / height).astype(np.int64)
+    band_high = np.minimum(np.floor((y_high - bottom) / height).astype(np.int64), bands - 1)
+    counts = band_high - band_low + 1
+    local = np.repeat(np.arange(len(sloped)), counts)
+    edge = sloped[local]
+    band = band_low[local] + np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+    order = np.argsort(band, kind='stable')
+    edge = edge[order]
+    band_start = np.searchsorted(band[order], np.arange(bands + 1))
+
+    point_band = np.floor((points[:, 1] - bottom) / height).astype(np.int64)
+    inside = (point_band >= 0) & (point_band < bands)
+    point_band = np.where(inside, point_band, 0)
+    candidates = np.where(inside, band_start[point_band + 1] - band_start[point_band], 0)
+
+    # Coppie (punto, lato) a blocchi di punti consecutivi
+    winding = np.zeros(count, dtype=np.int64)
+    crossings = np.zeros(count, dtype=np.int64)
+    cumulative = np.cumsum(candidates)
+    cuts = np.searchsorted(cumulative, np.arange(_MAX_WINDING_PAIRS, int(cumulative[-1]), _MAX_WINDING_PAIRS))
+    for first, last in zip(np.concatenate([[0], cuts]), np.concatenate([cuts, [count]])):
+        block = candidates[first:last]
+        point = np.repeat(np.arange(first, last), block)
+        offset = np.arange(int(block.sum())) - np.repeat(np.cumsum(block) - block, block)
+        candidate = edge[band_start[point_band[point]] + offset]
+        if skip is not None:
+            other = candidate != skip[point]
+            point, candidate = point[other], candidate[other]
+
+        a, b, p = starts[candidate], ends[candidate], points[point]
+        cross = (b[:, 0] - a[:, 0]) * (p[:, 1] - a[:, 1]) - (p[:, 0] - a[:, 0]) * (b[:, 1] - a[:, 1])
+        upward = (a[:, 1] <= p[:, 1]) & (b[:, 1] > p[:, 1]) & (cross > 0)
+        downward = (b[:, 1] <= p[:, 1]) & (a[:, 1] > p[:, 1]) & (cross < 0)
+        contribution = (upward.astype(np.int64) - downward) * weights[candidate]
+        point -= first
+        winding[first:last] = np.rint(np.bincount(point, weights=contribution, minlength=last - first))
+        crossings[first:last] = np.bincount(point, weights=upward | downward, minlength=last - first)
+    return winding, crossings
@@ -0,0 +1,187 @@
+"""
+Stima del tempo di stampa con un planner di movimento trapezoidale
+
+I movimenti generati vengono ripercorsi con gli stessi limiti che
+l'intestazione del G-code imposta sulla stampante (M201 accelerazioni
+massime, M203 velocità massime, M204 accelerazioni di stampa, ritrazione e
+spostamento, M205 jerk). Per ogni movimento il profilo di velocità è un
+trapezio (accelerazione, crociera, decelerazione); le velocità alle
+giunzioni sono limitate dal jerk e dalle distanze di frenata, calcolate con
+scansioni cumulative NumPy invece del classico doppio ciclo del firmware.
+"""
+import numpy as np
+
+AXES = ('X', 'Y', 'Z', 'E')
+
+# Limiti della stampante emessi nell'intestazione del G-code
+MACHINE_LIMITS = {
+    # M201: accelerazione massima per asse (mm/s²)
+    'max_acceleration': {'X': 500, 'Y': 500, 'Z': 100, 'E': 5000},
+    # M203: velocità massima per asse (mm/s)
+    'max_feedrate': {'X': 500, 'Y': 500, 'Z': 10, 'E': 50},
+    # M204: accelerazione di stampa (P), di ritrazione (R) e di spostamento (T)
+    'acceleration': {'P': 500, 'R': 1000, 'T': 500},
+    # M205: jerk per asse (mm/s)
+    'jerk': {'X': 8.0, 'Y': 8.0, 'Z': 0.4, 'E': 5.0},
+}
+
+
+def limits_gcode(limits=MACHINE_LIMITS):
+    """Righe M201/M203/M204/M205 dell'intestazione per i limiti indicati"""
+    acceleration = ' '.join(f"{axis}{limits['max_acceleration'][axis]}" for axis in AXES)
+    feedrate = ' '.join(f"{axis}{limits['max_feedrate'][axis]}" for axis in AXES)
+    move_acceleration = ' '.join(f"{key}{value}" for key, value in limits['acceleration'].items())
+    jerk = ' '.join(f"{axis}{limits['jerk'][axis]:.2f}" for axis in AXES)
+    return (
+        f"M201 {acceleration} ; Imposta accelerazione\n"
+        f"M203 {feedrate} ; Imposta velocità massima\n"
+        f"M204 {move_acceleration} ; Imposta accelerazione per movimenti\n"
+        f"M205 {jerk} ; Imposta jerk\n"
+    )
+
+
+def move_times(deltas, feed, limits=MACHINE_LIMITS):
+    """
+    Tempo di esecuzione di una sequenza di movimenti consecutivi
+
+    La sequenza parte e termina da ferma (alla velocità di partenza
+    consentita dal jerk).
+
+    Args:
+        deltas: Array (N, 4) degli spostamenti X, Y, Z, E di ogni movimento
+        feed: Array (N,) delle velocità richieste in mm/min
+        limits: Limiti della stampante (vedi MACHINE_LIMITS)
+
+    Returns:
+        Array (N,) dei tempi in secondi
+    """
+    deltas = np.asarray(deltas, dtype=np.float64).reshape(-1, 4)
+    feed = np.asarray(feed, dtype=np.float64)
+    times = np.zeros(len(deltas))
+
+    # Lunghezza: distanza XYZ, oppure |E| per le sole ritrazioni
+    length = np.sqrt(np.einsum('ij,ij->i', deltas[:, :3], deltas[:, :3]))
+    e_only = length == 0
+    length[e_only] = np.abs(deltas[e_only, 3])
+    moving = length > 0
+    if not moving.any():
+        return times
+    deltas, feed, length, e_only = deltas[moving], feed[moving], length[moving], e_only[moving]
+
+    # Componenti per asse della direzione (E incluso, come nel firmware)
+    direction = np.abs(deltas) / length[:, None]
+    max_feedrate = np.array([limits['max_feedrate'][axis] for axis in AXES], dtype=np.float64)
+    max_acceleration = np.array([limits['max_acceleration'][axis] for axis in AXES], dtype=np.float64)
+    jerk = np.array([limits['jerk'][axis] for axis in AXES], dtype=np.float64)
+
+    with np.errstate(divide='ignore'):
+        # Velocità di crociera limitata dalla velocità massima di ogni asse
+        speed = np.minimum(feed / 60.0, (max_feedrate / direction).min(axis=1))
+
+        # Accelerazione M204 limitata dall'accelerazione massima di ogni asse
+        acceleration = np.where(
+            e_only, limits['acceleration']['R'],
+            np.where(deltas[:, 3] > 0, limits['acceleration']['P'], limits['acceleration']['T']),
+        ).astype(np.float64)
+        acceleration = np.minimum(acceleration, (max_acceleration / direction).min(axis=1))
+
+        # Velocità alle giunzioni: la variazione di velocità di ogni asse non
+        # supera il jerk; all'inizio e alla fine si parte e ci si ferma
+        signed = deltas / length[:, None]
+        change = np.abs(np.diff(signed, axis=0))
+        junction = np.minimum(speed[:-1], speed[1:])
+        junction = np.minimum(junction, (jerk / change).min(axis=1))
+        start = np.minimum(speed[0], (jerk / direction[0]).min())
+        end = np.minimum(speed[-1], (jerk / direction[-1]).min())
+
+    entry = np.concatenate([[start], junction, [end]]) ** 2
+    entry = _reachable_speeds(entry, 2.0 * acceleration * length)
+
+    v_entry = np.sqrt(entry[:-1])
+    v_exit = np.sqrt(entry[1:])
+    times[moving] = _trapezoid_times(length, speed, acceleration, v_entry, v_exit)
+    return times
+
+
+def _reachable_speeds(limit, reach):
+    """
+    Velocità al quadrato alle giunzioni compatibili con le accelerazioni
+
+    Con w_k la velocità al quadrato alla giunzione k e reach_k = 2·a·L del
+    movimento k, deve valere w_k <= w_{k+1} + reach_k (frenata) e
+    w_{k+1} <= w_k + reach_k (accelerazione). Con le somme prefisse S di
+    reach le due passate diventano minimi cumulativi:
+    w_k = min_{m>=k}(limit_m + S_m) - S_k all'indietro, e
+    v_k = min_{m<=k}(w_m - S_m) + S_k in avanti.
+    """
+    prefix = np.concatenate([[0.0], np.cumsum(reach)])
+    backward = np.minimum.accumulate((limit + prefix)[::-1])[::-1] - prefix
+    forward = np.minimum.accumulate(backward - prefix) + prefix
+    return np.maximum(forward, 0.0)
+
+
+def _trapezoid_times(length, speed, acceleration, v_entry, v_exit):
+    """Tempo di ogni movimento con profilo trapezoidale (o triangolare)"""
+    peak_squared = (2.0 * acceleration * length + v_entry ** 2 + v_exit ** 2) / 2.0
+    peak = np.maximum(np.minimum(speed, np.sqrt(peak_squared)), np.maximum(v_entry, v_exit))
+    accelerate = (peak ** 2 - v_entry ** 2) / (2.0 * acceleration)
+    decelerate = (peak ** 2 - v_exit ** 2) / (2.0 * acceleration)
+    cruise = np.maximum(length - accelerate - decelerate, 0.0)
+    return (peak - v_entry) / acceleration + (peak - v_exit) / acceleration + cruise / peak
+
+
+class PrintTimeEstimator:
+    """
+    Accumula i tempi di stampa layer per layer
+
+    I movimenti sono passati con coordinate XYZ assolute ed estrusione
+    relativa (M83), come nel G-code generato; la posizione finale di ogni
+    blocco è il punto di partenza del successivo. Ogni layer è un blocco
+    indipendente: tra un layer e l'altro ritrazione e sollevamento Z
+    fermano comunque la testina entro il jerk dell'asse Z.
+
+    Args:
+        position: Posizione XYZ iniziale della testina
+        limits: Limiti della stampante (vedi MACHINE_LIMITS)
+    """
+
+    def __init__(self, position=(0.0, 0.0, 0.0), limits=MACHINE_LIMITS):
+        self.position = np.asarray(position, dtype=np.float64)
+        self.limits = limits
+        self.layer_times = []
+
+    def add_layer(self, x, y, z, e, feed):
+        """
+        Aggiunge i movimenti di un layer
+
+        Args:
+            x, y, z: Array (N,) delle coordinate di arrivo
+            e: Array (N,) dell'estrusione relativa di ogni movimento
+            feed: Array (N,) delle velocità in mm/min
+
+        Returns:
+            Tempo del layer in secondi
+        """
+        targets = np.column_stack([x, y, z]).astype(np.float64)
+        if len(targets) == 0:
+            self.layer_times.append(0.0)
+            return 0.0
+        deltas = np.empty((len(targets), 4))
+        deltas[:, :3] = np.diff(np.vstack([self.position, targets]), axis=0)
+        deltas[:, 3] = e
+        self.position = targets[-1]
+        seconds = float(move_times(deltas, feed, self.limits).sum())
+        self.layer_times.append(seconds)
+        return seconds
+
+    @property
+    def total_time(self):
+        """Tempo totale in secondi"""
+        return float(sum(self.layer_times))
+
+    def summary(self):
+        """Tempo totale e per layer (secondi), serializzabile in JSON"""
+        return {
+            "total_s": round(self.total_time, 3),
+            "layers_s": [round(seconds, 3) for seconds in self.layer_times],
+        }
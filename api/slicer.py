@@ -0,0 +1,694 @@
+"""
+Motore di slicing vettoriale per Pimp My Printer
+
+Interseca il mesh con tutti i piani Z dei layer tramite operazioni NumPy
+sull'intero array dei triangoli (nessun ciclo Python per faccia) e ricompone
+i segmenti ottenuti in contorni chiusi.
+"""
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+
+import numpy as np
+
+# Numero massimo di coppie (layer, triangolo) elaborate in un singolo blocco,
+# limita la memoria dei temporanei sui modelli molto densi
+MAX_PAIRS_PER_CHUNK = 2_000_000
+
+# Risoluzione (mm) usata per unire gli estremi dei segmenti
+STITCH_TOLERANCE = 1e-6
+
+# Sotto questa soglia di triangoli lo slicing parallelo non conviene
+PARALLEL_MIN_TRIANGLES = 50_000
+
+# Blocchi di layer per processo: più blocchi bilanciano meglio il carico
+BLOCKS_PER_WORKER = 4
+
+# Numero massimo di layer elaborati insieme nello slicing a blocchi
+LAYERS_PER_BLOCK = 32
+
+# Passo (mm) delle altezze dei layer adattivi: le quote sono multipli del
+# passo e restano esatte con i due decimali del G-code
+ADAPTIVE_HEIGHT_STEP = 0.01
+
+# Facce con |n_z| oltre questa soglia sono orizzontali e non formano scalini
+FLAT_NORMAL_Z = 1.0 - 1e-6
+
+
+def compute_layer_planes(z_min, z_max, layer_height):
+    """
+    Calcola le quote dei layer e dei relativi piani di taglio
+
+    Il piano di taglio di ogni layer è a metà dello spessore del layer,
+    così da evitare le facce orizzontali che giacciono esattamente sul
+    bordo superiore o inferiore.
+
+    Args:
+        z_min: Quota minima del modello
+        z_max: Quota massima del modello
+        layer_height: Altezza del layer in mm
+
+    Returns:
+        Tupla (layer_z, planes): quota superiore di ogni layer rispetto al
+        piatto e quota del piano di taglio nelle coordinate del mesh
+
+    Raises:
+        ValueError: Se layer_height non è positiva
+    """
+    if not layer_height > 0:
+        raise ValueError(f"Altezza del layer non valida: {layer_height}")
+    height = float(z_max - z_min)
+    layer_count = max(int(np.ceil(height / layer_height - 1e-9)), 1)
+    layer_z = (np.arange(layer_count) + 1) * layer_height
+    planes = z_min + layer_z - layer_height / 2.0
+    return layer_z, planes
+
+
+def compute_adaptive_layer_planes(triangles, z_min, z_max, min_height, max_height, tolerance,
+                                  first_height=None):
+    """
+    Calcola quote di layer ad altezza variabile guidate dalla pendenza
+
+    Su una faccia con normale di componente verticale n_z un layer alto h
+    lascia uno scalino di h * |n_z| (cusp height): l'altezza ammessa dalla
+    faccia è quindi tolerance / |n_z|. Le altezze ammesse sono raccolte in
+    un istogramma su Z a passo ADAPTIVE_HEIGHT_STEP, con il minimo tra le
+    facce che attraversano ogni intervallo; i layer sono poi impilati dal
+    basso, ognuno alto quanto il minimo dell'istogramma lungo il proprio
+    spessore. Pareti verticali e facce orizzontali non pongono limiti.
+
+    Args:
+        triangles: Array (N, 3, 3) dei vertici dei triangoli
+        z_min: Quota minima del modello
+        z_max: Quota massima del modello
+        min_height: Altezza minima dei layer in mm
+        max_height: Altezza massima dei layer in mm
+        tolerance: Altezza massima dello scalino sulle superfici inclinate
+        first_height: Altezza del primo layer (opzionale, per l'adesione
+            al piatto); altrimenti adattiva come le altre
+
+    Returns:
+        Tupla (layer_z, planes) come compute_layer_planes
+    """
+    limit = adaptive_height_limits(triangles, z_min, z_max, min_height, max_height, tolerance)
+    return stack_adaptive_layers(limit, z_min, min_height, max_height, first_height)
+
+
+def adaptive_height_limits(triangles, z_min, z_max, min_height, max_height, tolerance):
+    """
+    Istogramma su Z delle altezze ammesse dai triangoli, in passi
+
+    I triangoli possono essere passati a gruppi (ad esempio una banda Z
+    alla volta): l'istogramma complessivo è il minimo elemento per elemento
+    di quelli dei gruppi, con gli stessi z_min e z_max del modello.
+
+    Returns:
+        Array con l'altezza massima ammessa in ogni intervallo di
+        ADAPTIVE_HEIGHT_STEP (vedi compute_adaptive_layer_planes)
+    """
+    step = ADAPTIVE_HEIGHT_STEP
+    min_steps = max(int(round(min_height / step)), 1)
+    max_steps = max(int(round(max_height / step)), min_steps)
+    bins = max(int(np.ceil((z_max - z_min) / step - 1e-9)), 1)
+
+    # Altezza ammessa da ogni faccia inclinata, in passi
+    triangles = np.asarray(triangles, dtype=np.float64)
+    a = triangles[:, 1] - triangles[:, 0]
+    b = triangles[:, 2] - triangles[:, 0]
+    normal_x = a[:, 1] * b[:, 2] - a[:, 2] * b[:, 1]
+    normal_y = a[:, 2] * b[:, 0] - a[:, 0] * b[:, 2]
+    normal_z = np.abs(a[:, 0] * b[:, 1] - a[:, 1] * b[:, 0])
+    norm = np.sqrt(normal_x ** 2 + normal_y ** 2 + normal_z ** 2)
+    limited = (normal_z * max_height > tolerance * norm) & (normal_z < FLAT_NORMAL_Z * norm)
+    slope = normal_z[limited] / norm[limited]
+    allowed = np.clip(np.floor(tolerance / slope / step + 1e-9).astype(np.int64), min_steps, max_steps)
+
+    # Istogramma su Z: intervalli [low, high) attraversati da ogni faccia
+    z = triangles[limited, :, 2] - z_min
+    low = np.clip(np.floor(z.min(axis=1) / step).astype(np.int64), 0, bins - 1)
+    high = np.clip(np.ceil(z.max(axis=1) / step).astype(np.int64), low + 1, bins)
+
+    # Minimo per intervallo: le altezze ammesse sono poche (in passi), per
+    # ognuna dalla più alta alla più bassa si marcano gli intervalli coperti
+    limit = np.full(bins, max_steps, dtype=np.int64)
+    for height in np.unique(allowed)[::-1]:
+        mask = allowed == height
+        coverage = np.cumsum(
+            np.bincount(low[mask], minlength=bins + 1) - np.bincount(high[mask], minlength=bins + 1)
+        )[:bins]
+        limit[coverage > 0] = height
+    return limit
+
+
+def stack_adaptive_layers(limit, z_min, min_height, max_height, first_height=None):
+    """
+    Impila i layer adattivi dal basso sull'istogramma delle altezze ammesse
+
+    Args:
+        limit: Istogramma da adaptive_height_limits
+
+    Returns:
+        Tupla (layer_z, planes) come compute_layer_planes
+    """
+    step = ADAPTIVE_HEIGHT_STEP
+    min_steps = max(int(round(min_height / step)), 1)
+    max_steps = max(int(round(max_height / step)), min_steps)
+    bins = len(limit)
+
+    # Layer impilati dal basso: l'altezza scende finché il minimo
+    # dell'istogramma lungo lo spessore la ammette
+    tops = []
+    position = 0
+    if first_height is not None:
+        position = max(int(round(first_height / step)), 1)
+        tops.append(position)
+    while position < bins:
+        height = max_steps
+        while True:
+            admitted = int(limit[position:position + height].min())
+            if admitted >= height:
+                break
+            height = admitted
+        position += height
+        tops.append(position)
+
+    tops = np.asarray(tops, dtype=np.int64)
+    heights = np.diff(tops, prepend=0)
+    layer_z = tops * step
+    planes = z_min + layer_z - heights * step / 2.0
+    return layer_z, planes
+
+
+class TriangleZIndex:
+    """
+    Indice degli intervalli Z dei triangoli di un mesh
+
+    Costruito una sola volta per mesh: ordina i triangoli per Z minima e
+    permette a ogni layer di visitare solo i triangoli che lo attraversano,
+    così il costo per layer cresce con le facce del layer e non con quelle
+    dell'intero modello.
+    """
+
+    def __init__(self, triangles):
+        triangles = np.asarray(triangles, dtype=np.float64)
+        z = triangles[:, :, 2]
+        tri_z_min = z.min(axis=1)
+        tri_z_max = z.max(axis=1)
+
+        # Ordinamento per Z minima (sweep-line dal basso verso l'alto)
+        order = np.argsort(tri_z_min, kind='stable')
+        self.order = order
+        self._set_sorted(triangles[order], tri_z_min[order], tri_z_max[order])
+
+    def _set_sorted(self, triangles, z_min_sorted, z_max_sorted):
+        self.triangles = triangles
+        self.z_min_sorted = z_min_sorted
+        self.z_max_sorted = z_max_sorted
+
+        # Estensione verticale massima: limita la finestra di ricerca
+        count = len(triangles)
+        self.max_extent = float((z_max_sorted - z_min_sorted).max()) if count else 0.0
+        self.z_min = float(z_min_sorted[0]) if count else 0.0
+        self.z_max = float(z_max_sorted.max()) if count else 0.0
+
+    @classmethod
+    def from_mesh(cls, mesh):
+        """Costruisce l'indice dai triangoli di un oggetto trimesh"""
+        return cls(mesh.triangles)
+
+    @classmethod
+    def from_sorted(cls, triangles, z_min_sorted, z_max_sorted):
+        """Ricostruisce un indice da array già ordinati (es. memoria condivisa)"""
+        index = cls.__new__(cls)
+        index.order = None
+        index._set_sorted(triangles, z_min_sorted, z_max_sorted)
+        return index
+
+    def __len__(self):
+        return len(self.triangles)
+
+    def layer_planes(self, layer_height):
+        """Quote dei layer e dei piani di taglio per l'altezza indicata"""
+        return compute_layer_planes(self.z_min, self.z_max, layer_height)
+
+    def adaptive_layer_planes(self, min_height, max_height, tolerance, first_height=None):
+        """Quote dei layer adattivi (vedi compute_adaptive_layer_planes)"""
+        return compute_adaptive_layer_planes(
+            self.triangles, self.z_min, self.z_max, min_height, max_height, tolerance, first_height
+        )
+
+    def pairs(self, planes):
+        """
+        Coppie (layer, triangolo) per tutti i piani indicati
+
+        Ogni triangolo attraversa un intervallo contiguo di piani, trovato
+        con due ricerche binarie; le coppie sono generate espandendo gli
+        intervalli, quindi il costo è proporzionale alle intersezioni reali.
+
+        Args:
+            planes: Array ordinato delle quote dei piani di taglio
+
+        Returns:
+            Tupla (layer_idx, tri_idx) con indici nell'array ordinato
+        """
+        planes = np.asarray(planes, dtype=np.float64)
+        if len(planes) == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty
+
+        # Solo i triangoli che possono toccare l'intervallo dei piani
+        lo, hi = self._window(planes[0], planes[-1])
+        z_min_sorted = self.z_min_sorted[lo:hi]
+        z_max_sorted = self.z_max_sorted[lo:hi]
+
+        # Piani con z_min <= piano < z_max
+        first = np.searchsorted(planes, z_min_sorted, side='left')
+        last = np.searchsorted(planes, z_max_sorted, side='left')
+        counts = np.maximum(last - first, 0)
+
+        tri_idx = lo + np.repeat(np.arange(len(counts)), counts)
+        # Per ogni coppia: primo piano del triangolo + posizione nell'intervallo
+        offsets = np.arange(len(tri_idx)) - np.repeat(np.cumsum(counts) - counts, counts)
+        layer_idx = np.repeat(first, counts) + offsets
+
+        # Ordine per layer, utile per l'elaborazione a blocchi di layer
+        by_layer = np.argsort(layer_idx, kind='stable')
+        return layer_idx[by_layer], tri_idx[by_layer]
+
+    def active(self, plane):
+        """
+        Indici (nell'array ordinato) dei triangoli attraversati da un piano
+
+        Solo i triangoli con Z minima nella finestra
+        [plane - max_extent, plane] vengono esaminati.
+        """
+        lo, hi = self._window(plane, plane)
+        candidates = np.arange(lo, hi)
+        return candidates[self.z_max_sorted[lo:hi] > plane]
+
+    def _window(self, z_low, z_high):
+        """Intervallo [lo, hi) dei triangoli con Z minima compatibile"""
+        lo = np.searchsorted(self.z_min_sorted, z_low - self.max_extent, side='left')
+        hi = np.searchsorted(self.z_min_sorted, z_high, side='right')
+        return int(lo), int(hi)
+
+
+def intersect_layers(index, planes):
+    """
+    Interseca i triangoli con tutti i piani in modo vettoriale
+
+    Un vertice è considerato "sopra" il piano se la sua Z è strettamente
+    maggiore della quota del piano; i triangoli con vertici da entrambe le
+    parti producono esattamente un segmento. I segmenti sono orientati in
+    modo che il materiale resti a sinistra (contorni esterni antiorari).
+
+    Args:
+        index: TriangleZIndex del mesh
+        planes: Array (L,) ordinato delle quote dei piani di taglio
+
+    Returns:
+        Tupla (layer_idx, starts, ends) con l'indice del layer di ogni
+        segmento e i punti XY iniziali e finali (array (N, 2))
+    """
+    planes = np.asarray(planes, dtype=np.float64)
+    layer_idx, tri_idx = index.pairs(planes)
+
+    # Elaborazione a blocchi per limitare la memoria dei temporanei
+    layer_parts, start_parts, end_parts = [], [], []
+    for begin in range(0, len(tri_idx), MAX_PAIRS_PER_CHUNK):
+        stop = begin + MAX_PAIRS_PER_CHUNK
+        seg_layer, seg_start, seg_end = _segments_for_pairs(
+            index.triangles, planes, layer_idx[begin:stop], tri_idx[begin:stop]
+        )
+        layer_parts.append(seg_layer)
+        start_parts.append(seg_start)
+        end_parts.append(seg_end)
+
+    if not layer_parts:
+        empty = np.empty((0, 2))
+        return np.empty(0, dtype=np.int64), empty, empty
+
+    return (
+        np.concatenate(layer_parts),
+        np.concatenate(start_parts),
+        np.concatenate(end_parts),
+    )
+
+
+def _segments_for_pairs(triangles, planes, layer_idx, tri_idx):
+    """Calcola i segmenti per le coppie (layer, triangolo) indicate"""
+    if len(tri_idx) == 0:
+        empty = np.empty((0, 2))
+        return layer_idx, empty, empty
+
+    tris = triangles[tri_idx]
+    plane = planes[layer_idx]
+    above = tris[:, :, 2] > plane[:, None]
+
+    # Ogni lato (i -> i+1) attraversa il piano se un estremo è sopra e l'altro no
+    a = tris
+    b = np.roll(tris, -1, axis=1)
+    above_b = np.roll(above, -1, axis=1)
+    crossing = above != above_b
+
+    # Interpolazione canonica dal vertice inferiore a quello superiore: lo
+    # stesso lato condiviso da due triangoli produce lo stesso punto
+    low = np.where(above[:, :, None], b, a)
+    high = np.where(above[:, :, None], a, b)
+    dz = high[:, :, 2] - low[:, :, 2]
+    dz = np.where(dz == 0, 1.0, dz)
+    t = (plane[:, None] - low[:, :, 2]) / dz
+    points = low[:, :, :2] + t[:, :, None] * (high[:, :, :2] - low[:, :, :2])
+
+    # Esattamente due lati attraversano il piano: prendiamo il primo e il secondo
+    order = np.argsort(~crossing, axis=1, kind='stable')[:, :2]
+    rows = np.arange(len(tris))[:, None]
+    p = points[rows, order]
+    start = p[:, 0]
+    end = p[:, 1]
+
+    # Orientamento: la direzione deve concordare con z × n (materiale a sinistra)
+    normals = np.cross(tris[:, 1] - tris[:, 0], tris[:, 2] - tris[:, 0])
+    direction = np.stack([-normals[:, 1], normals[:, 0]], axis=1)
+    flip = np.einsum('ij,ij->i', end - start, direction) < 0
+    start, end = np.where(flip[:, None], end, start), np.where(flip[:, None], start, end)
+
+    # Scarta i segmenti degeneri (lunghezza nulla)
+    keep = np.any(np.abs(end - start) > STITCH_TOLERANCE, axis=1)
+    return layer_idx[keep], start[keep], end[keep]
+
+
+def stitch_segments(layer_idx, starts, ends, layer_count):
+    """
+    Ricompone i segmenti di ogni layer in contorni
+
+    L'ordinamento dei segmenti lungo ogni contorno è calcolato con pointer
+    jumping su array NumPy (O(n log n)), senza seguire i segmenti uno a uno.
+
+    Args:
+        layer_idx: Indice del layer di ogni segmento
+        starts: Punti iniziali dei segmenti (N, 2)
+        ends: Punti finali dei segmenti (N, 2)
+        layer_count: Numero totale di layer
+
+    Returns:
+        Lista (una voce per layer) di liste di contorni; ogni contorno è un
+        dizionario con i punti XY ('points') e il flag 'closed'
+    """
+    layers = [[] for _ in range(layer_count)]
+    n = len(layer_idx)
+    if n == 0:
+        return layers
+
+    # Identificatori interi degli estremi (layer + coordinate quantizzate)
+    q_start = np.round(starts / STITCH_TOLERANCE).astype(np.int64)
+    q_end = np.round(ends / STITCH_TOLERANCE).astype(np.int64)
+    keys = np.concatenate([
+        np.column_stack([layer_idx, q_start]),
+        np.column_stack([layer_idx, q_end]),
+    ])
+    point_ids = _row_ids(keys)
+    start_id = point_ids[:n]
+    end_id = point_ids[n:]
+
+    # Successore di ogni segmento: quello che parte dove questo finisce
+    by_start = np.argsort(start_id, kind='stable')
+    sorted_start = start_id[by_start]
+    pos = np.minimum(np.searchsorted(sorted_start, end_id), n - 1)
+    sentinel = n
+    nxt = np.where(sorted_start[pos] == end_id, by_start[pos], sentinel)
+
+    # Nei punti non-manifold più segmenti possono puntare allo stesso
+    # successore: ne manteniamo uno solo per avere catene semplici
+    linked = np.flatnonzero(nxt != sentinel)
+    _, first = np.unique(nxt[linked], return_index=True)
+    keep_link = np.zeros(n, dtype=bool)
+    keep_link[linked[first]] = True
+    nxt = np.where(keep_link, nxt, sentinel)
+    nxt = np.append(nxt, sentinel)
+
+    steps = max(int(np.ceil(np.log2(n + 1))) + 1, 1)
+    index = np.arange(n + 1)
+
+    # Individua i cicli: dopo 2^steps salti un nodo di un ciclo non raggiunge
+    # mai il sentinella; il rappresentante del ciclo è l'indice minimo
+    jump = nxt.copy()
+    rep = index.copy()
+    for _ in range(steps):
+        rep = np.minimum(rep, rep[jump])
+        jump = jump[jump]
+    in_cycle = jump != sentinel
+    in_cycle[sentinel] = False
+
+    # Spezza ogni ciclo subito prima del suo rappresentante
+    closes = in_cycle & (nxt == rep) & (rep != sentinel)
+    closed_tail = np.zeros(n + 1, dtype=bool)
+    closed_tail[closes] = True
+    nxt = np.where(closes, sentinel, nxt)
+
+    # List ranking: distanza dalla coda e identificativo della coda
+    tail = np.where(nxt == sentinel, index, nxt)
+    dist = (nxt != sentinel).astype(np.int64)
+    tail[sentinel] = sentinel
+    dist[sentinel] = 0
+    for _ in range(steps):
+        dist = dist + dist[tail]
+        tail = tail[tail]
+
+    order = np.lexsort((-dist[:n], tail[:n]))
+    chain_tail = tail[order]
+    boundaries = np.flatnonzero(np.diff(chain_tail)) + 1
+    for chain in np.split(order, boundaries):
+        last = chain[-1]
+        closed = bool(closed_tail[last])
+        points = starts[chain]
+        points = np.vstack([points, ends[last][None, :]])
+        if closed:
+            points[-1] = points[0]
+        elif len(points) < 2:
+            continue
+        if closed and len(chain) < 3:
+            continue
+        layers[int(layer_idx[last])].append({"points": points, "closed": closed})
+
+    return layers
+
+
+def _row_ids(keys):
+    """Identificatore intero per ogni riga distinta di un array (N, K)"""
+    order = np.lexsort(keys.T[::-1])
+    sorted_keys = keys[order]
+    new_group = np.empty(len(keys), dtype=bool)
+    new_group[0] = True
+    new_group[1:] = np.any(sorted_keys[1:] != sorted_keys[:-1], axis=1)
+    ids = np.empty(len(keys), dtype=np.int64)
+    ids[order] = np.cumsum(new_group) - 1
+    return ids
+
+
+def slice_layers(index, planes):
+    """Contorni dei layer per i piani indicati (in un solo processo)"""
+    layer_idx, starts, ends = intersect_layers(index, planes)
+    return stitch_segments(layer_idx, starts, ends, len(planes))
+
+
+def _share_array(array):
+    """Copia un array in un blocco di memoria condivisa"""
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    shared = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+    shared[...] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def _slice_block(specs, planes):
+    """Esegue lo slicing di un blocco di layer in un processo del pool"""
+    blocks = [shared_memory.SharedMemory(name=name) for name, _, _ in specs]
+    try:
+        arrays = [
+            np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+            for shm, (_, shape, dtype) in zip(blocks, specs)
+        ]
+        index = TriangleZIndex.from_sorted(*arrays)
+        contours = slice_layers(index, planes)
+        # Nessun riferimento alla memoria condivisa deve sopravvivere alla chiusura
+        del index, arrays
+        return contours
+    finally:
+        for shm in blocks:
+            shm.close()
+
+
+_executors = {}
+
+
+def _get_executor(workers):
+    """Pool di processi per lo slicing parallelo, riusato tra le chiamate"""
+    executor = _executors.get(workers)
+    if executor is None:
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'))
+        _executors[workers] = executor
+    return executor
+
+
+def iter_layers_parallel(index, planes, workers):
+    """
+    Slicing dei layer suddiviso tra più processi
+
+    I vertici dei triangoli e gli intervalli Z dell'indice vengono copiati
+    una sola volta in memoria condivisa (multiprocessing.shared_memory):
+    i processi li leggono senza serializzazione. L'intervallo dei layer è
+    diviso in blocchi contigui; al massimo 2 * workers blocchi sono in
+    elaborazione alla volta e i risultati tornano nell'ordine dei layer.
+
+    Args:
+        index: TriangleZIndex del mesh
+        planes: Quote dei piani di taglio
+        workers: Numero massimo di processi
+
+    Yields:
+        Lista dei contorni di ogni layer, in ordine
+    """
+    block_size = max(1, min(LAYERS_PER_BLOCK, -(-len(planes) // (workers * BLOCKS_PER_WORKER))))
+    blocks = [planes[i:i + block_size] for i in range(0, len(planes), block_size)]
+
+    shared = [
+        _share_array(np.ascontiguousarray(array))
+        for array in (index.triangles, index.z_min_sorted, index.z_max_sorted)
+    ]
+    specs = [spec for _, spec in shared]
+    executor = _get_executor(workers)
+    pending = deque()
+    try:
+        for block in blocks:
+            pending.append(executor.submit(_slice_block, specs, block))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        # Attende i blocchi già avviati prima di rilasciare la memoria condivisa
+        for future in pending:
+            if not future.cancelled():
+                future.exception()
+        for shm, _ in shared:
+            shm.close()
+            shm.unlink()
+
+
+def iter_layers(index, planes, workers=1):
+    """
+    Contorni dei layer, prodotti un blocco di layer alla volta
+
+    La memoria occupata dai contorni resta limitata a pochi blocchi
+    indipendentemente dal numero totale di layer. Gli indici che non
+    tengono i triangoli in memoria (vedi large_stl.BandedTriangleIndex)
+    forniscono un proprio metodo iter_layers.
+
+    Yields:
+        Lista dei contorni di ogni layer, in ordine
+    """
+    if not isinstance(index, TriangleZIndex):
+        yield from index.iter_layers(planes, workers)
+        return
+    planes = np.asarray(planes, dtype=np.float64)
+    if workers > 1 and len(index) >= PARALLEL_MIN_TRIANGLES and len(planes) >= 2 * workers:
+        yield from iter_layers_parallel(index, planes, workers)
+        return
+    for begin in range(0, len(planes), LAYERS_PER_BLOCK):
+        yield from slice_layers(index, planes[begin:begin + LAYERS_PER_BLOCK])
+
+
+def default_workers():
+    """Processi per job di slicing: SLICE_LAYER_WORKERS, al massimo i core"""
+    cpu_count = os.cpu_count() or 1
+    requested = int(os.environ.get('SLICE_LAYER_WORKERS', 1))
+    return max(1, min(requested, cpu_count))
+
+
+def iter_sliced_layers(mesh, layer_height, index=None, workers=None, schedule=None):
+    """
+    Esegue lo slicing del mesh un layer alla volta
+
+    Args:
+        mesh: Oggetto trimesh contenente il modello 3D
+        layer_height: Altezza del layer in mm
+        index: TriangleZIndex già costruito per il mesh (opzionale)
+        workers: Processi da usare (predefinito: default_workers()); i
+            modelli piccoli vengono sempre elaborati in un solo processo
+        schedule: Tupla (layer_z, planes) già calcolata, ad esempio da
+            adaptive_layer_planes (opzionale, altrimenti layer di altezza
+            layer_height)
+
+    Yields:
+        Dizionari con la quota 'z' del layer (rispetto al piatto), la sua
+        altezza 'height' e i 'contours' del layer
+    """
+    if index is None:
+        index = TriangleZIndex.from_mesh(mesh)
+    if workers is None:
+        workers = default_workers()
+    layer_z, planes = schedule if schedule is not None else index.layer_planes(layer_height)
+    heights = np.diff(layer_z, prepend=0.0)
+
+    for z, height, layer_contours in zip(layer_z, heights, iter_layers(index, planes, workers)):
+        yield {"z": float(z), "height": float(height), "contours": layer_contours}
+
+
+def slice_schedules(index, schedules, workers=None):
+    """
+    Slicing condiviso delle quote di più programmi di layer
+
+    I piani di tutti i programmi sono riuniti (le quote coincidenti, ad
+    esempio con la stessa altezza del layer, sono affettate una volta sola)
+    e intersecati in un unico passaggio a blocchi; i contorni di un piano
+    sono condivisi tra i programmi che lo usano.
+
+    Args:
+        index: TriangleZIndex del mesh
+        schedules: Lista di tuple (layer_z, planes) come da layer_planes
+        workers: Processi da usare (vedi iter_sliced_layers)
+
+    Returns:
+        Per ogni programma, la lista dei layer nel formato di
+        iter_sliced_layers, con in più la quota 'plane' del piano di taglio
+        (uguale per i layer che condividono i contorni)
+    """
+    if not schedules:
+        return []
+    if workers is None:
+        workers = default_workers()
+    all_planes = np.concatenate([np.asarray(planes, dtype=np.float64) for _, planes in schedules])
+    union, inverse = np.unique(np.round(all_planes, 9), return_inverse=True)
+    contours = list(iter_layers(index, union, workers))
+
+    result = []
+    begin = 0
+    for layer_z, planes in schedules:
+        heights = np.diff(layer_z, prepend=0.0)
+        rows = inverse[begin:begin + len(planes)]
+        begin += len(planes)
+        result.append([
+            {"z": float(z), "height": float(height), "plane": float(union[row]), "contours": contours[row]}
+            for z, height, row in zip(layer_z, heights, rows)
+        ])
+    return result
+
+
+def slice_mesh(mesh, layer_height, index=None, workers=None):
+    """
+    Esegue lo slicing completo del mesh
+
+    Args:
+        mesh: Oggetto trimesh contenente il modello 3D
+        layer_height: Altezza del layer in mm
+        index: TriangleZIndex già costruito per il mesh (opzionale)
+        workers: Processi da usare (vedi iter_sliced_layers)
+
+    Returns:
+        Lista di dizionari, uno per layer, con la quota 'z' (rispetto al
+        piatto) e i 'contours' del layer
+    """
+    return list(iter_sliced_layers(mesh, layer_height, index=index, workers=workers))
@@ -0,0 +1,172 @@
+"""
+Caricamento diretto dei file STL dal buffer di upload
+
+Il formato binario è mappato senza copie con un dtype strutturato NumPy sui
+record da 50 byte; il formato ASCII è letto a blocchi con un'espressione
+regolare sui soli vertici. Nessun file temporaneo, nessun tentativo multiplo.
+"""
+import re
+
+import numpy as np
+import trimesh
+
+# Record binario STL: normale, tre vertici, attributo (50 byte)
+STL_RECORD_DTYPE = np.dtype([
+    ('normal', '<f4', (3,)),
+    ('vertices', '<f4', (3, 3)),
+    ('attributes', '<u2'),
+])
+
+STL_HEADER_SIZE = 80
+
+# Dimensione dei blocchi letti dal parser ASCII
+ASCII_CHUNK_SIZE = 4 * 1024 * 1024
+
+_VERTEX_RE = re.compile(rb'vertex\s+(\S+)\s+(\S+)\s+(\S+)')
+
+
+class STLFormatError(ValueError):
+    """File STL non leggibile o corrotto"""
+
+
+def is_binary_stl(data):
+    """
+    Determina se il buffer contiene un STL binario
+
+    Il controllo si basa sulla dimensione attesa (84 + 50 * triangoli) e non
+    sul prefisso "solid", che molti esportatori scrivono anche nei binari.
+    """
+    if len(data) < STL_HEADER_SIZE + 4:
+        return False
+    count = int(np.frombuffer(data, dtype='<u4', count=1, offset=STL_HEADER_SIZE)[0])
+    return len(data) == STL_HEADER_SIZE + 4 + count * STL_RECORD_DTYPE.itemsize
+
+
+def parse_binary_stl(data):
+    """
+    Mappa i triangoli di un STL binario senza copiare il buffer
+
+    Returns:
+        Vista (F, 3, 3) float32 dei vertici dei triangoli
+    """
+    count = int(np.frombuffer(data, dtype='<u4', count=1, offset=STL_HEADER_SIZE)[0])
+    records = np.frombuffer(
+        data, dtype=STL_RECORD_DTYPE, count=count, offset=STL_HEADER_SIZE + 4
+    )
+    return records['vertices']
+
+
+def parse_ascii_stl(data, chunk_size=ASCII_CHUNK_SIZE):
+    """
+    Legge i triangoli di un STL ASCII a blocchi
+
+    Ogni blocco termina su un fine riga; il resto della riga viene passato
+    al blocco successivo, così la memoria temporanea resta limitata.
+
+    Returns:
+        Array (F, 3, 3) float32 dei vertici dei triangoli
+    """
+    view = memoryview(data)
+    parts = []
+    remainder = b''
+    for begin in range(0, len(view), chunk_size):
+        block = remainder + bytes(view[begin:begin + chunk_size])
+        last = begin + chunk_size >= len(view)
+        cut = len(block) if last else block.rfind(b'\n') + 1
+        remainder = block[cut:]
+        matches = _VERTEX_RE.findall(block, 0, cut)
+        if matches:
+            parts.append(np.array(matches).astype(np.float32))
+
+    if not parts:
+        raise STLFormatError("Nessun vertice trovato nel file STL ASCII")
+
+    vertices = np.concatenate(parts)
+    if len(vertices) % 3 != 0:
+        raise STLFormatError("Numero di vertici non multiplo di 3 nel file STL ASCII")
+    return vertices.reshape(-1, 3, 3)
+
+
+def parse_stl(data):
+    """
+    Legge i triangoli di un file STL (binario o ASCII)
+
+    Args:
+        data: Contenuto del file (bytes, bytearray o memoryview)
+
+    Returns:
+        Array (F, 3, 3) float32 dei vertici dei triangoli
+
+    Raises:
+        STLFormatError: se il file non è un STL valido
+    """
+    if len(data) == 0:
+        raise STLFormatError("File STL vuoto")
+
+    if is_binary_stl(data):
+        triangles = parse_binary_stl(data)
+    elif bytes(data[:5]).lower() == b'solid':
+        try:
+            triangles = parse_ascii_stl(data)
+        except ValueError as e:
+            if isinstance(e, STLFormatError):
+                raise
+            raise STLFormatError(f"Coordinate non valide nel file STL ASCII: {e}")
+    else:
+        raise STLFormatError(
+            "Formato STL non riconosciuto: dimensione non coerente con un STL "
+            "binario e intestazione 'solid' assente"
+        )
+
+    if len(triangles) == 0:
+        raise STLFormatError("Il file STL non contiene triangoli")
+    if not np.isfinite(triangles).all():
+        raise STLFormatError("Il file STL contiene coordinate non finite")
+    return triangles
+
+
+def merge_vertices(triangles):
+    """
+    Unisce i vertici coincidenti in modo vettoriale
+
+    Args:
+        triangles: Array (F, 3, 3) dei vertici dei triangoli
+
+    Returns:
+        Tupla (vertices, faces) con vertici unici float32 (V, 3) e indici
+        int32 (F, 3)
+    """
+    flat = np.ascontiguousarray(triangles, dtype=np.float32).reshape(-1, 3)
+    order = np.lexsort((flat[:, 2], flat[:, 1], flat[:, 0]))
+    sorted_vertices = flat[order]
+    new_vertex = np.empty(len(flat), dtype=bool)
+    new_vertex[0] = True
+    new_vertex[1:] = np.any(sorted_vertices[1:] != sorted_vertices[:-1], axis=1)
+
+    ids = np.empty(len(flat), dtype=np.int32)
+    ids[order] = np.cumsum(new_vertex) - 1
+    return sorted_vertices[new_vertex], ids.reshape(-1, 3)
+
+
+def load_mesh(data, merge=True):
+    """
+    Crea un oggetto trimesh da un buffer STL
+
+    Args:
+        data: Contenuto del file STL
+        merge: Se True unisce i vertici coincidenti (necessario per i
+            controlli topologici come is_watertight)
+
+    Returns:
+        Oggetto trimesh.Trimesh
+
+    Raises:
+        STLFormatError: se il file non è un STL valido
+    """
+    triangles = parse_stl(data)
+    if merge:
+        vertices, faces = merge_vertices(triangles)
+    else:
+        vertices = triangles.reshape(-1, 3)
+        faces = np.arange(len(vertices), dtype=np.int32).reshape(-1, 3)
+    return trimesh.Trimesh(vertices=vertices, faces=faces, process=False)
@@ -0,0 +1,141 @@
+"""
+Archivio dei G-code: indice, scadenza, quota e pulizia in background
+
+Eseguire dalla directory api con: python -m unittest discover tests
+"""
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+
+from artifact_store import ArtifactStore, Sweeper  # noqa: E402
+
+MAX_AGE = 1000
+
+
+def age(path, seconds):
+    """Porta indietro di seconds la data di modifica del file"""
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+class ArtifactStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = ArtifactStore(self.directory, max_bytes=10 ** 9, max_age=MAX_AGE)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def add(self, artifact_id, size=1000):
+        """Scrive e registra un G-code di size byte (poco comprimibili)"""
+        content = os.urandom(size // 2).hex().encode()
+        with gzip.open(self.store.path_for(artifact_id), 'wb') as f:
+            f.write(content)
+        return self.store.register(artifact_id, f"{artifact_id}.gcode", 'hash', {"layers": 1}, len(content))
+
+    def meta_path(self, artifact_id):
+        return os.path.join(self.store.directory, artifact_id[:2], f"{artifact_id}.json")
+
+    def test_register_and_get(self):
+        meta = self.add('0123abcd-0001')
+        found = self.store.get('0123abcd-0001')
+        self.assertEqual(found['filename'], '0123abcd-0001.gcode')
+        self.assertEqual(found['size'], os.path.getsize(found['path']))
+        self.assertEqual(found['content_length'], 1000)
+        self.assertEqual(found['params_hash'], 'hash')
+        self.assertEqual(found['stats'], {"layers": 1})
+        self.assertTrue(found['path'].endswith(os.path.join('01', '0123abcd-0001.gcode.gz')))
+        self.assertEqual(self.store.stats()['bytes'], meta['size'])
+
+    def test_invalid_or_missing(self):
+        for artifact_id in ('', '../etc/passwd', 'ZZZZZZZZ', None, 'abcdef01-missing'):
+            with self.subTest(artifact_id=artifact_id):
+                self.assertIsNone(self.store.get(artifact_id))
+
+    def test_touch(self):
+        self.add('aaaa0000-0001')
+        age(self.meta_path('aaaa0000-0001'), MAX_AGE / 2)
+        meta = self.store.get('aaaa0000-0001', touch=False)
+        self.assertLess(meta['last_accessed'], time.time() - MAX_AGE / 4)
+        self.assertLess(os.path.getmtime(self.meta_path('aaaa0000-0001')), time.time() - MAX_AGE / 4)
+        self.store.get('aaaa0000-0001')
+        self.assertGreater(os.path.getmtime(self.meta_path('aaaa0000-0001')), time.time() - 10)
+
+    def test_expiry(self):
+        self.add('bbbb0000-0001')
+        self.add('bbbb0000-0002')
+        age(self.meta_path('bbbb0000-0001'), 2 * MAX_AGE)
+        # Scaduto ma non ancora rimosso: la richiesta non lo vede
+        self.assertIsNone(self.store.get('bbbb0000-0001'))
+        self.assertEqual(self.store.sweep(), 1)
+        self.assertFalse(os.path.exists(self.meta_path('bbbb0000-0001')))
+        self.assertIsNotNone(self.store.get('bbbb0000-0002'))
+        self.assertEqual(self.store.stats()['evictions'], 1)
+
+    def test_quota_removes_least_recently_used(self):
+        sizes = {}
+        for n, artifact_id in enumerate(('cccc0000-0001', 'cccc0000-0002', 'cccc0000-0003')):
+            sizes[artifact_id] = self.add(artifact_id)['size']
+            age(self.meta_path(artifact_id), 100 - n)
+        # Il più vecchio viene usato di nuovo: esce il secondo
+        self.store.get('cccc0000-0001')
+        self.store.max_bytes = sizes['cccc0000-0001'] + sizes['cccc0000-0003']
+        self.assertEqual(self.store.sweep(), 1)
+        self.assertIsNone(self.store.get('cccc0000-0002'))
+        self.assertIsNotNone(self.store.get('cccc0000-0001'))
+        self.assertIsNotNone(self.store.get('cccc0000-0003'))
+        self.assertEqual(self.store.stats()['bytes'], self.store.max_bytes)
+
+    def test_over_quota_wakes_sweeper(self):
+        self.store.sweeper = mock.Mock()
+        self.store.max_bytes = self.add('dddd0000-0001')['size'] + 100
+        self.store.sweeper.wake.assert_not_called()
+        self.add('dddd0000-0002')
+        self.store.sweeper.wake.assert_called_once_with()
+
+    def test_incomplete_files(self):
+        # G-code mai registrato e scrittura interrotta: rimossi solo se vecchi
+        shard = os.path.join(self.store.directory, 'ee')
+        orphan = self.store.path_for('eeee0000-0001')
+        with gzip.open(orphan, 'wb') as f:
+            f.write(b'G1 X0\n')
+        tmp = os.path.join(shard, 'eeee0000-0002.json.1.2.tmp')
+        with open(tmp, 'w') as f:
+            f.write('{')
+        self.store.sweep()
+        self.assertTrue(os.path.exists(orphan))
+        self.assertTrue(os.path.exists(tmp))
+
+        age(orphan, 2 * MAX_AGE)
+        age(tmp, 2 * MAX_AGE)
+        self.store.sweep()
+        self.assertFalse(os.path.exists(orphan))
+        self.assertFalse(os.path.exists(tmp))
+
+
+class SweeperTest(unittest.TestCase):
+
+    def test_failing_task_does_not_stop_the_others(self):
+        calls = []
+
+        def failing():
+            calls.append('failing')
+            raise OSError("disco non disponibile")
+
+        sweeper = Sweeper(60, [failing, lambda: calls.append('next')])
+        with self.assertLogs('artifact_store', 'ERROR'):
+            sweeper.run_once()
+        self.assertEqual(calls, ['failing', 'next'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+"""
+Download dei G-code: gzip, richieste condizionali (ETag) e Range
+
+Eseguire dalla directory api con: python -m unittest discover tests
+"""
+import gzip
+import io
+import json
+import os
+import sys
+import unittest
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+
+from app import app  # noqa: E402
+
+TEST_STL = os.path.join(API_DIR, '..', 'assets', 'models', 'test_cube.stl')
+
+IDENTITY = {'Accept-Encoding': 'identity'}
+GZIP = {'Accept-Encoding': 'gzip'}
+
+
+class DownloadTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = app.test_client()
+        with open(TEST_STL, 'rb') as f:
+            data = {'file': (io.BytesIO(f.read()), 'test_cube.stl'), 'params': json.dumps({})}
+        response = cls.client.post('/api/slice', data=data)
+        assert response.status_code == 200, response.get_data(as_text=True)
+        cls.url = response.get_json()['download_url']
+        cls.gcode_id = response.get_json()['gcode_id']
+        cls.gcode = cls.client.get(cls.url, headers=IDENTITY, buffered=True).data
+
+    def get(self, headers):
+        return self.client.get(self.url, headers=headers, buffered=True)
+
+    def test_identity(self):
+        response = self.get(IDENTITY)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.content_length, len(self.gcode))
+        self.assertEqual(response.get_etag(), (self.gcode_id, False))
+        self.assertIn('Accept-Encoding', response.vary)
+        self.assertTrue(self.gcode.startswith(b';'))
+
+    def test_gzip(self):
+        response = self.get(GZIP)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.content_length, len(response.data))
+        self.assertEqual(response.get_etag(), (f"{self.gcode_id}-gzip", False))
+        self.assertEqual(gzip.decompress(response.data), self.gcode)
+
+    def test_not_modified(self):
+        for headers in (IDENTITY, GZIP):
+            etag = self.get(headers).headers['ETag']
+            with self.subTest(headers=headers, condition='If-None-Match'):
+                response = self.get({**headers, 'If-None-Match': etag})
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.data, b'')
+            with self.subTest(headers=headers, condition='If-Modified-Since'):
+                last_modified = self.get(headers).headers['Last-Modified']
+                self.assertEqual(self.get({**headers, 'If-Modified-Since': last_modified}).status_code, 304)
+
+        # L'ETag di una rappresentazione non vale per l'altra
+        etag = self.get(GZIP).headers['ETag']
+        self.assertEqual(self.get({**IDENTITY, 'If-None-Match': etag}).status_code, 200)
+
+    def test_range(self):
+        response = self.get({**IDENTITY, 'Range': 'bytes=10-19'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.headers['Content-Range'], f"bytes 10-19/{len(self.gcode)}")
+        self.assertEqual(response.data, self.gcode[10:20])
+
+        response = self.get({**IDENTITY, 'Range': 'bytes=-50'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, self.gcode[-50:])
+
+    def test_range_on_gzip(self):
+        # Il Range si applica ai byte compressi inviati
+        compressed = self.get(GZIP).data
+        response = self.get({**GZIP, 'Range': 'bytes=100-'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.headers['Content-Range'], f"bytes 100-{len(compressed) - 1}/{len(compressed)}")
+        self.assertEqual(response.data, compressed[100:])
+
+    def test_if_range(self):
+        etag = self.get(IDENTITY).headers['ETag']
+        response = self.get({**IDENTITY, 'Range': 'bytes=0-9', 'If-Range': etag})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, self.gcode[:10])
+
+        # ETag diverso: la rappresentazione è cambiata, si invia tutto
+        response = self.get({**IDENTITY, 'Range': 'bytes=0-9', 'If-Range': '"altro"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, self.gcode)
+
+    def test_range_not_satisfiable(self):
+        response = self.get({**IDENTITY, 'Range': f"bytes={len(self.gcode) + 10}-"})
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response.headers['Content-Range'], f"bytes */{len(self.gcode)}")
+
+    def test_unknown_artifact(self):
+        self.assertEqual(self.client.get('/api/download/sconosciuto').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
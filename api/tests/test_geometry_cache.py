@@ -0,0 +1,114 @@
+"""
+Cache della geometria: riuso dei percorsi quando cambiano solo i parametri di emissione
+
+Eseguire dalla directory api con: python -m unittest discover tests
+"""
+import io
+import json
+import os
+import random
+import sys
+import unittest
+
+import numpy as np
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+
+import app as app_module  # noqa: E402
+from app import DEFAULT_PARAMS, EMISSION_PARAMS, app, geometry_key, iter_cached_toolpaths, iter_toolpaths  # noqa: E402
+
+TEST_STL = os.path.join(API_DIR, '..', 'assets', 'models', 'test_cube.stl')
+
+MESH_ID = '0' * 64
+
+# Solo temperature, velocità, ritrazione e archi diversi
+EMISSION_CHANGES = {
+    "nozzle_temp": 230, "bed_temp": 80, "print_speed": 35, "retraction_distance": 2.0,
+    "retraction_speed": 30.0, "arc_fitting": True, "arc_tolerance": 0.1,
+}
+
+
+def changed(value):
+    """Un valore valido diverso da quello predefinito"""
+    if isinstance(value, bool):
+        return not value
+    if isinstance(value, str):
+        return 'lines' if value != 'lines' else 'grid'
+    return value + 1
+
+
+class GeometryKeyTest(unittest.TestCase):
+
+    def test_emission_params_are_ignored(self):
+        self.assertEqual(set(EMISSION_CHANGES), set(EMISSION_PARAMS))
+        self.assertEqual(geometry_key(MESH_ID, {}), geometry_key(MESH_ID, EMISSION_CHANGES))
+
+    def test_geometry_params_change_the_key(self):
+        for key, value in DEFAULT_PARAMS.items():
+            if key in EMISSION_PARAMS:
+                continue
+            with self.subTest(key=key):
+                self.assertNotEqual(geometry_key(MESH_ID, {}), geometry_key(MESH_ID, {key: changed(value)}))
+
+    def test_mesh_changes_the_key(self):
+        self.assertNotEqual(geometry_key(MESH_ID, {}), geometry_key('1' * 64, {}))
+
+
+class GeometryReuseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = app.test_client()
+        with open(TEST_STL, 'rb') as f:
+            self.stl = f.read()
+        # Densità casuale: geometria non ancora in cache, nemmeno su disco
+        # da esecuzioni precedenti
+        self.params = {"infill_density": round(random.uniform(10, 90), 6), "perimeters": 1}
+
+    def slice(self, params):
+        data = {'file': (io.BytesIO(self.stl), 'test_cube.stl'), 'params': json.dumps(params)}
+        response = self.client.post('/api/slice', data=data)
+        self.assertEqual(response.status_code, 200, response.get_data(as_text=True))
+        return response.get_json()
+
+    def test_emission_change_reuses_geometry(self):
+        first = self.slice(self.params)
+        before = app_module.geometry_cache.stats()
+
+        params = {**self.params, **EMISSION_CHANGES}
+        second = self.slice(params)
+        after = app_module.geometry_cache.stats()
+        self.assertFalse(second['cached'])
+        self.assertNotEqual(first['gcode_id'], second['gcode_id'])
+        self.assertEqual(after['hits'], before['hits'] + 1)
+        self.assertEqual(after['misses'], before['misses'])
+
+        # I percorsi riletti, con le nuove velocità, sono quelli generati da zero
+        entry = app_module.mesh_store.get(second['mesh_id'])
+        cached = list(iter_cached_toolpaths(entry, params))
+        fresh = list(iter_toolpaths(entry.mesh, params, index=entry.index))
+        self.assertEqual([z for z, _ in cached], [z for z, _ in fresh])
+        for (z, reused), (_, generated) in zip(cached, fresh):
+            with self.subTest(z=z):
+                self.assertEqual(reused is None, generated is None)
+                if reused is None:
+                    continue
+                for column, expected in zip(reused.columns(), generated.columns()):
+                    np.testing.assert_array_equal(column, expected)
+                self.assertEqual(reused.feed_labels, generated.feed_labels)
+
+        gcode = self.client.get(second['download_url'], headers={'Accept-Encoding': 'identity'}, buffered=True)
+        self.assertIn(b'M104 S230', gcode.data)
+        self.assertIn(f"F{EMISSION_CHANGES['print_speed'] * 60}".encode(), gcode.data)
+
+    def test_geometry_change_misses(self):
+        self.slice(self.params)
+        before = app_module.geometry_cache.stats()
+        self.slice({**self.params, "layer_height": 0.25})
+        after = app_module.geometry_cache.stats()
+        self.assertEqual(after['hits'], before['hits'])
+        self.assertEqual(after['misses'], before['misses'] + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
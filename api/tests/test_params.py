@@ -0,0 +1,173 @@
+"""
+Validazione dei parametri di stampa: tipo e intervallo dei parametri numerici
+
+Eseguire dalla directory api con: python -m unittest discover tests
+"""
+import io
+import json
+import os
+import sys
+import unittest
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+
+from app import BOOLEAN_PARAMS, DEFAULT_PARAMS, PARAM_RANGES, app, params_error  # noqa: E402
+from slicer import compute_layer_planes  # noqa: E402
+
+TEST_STL = os.path.join(API_DIR, '..', 'assets', 'models', 'test_cube.stl')
+
+
+class ComputeLayerPlanesTest(unittest.TestCase):
+
+    def test_negative_layer_height(self):
+        with self.assertRaises(ValueError):
+            compute_layer_planes(0.0, 10.0, -0.2)
+
+    def test_zero_layer_height(self):
+        with self.assertRaises(ValueError):
+            compute_layer_planes(0.0, 10.0, 0)
+
+    def test_positive_layer_height(self):
+        layer_z, planes = compute_layer_planes(0.0, 1.0, 0.2)
+        self.assertEqual(len(layer_z), 5)
+        self.assertGreater(layer_z.min(), 0)
+
+
+# Valori non validi per ogni parametro numerico, oltre a quelli non numerici
+# controllati per tutte le chiavi di PARAM_RANGES
+INVALID_VALUES = {
+    'layer_height': [0, -0.2],
+    'infill_density': [-5, 101],
+    'perimeters': [-1, 1.5],
+    'adaptive_min_height': [0, -0.1],
+    'adaptive_max_height': [0, -0.3],
+    'adaptive_tolerance': [0, -0.15],
+    'nozzle_temp': [-1, 401],
+    'bed_temp': [-1, 151],
+    'print_speed': [0, -60],
+    'retraction_distance': [-0.5],
+    'retraction_speed': [0, -45],
+    'arc_tolerance': [0, -1],
+    'travel_2opt_ms': [-1],
+}
+
+NOT_NUMBERS = ["x", "", None, True, [1], {"value": 1}, float('nan'), float('inf')]
+
+
+class ParamsErrorTest(unittest.TestCase):
+
+    def test_every_range_is_covered(self):
+        self.assertEqual(set(INVALID_VALUES), set(PARAM_RANGES))
+
+    def test_every_parameter_has_a_rule(self):
+        for key, value in DEFAULT_PARAMS.items():
+            with self.subTest(key=key):
+                if isinstance(value, bool):
+                    self.assertIn(key, BOOLEAN_PARAMS)
+                elif isinstance(value, (int, float)):
+                    self.assertIn(key, PARAM_RANGES)
+
+    def test_invalid_values(self):
+        for key, values in INVALID_VALUES.items():
+            for value in values + NOT_NUMBERS:
+                with self.subTest(key=key, value=value):
+                    error = params_error({key: value})
+                    self.assertIsNotNone(error)
+                    self.assertIn(key, error)
+
+    def test_defaults_are_valid(self):
+        self.assertIsNone(params_error({}))
+        self.assertIsNone(params_error({key: DEFAULT_PARAMS[key] for key in PARAM_RANGES}))
+
+    def test_boundaries(self):
+        self.assertIsNone(params_error({"retraction_distance": 0, "nozzle_temp": 400, "bed_temp": 0}))
+
+    def test_boolean_switches(self):
+        for key in BOOLEAN_PARAMS:
+            with self.subTest(key=key):
+                self.assertIsNone(params_error({key: True}))
+                self.assertIsNone(params_error({key: False}))
+                for value in ("false", 1, None):
+                    self.assertIn(key, params_error({key: value}))
+
+    def test_infill_pattern(self):
+        self.assertIsNone(params_error({"infill_pattern": "Triangles"}))
+        for value in ("hex", "", 1, None):
+            with self.subTest(value=value):
+                error = params_error({"infill_pattern": value})
+                self.assertIn('infill_pattern', error)
+                self.assertIn('grid', error)
+
+    def test_adaptive_heights_order(self):
+        self.assertIsNone(params_error({"adaptive_min_height": 0.2, "adaptive_max_height": 0.2}))
+        for params in ({"adaptive_min_height": 0.3, "adaptive_max_height": 0.1},
+                       {"adaptive_min_height": 0.4}, {"adaptive_max_height": 0.05}):
+            with self.subTest(params=params):
+                self.assertIn('adaptive_min_height', params_error(params))
+
+    def test_not_an_object(self):
+        self.assertIsNotNone(params_error([0.2]))
+
+
+class ParamsValidationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = app.test_client()
+        with open(TEST_STL, 'rb') as f:
+            self.stl = f.read()
+
+    def post(self, path, params, **fields):
+        data = {'file': (io.BytesIO(self.stl), 'test_cube.stl'), 'params': json.dumps(params)}
+        data.update(fields)
+        return self.client.post(path, data=data)
+
+    def assert_rejected(self, path, params, key, **fields):
+        response = self.post(path, params, **fields)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(key, response.get_json()['error'])
+
+    def test_negative_layer_height(self):
+        for path in ('/api/slice', '/api/slice/stream', '/api/preview', '/api/preview/layers', '/api/jobs'):
+            with self.subTest(path=path):
+                self.assert_rejected(path, {"layer_height": -0.2}, 'layer_height')
+
+    def test_zero_layer_height(self):
+        for path in ('/api/slice', '/api/slice/stream', '/api/preview', '/api/preview/layers', '/api/jobs'):
+            with self.subTest(path=path):
+                self.assert_rejected(path, {"layer_height": 0}, 'layer_height')
+
+    def test_zero_print_speed(self):
+        for path in ('/api/slice', '/api/preview'):
+            with self.subTest(path=path):
+                self.assert_rejected(path, {"print_speed": 0}, 'print_speed')
+
+    def test_non_numeric_values(self):
+        # Un tempo il valore finiva così com'era nel G-code ('M104 Sx') o
+        # faceva fallire la richiesta con un 500
+        for key in ('nozzle_temp', 'retraction_distance', 'infill_density', 'perimeters'):
+            with self.subTest(key=key):
+                self.assert_rejected('/api/slice', {key: "x"}, key)
+
+    def test_unknown_infill_pattern(self):
+        self.assert_rejected('/api/slice', {"infill_pattern": "hex"}, 'infill_pattern')
+
+    def test_adaptive_heights(self):
+        for params in ({"adaptive_layers": True, "adaptive_min_height": 0},
+                       {"adaptive_layers": True, "adaptive_min_height": 0.3, "adaptive_max_height": 0.1}):
+            with self.subTest(params=params):
+                self.assert_rejected('/api/slice', params, 'adaptive_min_height')
+
+    def test_sweep_rejects_invalid_variant(self):
+        self.assert_rejected('/api/slice/sweep', [{"layer_height": 0.2}, {"layer_height": 0}], 'layer_height')
+
+    def test_plate_rejects_invalid_params(self):
+        self.assert_rejected('/api/slice/plate', {"layer_height": -0.2}, 'layer_height')
+
+    def test_valid_params(self):
+        response = self.post('/api/preview', {"layer_height": 0.2, "print_speed": 50})
+        self.assertEqual(response.status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
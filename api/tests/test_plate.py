@@ -0,0 +1,161 @@
+"""
+Disposizione dei pezzi sul piatto: impacchettamento a ripiani e rotazione
+
+Eseguire dalla directory api con: python -m unittest discover tests
+"""
+import io
+import json
+import os
+import sys
+import unittest
+
+import numpy as np
+import trimesh
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+
+from app import PLATE_DEPTH, PLATE_MARGIN, PLATE_SPACING, PLATE_WIDTH, app  # noqa: E402
+from plate import PlateFullError, arrange_plate, pack_rectangles  # noqa: E402
+
+TEST_STL = os.path.join(API_DIR, '..', 'assets', 'models', 'test_cube.stl')
+
+
+def footprints(sizes, placements):
+    """Rettangoli (x0, y0, x1, y1) occupati, con i lati scambiati se ruotati"""
+    rectangles = []
+    for (w, d), (x, y, rotated) in zip(sizes, placements):
+        if rotated:
+            w, d = d, w
+        rectangles.append((x, y, x + w, y + d))
+    return rectangles
+
+
+def layout_errors(rectangles, width, depth, spacing):
+    """Rettangoli fuori dall'area o a meno di spacing da un altro"""
+    errors = [
+        f"{r} fuori dall'area" for r in rectangles
+        if min(r[0], r[1]) < 0 or r[2] > width + 1e-9 or r[3] > depth + 1e-9
+    ]
+    for a, first in enumerate(rectangles):
+        for second in rectangles[a + 1:]:
+            apart = (first[2] + spacing <= second[0] + 1e-9 or second[2] + spacing <= first[0] + 1e-9
+                     or first[3] + spacing <= second[1] + 1e-9 or second[3] + spacing <= first[1] + 1e-9)
+            if not apart:
+                errors.append(f"{first} e {second} a meno di {spacing} mm")
+    return errors
+
+
+class PackRectanglesTest(unittest.TestCase):
+
+    def test_random_layouts(self):
+        rng = np.random.default_rng(22)
+        for trial in range(30):
+            sizes = [tuple(rng.uniform(2, 40, 2)) for _ in range(int(rng.integers(1, 20)))]
+            with self.subTest(trial=trial):
+                placements = pack_rectangles(sizes, 200, 200, 2)
+                self.assertEqual(len(placements), len(sizes))
+                self.assertEqual(layout_errors(footprints(sizes, placements), 200, 200, 2), [])
+
+    def test_rotation(self):
+        # Lato lungo lungo X, se ci sta
+        placements = pack_rectangles([(10, 30), (30, 10), (5, 150)], 100, 200, 2)
+        self.assertEqual([rotated for _, _, rotated in placements], [True, False, False])
+        self.assertEqual(layout_errors(footprints([(10, 30), (30, 10), (5, 150)], placements), 100, 200, 2), [])
+
+    def test_shelves(self):
+        # Tre pezzi 40 x 20 in un'area larga 90: due sul primo ripiano, uno sopra
+        placements = pack_rectangles([(40, 20)] * 3, 90, 100, 5)
+        self.assertEqual(placements, [(0.0, 0.0, False), (45.0, 0.0, False), (0.0, 25.0, False)])
+
+    def test_tallest_first(self):
+        placements = pack_rectangles([(10, 5), (20, 12)], 100, 100, 1)
+        self.assertEqual(placements, [(21.0, 0.0, False), (0.0, 0.0, False)])
+
+    def test_plate_full(self):
+        with self.assertRaises(PlateFullError):
+            pack_rectangles([(120, 10)], 100, 100, 2)
+        with self.assertRaises(PlateFullError):
+            pack_rectangles([(60, 60)] * 2, 100, 100, 2)
+        # Non ruotato se il lato lungo non entra in larghezza
+        with self.assertRaises(PlateFullError):
+            pack_rectangles([(5, 150)], 100, 100, 2)
+
+
+class ArrangePlateTest(unittest.TestCase):
+
+    def test_rotated_copy(self):
+        box = trimesh.creation.box(extents=(10, 30, 5))
+        cube = trimesh.creation.box(extents=(8, 8, 8))
+        plate, layout = arrange_plate([box, cube], [2, 1], 120, 120, 3, 10)
+
+        self.assertEqual([(p['part'], p['copy']) for p in layout], [(0, 0), (0, 1), (1, 0)])
+        self.assertEqual([p['rotated'] for p in layout], [True, True, False])
+        self.assertEqual([(p['width'], p['depth']) for p in layout], [(30, 10), (30, 10), (8, 8)])
+        self.assertEqual(len(plate.faces), 2 * len(box.faces) + len(cube.faces))
+
+        # Rotazione, non riflessione: volume invariato e positivo
+        self.assertAlmostEqual(plate.volume, 2 * box.volume + cube.volume)
+        self.assertAlmostEqual(plate.bounds[0][2], 0.0)
+
+        # Ogni pezzo occupa esattamente il suo ingombro, dentro l'area utile
+        offset = 0
+        for part in layout:
+            mesh = (box, cube)[part['part']]
+            piece = plate.vertices[offset:offset + len(mesh.vertices)]
+            offset += len(mesh.vertices)
+            np.testing.assert_allclose(piece.min(axis=0), [part['x'], part['y'], 0], atol=1e-9)
+            np.testing.assert_allclose(
+                piece.max(axis=0), [part['x'] + part['width'], part['y'] + part['depth'], mesh.extents[2]], atol=1e-9
+            )
+            self.assertGreaterEqual(min(part['x'], part['y']), 10)
+            self.assertLessEqual(max(part['x'] + part['width'], part['y'] + part['depth']), 110)
+
+    def test_plate_full(self):
+        with self.assertRaises(PlateFullError):
+            arrange_plate([trimesh.creation.box(extents=(50, 50, 5))], [4], 100, 100, 2, 5)
+
+
+class SlicePlateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = app.test_client()
+        with open(TEST_STL, 'rb') as f:
+            self.stl = f.read()
+
+    def post(self, copies, **fields):
+        data = {
+            'file': (io.BytesIO(self.stl), 'test_cube.stl'),
+            'params': json.dumps({}),
+            'copies': json.dumps(copies),
+        }
+        data.update(fields)
+        return self.client.post('/api/slice/plate', data=data)
+
+    def test_copies(self):
+        response = self.post([3])
+        self.assertEqual(response.status_code, 200, response.get_data(as_text=True))
+        plate = response.get_json()['stats']['plate']
+        self.assertEqual(plate['copies'], [3])
+        self.assertEqual([p['copy'] for p in plate['parts']], [0, 1, 2])
+        rectangles = [(p['x'], p['y'], p['x'] + p['width'], p['y'] + p['depth']) for p in plate['parts']]
+        self.assertEqual(layout_errors(
+            [(x0 - PLATE_MARGIN, y0 - PLATE_MARGIN, x1 - PLATE_MARGIN, y1 - PLATE_MARGIN) for x0, y0, x1, y1 in rectangles],
+            PLATE_WIDTH - 2 * PLATE_MARGIN, PLATE_DEPTH - 2 * PLATE_MARGIN, PLATE_SPACING,
+        ), [])
+
+        # Stesso piatto: G-code dalla cache
+        again = self.post([3])
+        self.assertTrue(again.get_json()['cached'])
+        self.assertEqual(again.get_json()['gcode_id'], response.get_json()['gcode_id'])
+
+    def test_invalid_copies(self):
+        for copies in ([0], [1, 1], ["2"], [1.5], {"copies": 1}):
+            with self.subTest(copies=copies):
+                response = self.post(copies)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('copies', response.get_json()['error'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+"""
+Offset dei contorni: confronto con l'erosione calcolata per campionamento
+
+Eseguire dalla directory api con: python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+import numpy as np
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+
+from polygon_offset import MITER_LIMIT, offset_polygons, perimeter_shells  # noqa: E402
+
+# Passo (mm) della griglia di campionamento
+STEP = 0.05
+
+
+def star(tips, outer, inner, phase=0.0):
+    """Stella chiusa con punte a raggio outer e rientranze a raggio inner"""
+    angle = phase + np.arange(2 * tips) * np.pi / tips
+    radius = np.where(np.arange(2 * tips) % 2 == 0, outer, inner)
+    points = np.column_stack([radius * np.cos(angle), radius * np.sin(angle)])
+    return np.vstack([points, points[:1]])
+
+
+def area(loops):
+    return sum(
+        0.5 * float(np.sum(loop[:-1, 0] * loop[1:, 1] - loop[1:, 0] * loop[:-1, 1])) for loop in loops
+    )
+
+
+def inside(points, loops):
+    """Punti interni ai contorni chiusi (regola pari-dispari)"""
+    crossings = np.zeros(len(points), dtype=np.int64)
+    for loop in loops:
+        for start, end in zip(loop[:-1], loop[1:]):
+            if start[1] == end[1]:
+                continue
+            x = start[0] + (points[:, 1] - start[1]) * (end[0] - start[0]) / (end[1] - start[1])
+            crossings += ((start[1] > points[:, 1]) != (end[1] > points[:, 1])) & (points[:, 0] < x)
+    return crossings % 2 == 1
+
+
+def distance(points, polygon):
+    """Distanza dei punti dal contorno del poligono"""
+    starts, ends = polygon[:-1], polygon[1:]
+    vector = ends - starts
+    relative = points[:, None, :] - starts
+    t = np.clip(np.sum(relative * vector, axis=2) / np.sum(vector * vector, axis=1), 0, 1)
+    gap = relative - t[..., None] * vector
+    return np.hypot(gap[..., 0], gap[..., 1]).min(axis=1)
+
+
+class ErosionBoundsTest(unittest.TestCase):
+    """
+    L'offset verso l'interno di d sta dentro l'erosione (punti interni a
+    distanza almeno d dal contorno) e la contiene tranne vicino ai vertici,
+    dove gli spigoli vivi e tagliati tolgono al più MITER_LIMIT * d
+    """
+
+    def assert_within_erosion(self, polygon, d):
+        loops = offset_polygons([polygon], [d])[0]
+        low = polygon.min(axis=0) - STEP
+        high = polygon.max(axis=0) + STEP
+        grid = np.mgrid[low[0]:high[0]:STEP, low[1]:high[1]:STEP].reshape(2, -1).T + STEP / 3
+        clearance = distance(grid, polygon)
+        erosion = inside(grid, [polygon]) & (clearance >= d)
+        result = inside(grid, loops) if loops else np.zeros(len(grid), dtype=bool)
+        gap = grid[:, None, :] - polygon[:-1]
+        corner = np.hypot(gap[..., 0], gap[..., 1]).min(axis=1) < MITER_LIMIT * d
+
+        spurious = result & ~inside(grid, [polygon]) | result & (clearance < d - 1e-6)
+        self.assertFalse(spurious.any(), f"{spurious.sum()} punti dell'offset fuori dall'erosione")
+        missing = erosion & (clearance > d + 1e-6) & ~corner & ~result
+        self.assertFalse(missing.any(), f"{missing.sum()} punti dell'erosione mancanti")
+        self.assertLessEqual(area(loops), erosion.sum() * STEP ** 2 + 0.1)
+        return loops
+
+    def test_star_collapses(self):
+        # Un tempo restavano 0,31 e 1,10 mm² di anse spurie
+        for d in (2.2, 2.43):
+            with self.subTest(d=d):
+                self.assertEqual(offset_polygons([star(5, 3, 2)], [d]), [[]])
+
+    def test_ten_point_star(self):
+        # Un tempo 14,3 mm² a 1,5 e nulla a 2,3
+        polygon = star(10, 10, 4.34)
+        for d, expected in ((1.5, 26.4), (2.3, 13.5)):
+            with self.subTest(d=d):
+                loops = self.assert_within_erosion(polygon, d)
+                self.assertAlmostEqual(area(loops), expected, delta=0.2)
+
+    def test_random_stars(self):
+        rng = np.random.default_rng(18)
+        for _ in range(40):
+            tips = int(rng.integers(3, 9))
+            outer = rng.uniform(1, 3)
+            polygon = star(tips, outer, outer * rng.uniform(0.3, 0.9), rng.uniform(0, 2 * np.pi))
+            d = rng.uniform(0.2, 1.8)
+            with self.subTest(tips=tips, outer=outer, d=d):
+                self.assert_within_erosion(polygon, d)
+
+    def test_orientation_and_holes(self):
+        square = np.array([[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]], dtype=np.float64)
+        hole = square[::-1] * 0.4 + 3
+        loops = offset_polygons([hole, square[::-1]], [1.0])[0]
+        self.assertEqual(sorted(round(area([loop]), 6) for loop in loops), [-36.0, 64.0])
+
+    def test_outward_offset(self):
+        square = np.array([[0, 0], [4, 0], [4, 4], [0, 4], [0, 0]], dtype=np.float64)
+        loops = offset_polygons([square], [-1.0])[0]
+        self.assertEqual(len(loops), 1)
+        self.assertAlmostEqual(area(loops), 36.0)
+
+
+class PerimeterShellsTest(unittest.TestCase):
+
+    def test_small_star(self):
+        # Un tempo tre perimetri e 0,16 mm² di riempimento spurio
+        shells, inner = perimeter_shells([star(5, 1.8, 1.2)], 3, 0.45)
+        self.assertEqual(inner, [])
+        self.assertLessEqual(len(shells), 3)
+
+    def test_square(self):
+        square = np.array([[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]], dtype=np.float64)
+        shells, inner = perimeter_shells([square], 2, 0.5)
+        self.assertEqual([round(area(loops), 6) for loops in shells], [90.25, 72.25])
+        self.assertAlmostEqual(area(inner), 64.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
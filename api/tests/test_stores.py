@@ -0,0 +1,94 @@
+"""
+Archivio dei mesh e cache della geometria: ultimo accesso ed evict
+
+Eseguire dalla directory api con: python -m unittest discover tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+import numpy as np
+import trimesh
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+
+from geometry_cache import GeometryCache  # noqa: E402
+from mesh_store import MeshStore, mesh_id_for  # noqa: E402
+from toolpath import LayerToolpath  # noqa: E402
+
+MAX_AGE = 1000
+
+
+def age(path, seconds):
+    """Porta indietro di seconds la data di modifica del file"""
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+class MemoryHitTouchTest(unittest.TestCase):
+    """Le letture dalla memoria aggiornano la data usata da evict, con un limite di frequenza"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_mesh_store(self):
+        store = MeshStore(self.directory, max_items=4, max_age=MAX_AGE)
+        mesh = trimesh.creation.box()
+        mesh_id = mesh_id_for(b'box')
+        entry = store.put(mesh_id, mesh, {"triangles": len(mesh.faces)})
+        stats_path = store._paths(mesh_id)[2]
+
+        # Entro max_age / 10 dall'ultimo aggiornamento i file non sono toccati
+        age(stats_path, MAX_AGE / 2)
+        self.assertIs(store.get(mesh_id), entry)
+        self.assertGreater(time.time() - os.path.getmtime(stats_path), MAX_AGE / 4)
+
+        entry.touched -= MAX_AGE / 5
+        age(stats_path, 2 * MAX_AGE)
+        self.assertIs(store.get(mesh_id), entry)
+        self.assertLess(time.time() - os.path.getmtime(stats_path), MAX_AGE / 10)
+        store.evict()
+        self.assertTrue(os.path.exists(stats_path))
+
+        # Senza letture la voce scade
+        age(stats_path, 2 * MAX_AGE)
+        store.evict()
+        self.assertFalse(os.path.exists(stats_path))
+        self.assertIsNone(store.get(mesh_id))
+
+    def test_geometry_cache(self):
+        cache = GeometryCache(self.directory, max_items=4, max_age=MAX_AGE)
+        toolpath = LayerToolpath(0.2)
+        toolpath.add(0.0, 0.0, 0.0, 3000, 0)
+        toolpath.add(1.0, 0.0, 0.05, 1200, 1)
+        writer = cache.writer('key')
+        writer.add(0.2, toolpath)
+        geometry = writer.commit()
+        meta_path = cache._paths('key')[1]
+
+        age(meta_path, MAX_AGE / 2)
+        self.assertIs(cache.get('key'), geometry)
+        self.assertGreater(time.time() - os.path.getmtime(meta_path), MAX_AGE / 4)
+
+        geometry.touched -= MAX_AGE / 5
+        age(meta_path, 2 * MAX_AGE)
+        self.assertIs(cache.get('key'), geometry)
+        self.assertLess(time.time() - os.path.getmtime(meta_path), MAX_AGE / 10)
+        cache.evict()
+        self.assertTrue(cache.contains('key'))
+        np.testing.assert_array_equal(cache.get('key').records['x'], [0.0, 1.0])
+
+        age(meta_path, 2 * MAX_AGE)
+        cache.evict()
+        self.assertFalse(cache.contains('key'))
+
+
+if __name__ == '__main__':
+    unittest.main()
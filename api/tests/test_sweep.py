@@ -0,0 +1,81 @@
+"""
+Sweep dei parametri: varianti uguali generate una volta, geometria affettata una volta
+
+Eseguire dalla directory api con: python -m unittest discover tests
+"""
+import io
+import json
+import os
+import random
+import sys
+import unittest
+from unittest import mock
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+
+import app as app_module  # noqa: E402
+from app import app, slice_schedules  # noqa: E402
+
+TEST_STL = os.path.join(API_DIR, '..', 'assets', 'models', 'test_cube.stl')
+
+
+class SweepTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = app.test_client()
+        with open(TEST_STL, 'rb') as f:
+            self.stl = f.read()
+        # Densità casuale: varianti non ancora in cache, nemmeno su disco
+        # da esecuzioni precedenti
+        self.density = round(random.uniform(10, 90), 6)
+
+    def sweep(self, variants):
+        data = {'file': (io.BytesIO(self.stl), 'test_cube.stl'), 'params': json.dumps(variants)}
+        with mock.patch.object(app_module, 'slice_schedules', wraps=slice_schedules) as sliced:
+            response = self.client.post('/api/slice/sweep', data=data)
+        self.assertEqual(response.status_code, 200, response.get_data(as_text=True))
+        return response.get_json()['variants'], [len(call.args[1]) for call in sliced.call_args_list]
+
+    def test_identical_variants(self):
+        # Lo stesso set, una volta con il valore predefinito esplicito
+        variants = [
+            {"infill_density": self.density},
+            {"infill_density": self.density, "layer_height": 0.2},
+            {"infill_density": self.density, "layer_height": 0.3},
+        ]
+        responses, sliced = self.sweep(variants)
+        self.assertEqual(sliced, [2])
+        self.assertEqual(responses[0]['gcode_id'], responses[1]['gcode_id'])
+        self.assertNotEqual(responses[0]['gcode_id'], responses[2]['gcode_id'])
+        self.assertEqual([r['cached'] for r in responses], [False, False, False])
+        self.assertLess(responses[2]['stats']['layers']['count'], responses[0]['stats']['layers']['count'])
+
+        # Di nuovo: tutto dalla cache dei G-code, senza slicing
+        again, sliced = self.sweep(variants)
+        self.assertEqual(sliced, [])
+        self.assertEqual([r['gcode_id'] for r in again], [r['gcode_id'] for r in responses])
+        self.assertEqual([r['cached'] for r in again], [True, True, True])
+
+    def test_emission_variants_share_geometry(self):
+        # Stessa geometria, velocità e temperature diverse: un solo slicing
+        variants = [
+            {"infill_density": self.density, "print_speed": 5},
+            {"infill_density": self.density, "print_speed": 40, "nozzle_temp": 220},
+            {"infill_density": self.density + 1},
+        ]
+        before = app_module.geometry_cache.stats()
+        responses, sliced = self.sweep(variants)
+        after = app_module.geometry_cache.stats()
+        self.assertEqual(sliced, [2])
+        self.assertEqual(len({r['gcode_id'] for r in responses}), 3)
+        self.assertEqual(after['hits'], before['hits'] + 1)
+        self.assertEqual(after['misses'], before['misses'] + 2)
+        self.assertGreater(
+            responses[0]['stats']['print_time']['total_s'],
+            responses[1]['stats']['print_time']['total_s'],
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
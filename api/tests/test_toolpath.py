@@ -0,0 +1,92 @@
+"""
+Formattazione vettoriale del G-code: identità con la formattazione di riferimento
+
+Eseguire dalla directory api con: python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+import numpy as np
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+
+from toolpath import (  # noqa: E402
+    COMMAND_ARC_CCW, COMMAND_ARC_CW, COMMAND_LINE, E_DECIMALS, IJ_DECIMALS, MOVE_COMMENTS, XY_DECIMALS,
+    _FixedField, format_moves, format_moves_reference,
+)
+
+FEED_LABELS = {3600.0: '3600', 2700.0: '2700.0', 1500.5: '1500.5'}
+
+# Valori con arrotondamento ambiguo o particolare: metà esatte in binario
+# (0.125, 0.00005 non lo è), metà solo in decimale (2.675), zero negativo,
+# negativi che si arrotondano a zero, non finiti e oltre 2^62 / 10^decimali
+SPECIAL_XY = [0.125, 2.675, 1.005, -0.0, -0.001, -0.005, 0.375, 1e17, -1e300, np.inf, np.nan]
+SPECIAL_E = [0.00005, 0.00015, 0.12345, -0.00005, 2.5e-05, -0.0, np.nan]
+SPECIAL_IJ = [0.0005, 0.0015, -0.0025, 1.0625, -0.0]
+
+
+def random_columns(rng, count):
+    """Colonne casuali con un valore speciale in circa una riga su cinque"""
+    x = np.round(rng.uniform(-300, 300, count), int(rng.integers(0, 6)))
+    y = rng.uniform(-300, 300, count)
+    e = rng.uniform(-5, 5, count) * rng.choice([1e-4, 1e-2, 1, 100], count)
+    i = rng.uniform(-50, 50, count)
+    j = rng.uniform(-50, 50, count)
+    for column, special in ((x, SPECIAL_XY), (y, SPECIAL_XY), (e, SPECIAL_E), (i, SPECIAL_IJ), (j, SPECIAL_IJ)):
+        rows = rng.random(count) < 0.2
+        column[rows] = rng.choice(special, int(rows.sum()))
+    feed = rng.choice(sorted(FEED_LABELS), count)
+    move_type = rng.choice(sorted(MOVE_COMMENTS), count).astype(np.int8)
+    command = rng.choice([COMMAND_LINE, COMMAND_ARC_CW, COMMAND_ARC_CCW], count).astype(np.int8)
+    return x, y, e, feed, move_type, command, i, j
+
+
+class FormatMovesTest(unittest.TestCase):
+
+    def test_matches_reference(self):
+        rng = np.random.default_rng(9)
+        for trial in range(50):
+            x, y, e, feed, move_type, command, i, j = random_columns(rng, int(rng.integers(1, 400)))
+            with self.subTest(trial=trial, arcs=False):
+                self.assertEqual(
+                    format_moves(x, y, e, feed, move_type, FEED_LABELS),
+                    format_moves_reference(x, y, e, feed, move_type, FEED_LABELS),
+                )
+            with self.subTest(trial=trial, arcs=True):
+                self.assertEqual(
+                    format_moves(x, y, e, feed, move_type, FEED_LABELS, command, i, j),
+                    format_moves_reference(x, y, e, feed, move_type, FEED_LABELS, command, i, j),
+                )
+
+    def test_fallback_is_exercised(self):
+        # I valori speciali passano davvero dalla riformattazione di riferimento
+        for values, decimals in ((SPECIAL_XY, XY_DECIMALS), (SPECIAL_E, E_DECIMALS), (SPECIAL_IJ, IJ_DECIMALS)):
+            with self.subTest(decimals=decimals):
+                self.assertTrue(_FixedField(values, decimals).ambiguous.any())
+
+    def test_arc_rows(self):
+        x = np.array([10.0, 12.5, 15.0])
+        y = np.array([0.0, 2.5, 0.0])
+        e = np.array([0.0, 0.1234, 0.25])
+        feed = np.array([3600.0, 2700.0, 2700.0])
+        move_type = np.array([0, 1, 1], dtype=np.int8)
+        command = np.array([COMMAND_LINE, COMMAND_ARC_CW, COMMAND_ARC_CCW], dtype=np.int8)
+        i = np.array([0.0, 2.5, -0.0005])
+        j = np.array([0.0, -2.5, 1.25])
+        text = format_moves(x, y, e, feed, move_type, FEED_LABELS, command, i, j)
+        self.assertEqual(text, format_moves_reference(x, y, e, feed, move_type, FEED_LABELS, command, i, j))
+        self.assertEqual(text.splitlines(), [
+            "G1 X10.00 Y0.00 F3600 ; Move to start",
+            "G2 X12.50 Y2.50 I2.500 J-2.500 E0.1234 F2700.0 ; Perimeter",
+            "G3 X15.00 Y0.00 I-0.001 J1.250 E0.2500 F2700.0 ; Perimeter",
+        ])
+
+    def test_empty(self):
+        empty = np.zeros(0)
+        self.assertEqual(format_moves(empty, empty, empty, empty, empty.astype(np.int8), FEED_LABELS), "")
+
+
+if __name__ == '__main__':
+    unittest.main()
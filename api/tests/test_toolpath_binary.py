@@ -0,0 +1,158 @@
+"""
+Formato binario dei percorsi: codifica, decodifica e /api/preview/layers
+
+Eseguire dalla directory api con: python -m unittest discover tests
+"""
+import io
+import json
+import os
+import random
+import struct
+import sys
+import unittest
+
+import numpy as np
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+
+from app import app  # noqa: E402
+from toolpath import MOVE_COMMENTS, LayerToolpath  # noqa: E402
+from toolpath_binary import (  # noqa: E402
+    HEADER_FORMAT, HEADER_SIZE, TOOLPATH_MAGIC, TOOLPATH_VERSION, decode_toolpaths, encode_toolpaths,
+)
+
+TEST_STL = os.path.join(API_DIR, '..', 'assets', 'models', 'test_cube.stl')
+
+
+def random_layers(rng, count):
+    """Layer casuali, con qualche layer senza contorni (None)"""
+    layers = []
+    for layer in range(count):
+        z = 0.2 * (layer + 1)
+        if rng.random() < 0.2:
+            layers.append((z, None))
+            continue
+        moves = int(rng.integers(1, 200))
+        toolpath = LayerToolpath(z)
+        toolpath.add(
+            rng.uniform(-100, 300, moves), rng.uniform(-100, 300, moves), 0.0, 3000,
+            rng.choice(sorted(MOVE_COMMENTS), moves),
+        )
+        layers.append((z, toolpath))
+    return layers
+
+
+class EncodeDecodeTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        rng = np.random.default_rng(25)
+        for trial in range(20):
+            layers = random_layers(rng, int(rng.integers(1, 12)))
+            first = int(rng.integers(0, 50))
+            with self.subTest(trial=trial):
+                decoded = decode_toolpaths(encode_toolpaths(layers, first, first + len(layers) + 3))
+                self.assertEqual(decoded['first_layer'], first)
+                self.assertEqual(decoded['total_layers'], first + len(layers) + 3)
+                np.testing.assert_array_equal(decoded['z'], np.float32([z for z, _ in layers]))
+
+                offsets = decoded['offsets']
+                self.assertEqual(len(offsets), len(layers) + 1)
+                self.assertEqual(offsets[0], 0)
+                for layer, (z, toolpath) in enumerate(layers):
+                    moves = slice(offsets[layer], offsets[layer + 1])
+                    if toolpath is None:
+                        self.assertEqual(moves.start, moves.stop)
+                        continue
+                    x, y, _, _, _, move_type = toolpath.columns()
+                    np.testing.assert_array_equal(decoded['xy'][moves], np.column_stack([x, y]).astype(np.float32))
+                    np.testing.assert_array_equal(decoded['type'][moves], move_type)
+
+    def test_layout(self):
+        layers = random_layers(np.random.default_rng(3), 5)
+        data = encode_toolpaths(layers, 0, 5)
+        move_count = sum(len(t.columns()[0]) for _, t in layers if t is not None)
+        self.assertEqual(HEADER_SIZE, 24)
+        self.assertEqual(
+            struct.unpack_from(HEADER_FORMAT, data), (TOOLPATH_MAGIC, TOOLPATH_VERSION, 0, 5, 0, 5, move_count)
+        )
+        # Sezioni a 4 byte allineate: z, offsets, xy, poi i tipi a 1 byte
+        sections = [HEADER_SIZE, HEADER_SIZE + 4 * 5, HEADER_SIZE + 4 * 5 + 4 * 6]
+        self.assertTrue(all(offset % 4 == 0 for offset in sections))
+        self.assertEqual(len(data), sections[-1] + 8 * move_count + move_count)
+
+    def test_empty_layers(self):
+        decoded = decode_toolpaths(encode_toolpaths([(0.2, None), (0.4, None)], 7, 9))
+        np.testing.assert_array_equal(decoded['offsets'], [0, 0, 0])
+        self.assertEqual(decoded['xy'].shape, (0, 2))
+        self.assertEqual(len(decoded['type']), 0)
+
+    def test_invalid_blocks(self):
+        data = encode_toolpaths(random_layers(np.random.default_rng(4), 3), 0, 3)
+        version = struct.pack('<H', TOOLPATH_VERSION + 1)
+        for name, block in (
+            ("corto", data[:HEADER_SIZE - 1]),
+            ("magic", b'XXXX' + data[4:]),
+            ("versione", data[:4] + version + data[6:]),
+            ("troncato", data[:-1]),
+            ("in eccesso", data + b'\0'),
+        ):
+            with self.subTest(block=name):
+                with self.assertRaises(ValueError):
+                    decode_toolpaths(block)
+
+
+class PreviewLayersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = app.test_client()
+        with open(TEST_STL, 'rb') as f:
+            self.stl = f.read()
+        # Densità casuale: geometria non ancora in cache, nemmeno su disco
+        # da esecuzioni precedenti; senza ordinamento degli spostamenti i
+        # percorsi non dipendono dal layer precedente
+        self.params = {"infill_density": round(random.uniform(10, 90), 6), "travel_optimization": False}
+
+    def post(self, path, **fields):
+        data = {'file': (io.BytesIO(self.stl), 'test_cube.stl'), 'params': json.dumps(self.params)}
+        data.update(fields)
+        return self.client.post(path, data=data)
+
+    def preview(self, first, count):
+        response = self.post('/api/preview/layers', first=str(first), count=str(count))
+        self.assertEqual(response.status_code, 200, response.data[:200])
+        self.assertEqual(response.mimetype, 'application/octet-stream')
+        return response, decode_toolpaths(response.data)
+
+    def test_range_matches_cached_geometry(self):
+        response, computed = self.preview(2, 3)
+        self.assertEqual(response.headers['X-Geometry-Cached'], 'false')
+        self.assertEqual(computed['first_layer'], 2)
+        self.assertEqual(len(computed['z']), 3)
+        self.assertGreater(computed['total_layers'], 5)
+        self.assertGreater(len(computed['type']), 0)
+
+        self.assertEqual(self.post('/api/slice').status_code, 200)
+        response, cached = self.preview(2, 3)
+        self.assertEqual(response.headers['X-Geometry-Cached'], 'true')
+        for name in ('total_layers', 'first_layer'):
+            self.assertEqual(cached[name], computed[name])
+        for name in ('z', 'offsets', 'xy', 'type'):
+            with self.subTest(section=name):
+                np.testing.assert_array_equal(cached[name], computed[name])
+
+    def test_last_layers(self):
+        _, full = self.preview(0, 1)
+        total = full['total_layers']
+        _, tail = self.preview(total - 2, 10)
+        self.assertEqual(tail['first_layer'], total - 2)
+        self.assertEqual(len(tail['z']), 2)
+
+    def test_invalid_range(self):
+        for fields in ({'first': '-1'}, {'count': '0'}, {'first': 'x'}, {'first': '100000'}):
+            with self.subTest(fields=fields):
+                self.assertEqual(self.post('/api/preview/layers', **fields).status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,362 @@
+"""
+Percorsi utensile in forma colonnare e formattazione vettoriale in G-code
+
+Ogni layer è rappresentato da array paralleli (x, y, z, e, feed, tipo di
+movimento), più il comando (G1, G2, G3) e il centro I, J per i layer in cui
+l'arc fitting ha sostituito dei segmenti con archi. La conversione in testo G-code avviene in blocco con NumPy:
+i numeri sono scritti in virgola fissa in una matrice di byte, e i byte di
+riempimento vengono poi rimossi con un'unica maschera. Il risultato è
+identico, byte per byte, a quello di format_moves_reference (f-string).
+"""
+import numpy as np
+
+# Tipi di movimento: gli spostamenti senza estrusione sono i valori pari
+MOVE_TRAVEL = 0
+MOVE_PERIMETER = 1
+MOVE_INFILL_TRAVEL = 2
+MOVE_INFILL = 3
+MOVE_DIAGONAL_TRAVEL = 4
+MOVE_DIAGONAL = 5
+
+MOVE_COMMENTS = {
+    MOVE_TRAVEL: 'Move to start',
+    MOVE_PERIMETER: 'Perimeter',
+    MOVE_INFILL_TRAVEL: 'Move to infill start',
+    MOVE_INFILL: 'Infill line',
+    MOVE_DIAGONAL_TRAVEL: 'Move to diagonal start',
+    MOVE_DIAGONAL: 'Infill diagonal',
+}
+
+# Comandi di movimento: linea, arco orario, arco antiorario
+COMMAND_LINE = 1
+COMMAND_ARC_CW = 2
+COMMAND_ARC_CCW = 3
+
+XY_DECIMALS = 2
+E_DECIMALS = 4
+# Offset del centro degli archi: più cifre, il raggio deriva da I e J
+IJ_DECIMALS = 3
+
+# Byte di riempimento rimosso dopo la composizione delle righe
+_FILL = 0
+_DIGITS = np.frombuffer(b'0123456789', dtype=np.uint8)
+
+
+def is_extrusion(move_type):
+    """True per i tipi di movimento che estrudono materiale"""
+    return np.asarray(move_type) % 2 == 1
+
+
+class LayerToolpath:
+    """
+    Movimenti XY di un layer, accumulati a blocchi di array
+
+    Le velocità (feed) sono conservate come float; per ogni valore viene
+    ricordata anche la rappresentazione testuale originale (es. 3600 oppure
+    3600.0), così il G-code non dipende dal tipo numerico del parametro.
+    """
+
+    def __init__(self, z):
+        self.z_value = z
+        self._x = []
+        self._y = []
+        self._e = []
+        self._feed = []
+        self._type = []
+        self.feed_labels = {}
+        self._columns = None
+        # Comando e centro degli archi (None: solo movimenti G1)
+        self._arcs = None
+
+    def add(self, x, y, e, feed, move_type):
+        """
+        Aggiunge uno o più movimenti
+
+        Args:
+            x, y: Coordinate di arrivo (scalari o array)
+            e: Estrusione di ogni movimento (0 per gli spostamenti)
+            feed: Velocità in mm/min (scalare)
+            move_type: Tipo di movimento (scalare o array)
+        """
+        x = np.atleast_1d(np.asarray(x, dtype=np.float64))
+        count = len(x)
+        if count == 0:
+            return
+        self.feed_labels.setdefault(float(feed), str(feed))
+        self._x.append(x)
+        self._y.append(np.broadcast_to(np.asarray(y, dtype=np.float64), (count,)))
+        self._e.append(np.broadcast_to(np.asarray(e, dtype=np.float64), (count,)))
+        self._feed.append(np.full(count, float(feed)))
+        self._type.append(np.broadcast_to(np.asarray(move_type, dtype=np.int8), (count,)))
+        self._columns = None
+
+    def add_lines(self, starts, ends, feed_travel, feed_extrude, e,
+                  travel_type, extrude_type):
+        """
+        Linee indipendenti: spostamento all'inizio ed estrusione fino alla fine
+
+        Args:
+            starts, ends: Array (N, 2) dei punti iniziali e finali
+            e: Estrusione di ogni linea (array (N,) o scalare)
+        """
+        starts = np.asarray(starts, dtype=np.float64).reshape(-1, 2)
+        ends = np.asarray(ends, dtype=np.float64).reshape(-1, 2)
+        count = len(starts)
+        if count == 0:
+            return
+        x = np.empty(2 * count)
+        y = np.empty(2 * count)
+        x[0::2], x[1::2] = starts[:, 0], ends[:, 0]
+        y[0::2], y[1::2] = starts[:, 1], ends[:, 1]
+        extrusion = np.zeros(2 * count)
+        extrusion[1::2] = e
+        feed = np.empty(2 * count)
+        feed[0::2], feed[1::2] = float(feed_travel), float(feed_extrude)
+        move_type = np.empty(2 * count, dtype=np.int8)
+        move_type[0::2], move_type[1::2] = travel_type, extrude_type
+        self.feed_labels.setdefault(float(feed_travel), str(feed_travel))
+        self.feed_labels.setdefault(float(feed_extrude), str(feed_extrude))
+        self._x.append(x)
+        self._y.append(y)
+        self._e.append(extrusion)
+        self._feed.append(feed)
+        self._type.append(move_type)
+        self._columns = None
+
+    @classmethod
+    def from_columns(cls, z, x, y, e, feed, move_type, feed_labels, command=None, i=None, j=None):
+        """
+        Percorso di un layer da array colonnari già pronti
+
+        Args:
+            command: Array (N,) dei comandi (COMMAND_*), None per soli G1
+            i, j: Array (N,) degli offset del centro degli archi dal punto
+                di partenza (ignorati per i G1)
+        """
+        toolpath = cls(z)
+        toolpath.feed_labels = dict(feed_labels)
+        z_column = np.full(len(x), float(z))
+        toolpath._columns = (x, y, z_column, e, feed, move_type)
+        toolpath._x, toolpath._y, toolpath._e, toolpath._feed, toolpath._type = [x], [y], [e], [feed], [move_type]
+        if command is not None:
+            toolpath._arcs = (np.asarray(command, dtype=np.int8), i, j)
+        return toolpath
+
+    def columns(self):
+        """Array colonnari (x, y, z, e, feed, move_type) del layer"""
+        if self._columns is None:
+            if self._x:
+                x = np.concatenate(self._x)
+                y = np.concatenate(self._y)
+                e = np.concatenate(self._e)
+                feed = np.concatenate(self._feed)
+                move_type = np.concatenate(self._type)
+            else:
+                x = y = e = feed = np.empty(0)
+                move_type = np.empty(0, dtype=np.int8)
+            z = np.full(len(x), float(self.z_value))
+            self._columns = (x, y, z, e, feed, move_type)
+            # Accumula in un solo blocco per le chiamate successive
+            self._x, self._y, self._e, self._feed, self._type = [x], [y], [e], [feed], [move_type]
+        return self._columns
+
+    def arc_columns(self):
+        """Array (command, i, j) del layer, None se contiene solo G1"""
+        return self._arcs
+
+    def __len__(self):
+        return len(self.columns()[0])
+
+    def to_gcode(self):
+        """Testo G-code dei movimenti del layer (formattazione vettoriale)"""
+        x, y, _, e, feed, move_type = self.columns()
+        command, i, j = self._arcs if self._arcs is not None else (None, None, None)
+        return format_moves(x, y, e, feed, move_type, self.feed_labels, command, i, j)
+
+
+def format_moves_reference(x, y, e, feed, move_type, feed_labels, command=None, i=None, j=None):
+    """
+    Formattazione di riferimento dei movimenti, una f-string per riga
+
+    Usata per verificare format_moves e nei benchmark.
+    """
+    count = len(x)
+    if command is None:
+        command = np.full(count, COMMAND_LINE, dtype=np.int8)
+        i = j = np.zeros(count)
+    lines = []
+    rows = zip(x.tolist(), y.tolist(), e.tolist(), feed.tolist(), move_type.tolist(),
+               command.tolist(), i.tolist(), j.tolist())
+    for xi, yi, ei, fi, ti, ci, ii, ji in rows:
+        label = feed_labels[fi]
+        comment = MOVE_COMMENTS[ti]
+        center = f" I{ii:.3f} J{ji:.3f}" if ci != COMMAND_LINE else ""
+        if ti % 2 == 1:
+            lines.append(f"G{ci} X{xi:.2f} Y{yi:.2f}{center} E{ei:.4f} F{label} ; {comment}\n")
+        else:
+            lines.append(f"G{ci} X{xi:.2f} Y{yi:.2f}{center} F{label} ; {comment}\n")
+    return "".join(lines)
+
+
+def format_moves(x, y, e, feed, move_type, feed_labels, command=None, i=None, j=None):
+    """
+    Formatta i movimenti in G-code in modo vettoriale
+
+    Ogni riga viene composta come sequenza di colonne di byte (costanti,
+    cifre, etichette) con byte di riempimento dove un campo è più corto;
+    il riempimento è rimosso alla fine su tutto il blocco.
+
+    Args:
+        x, y, e, feed: Array (N,) delle colonne dei movimenti
+        move_type: Array (N,) dei tipi di movimento
+        feed_labels: Dizionario {velocità: testo} per il campo F
+        command: Array (N,) dei comandi (COMMAND_*), None per soli G1
+        i, j: Array (N,) degli offset del centro degli archi
+
+    Returns:
+        Stringa con una riga G-code per movimento
+    """
+    count = len(x)
+    if count == 0:
+        return ""
+
+    extruding = is_extrusion(move_type)
+
+    feed_values = np.array(sorted(feed_labels), dtype=np.float64)
+    feed_table = _label_table([f" F{feed_labels[v]} ; " for v in feed_values])
+    comment_codes = sorted(MOVE_COMMENTS)
+    comment_table = _label_table([MOVE_COMMENTS[t] + "\n" for t in comment_codes])
+    comment_lookup = np.zeros(max(comment_codes) + 1, dtype=np.int64)
+    comment_lookup[comment_codes] = np.arange(len(comment_codes))
+
+    x_field = _FixedField(x, XY_DECIMALS)
+    y_field = _FixedField(y, XY_DECIMALS)
+    e_field = _FixedField(e, E_DECIMALS)
+    ambiguous = x_field.ambiguous | y_field.ambiguous | (extruding & e_field.ambiguous)
+    if command is None:
+        fields = [(b"G1 X", None), (x_field, None), (b" Y", None), (y_field, None)]
+    else:
+        # Archi: comando G2/G3 e campi I, J dopo le coordinate
+        arc = command != COMMAND_LINE
+        i_field = _FixedField(np.where(arc, i, 0.0), IJ_DECIMALS)
+        j_field = _FixedField(np.where(arc, j, 0.0), IJ_DECIMALS)
+        ambiguous |= arc & (i_field.ambiguous | j_field.ambiguous)
+        command_table = _label_table([f"G{c} X" for c in (COMMAND_LINE, COMMAND_ARC_CW, COMMAND_ARC_CCW)])
+        fields = [
+            (command_table, command.astype(np.int64) - COMMAND_LINE),
+            (x_field, None),
+            (b" Y", None),
+            (y_field, None),
+            (b" I", arc),
+            (i_field, arc),
+            (b" J", arc),
+            (j_field, arc),
+        ]
+    fields += [
+        (b" E", extruding),
+        (e_field, extruding),
+        (feed_table, np.searchsorted(feed_values, feed)),
+        (comment_table, comment_lookup[move_type]),
+    ]
+
+    # Una matrice di byte per tutte le righe, riempita campo per campo;
+    # è trasposta (un byte della riga per riga della matrice), così ogni
+    # scrittura è contigua in memoria
+    widths = [_field_width(field) for field, _ in fields]
+    matrix = np.full((sum(widths), count), _FILL, dtype=np.uint8)
+    column = 0
+    for (field, selector), width in zip(fields, widths):
+        target = matrix[column:column + width]
+        if isinstance(field, bytes):
+            target[:] = np.frombuffer(field, dtype=np.uint8)[:, None]
+            if selector is not None:
+                target[:, ~selector] = _FILL
+        elif isinstance(field, _FixedField):
+            field.write(target)
+            if selector is not None:
+                target[:, ~selector] = _FILL
+        else:
+            target[:] = field[selector].T
+        column += width
+
+    flat = matrix.T.ravel()
+    text = flat[flat != _FILL].tobytes().decode('ascii')
+
+    # Valori il cui arrotondamento è ambiguo (o non finiti): riformattati
+    # con la formattazione di riferimento per garantire l'identità
+    if ambiguous.any():
+        lines = text.splitlines(keepends=True)
+        for row in np.flatnonzero(ambiguous):
+            rows = slice(row, row + 1)
+            arcs = (None, None, None) if command is None else (command[rows], i[rows], j[rows])
+            lines[row] = format_moves_reference(
+                x[rows], y[rows], e[rows], feed[rows], move_type[rows], feed_labels, *arcs
+            )
+        text = "".join(lines)
+    return text
+
+
+def _field_width(field):
+    if isinstance(field, bytes):
+        return len(field)
+    if isinstance(field, _FixedField):
+        return field.width
+    return field.shape[1]
+
+
+def _label_table(labels):
+    """Tabella (n, larghezza massima) di etichette ASCII con riempimento"""
+    width = max(len(label) for label in labels)
+    table = np.full((len(labels), width), _FILL, dtype=np.uint8)
+    for i, label in enumerate(labels):
+        encoded = np.frombuffer(label.encode('ascii'), dtype=np.uint8)
+        table[i, :len(encoded)] = encoded
+    return table
+
+
+class _FixedField:
+    """
+    Valori in virgola fissa ("%.{decimals}f") da scrivere in colonne di byte
+
+    Il segno segue np.signbit come la formattazione di Python (anche -0.00);
+    le cifre intere non significative restano byte di riempimento.
+    """
+
+    def __init__(self, values, decimals):
+        values = np.asarray(values, dtype=np.float64)
+        scale = 10 ** decimals
+        finite = np.isfinite(values)
+        product = np.where(finite, np.abs(values), 0.0) * scale
+        # Oltre 2^62 la conversione a intero non è più esatta
+        too_large = product >= 2.0 ** 62
+        product[too_large] = 0.0
+        scaled = np.rint(product).astype(np.int64)
+        # Arrotondamento potenzialmente diverso da quello esatto di Python:
+        # parte frazionaria a meno dell'errore della moltiplicazione dalla metà
+        distance = np.abs(product - np.floor(product) - 0.5)
+        self.ambiguous = (distance <= 4 * np.spacing(product)) | ~finite | too_large
+        self.negative = np.signbit(values)
+        self.integer = scaled // scale
+        self.fraction = scaled - self.integer * scale
+        self.decimals = decimals
+        self.int_width = len(str(int(self.integer.max()))) if len(values) else 1
+        # Segno, cifre intere, punto decimale, cifre decimali
+        self.width = 1 + self.int_width + (decimals + 1 if decimals else 0)
+
+    def write(self, target):
+        target[0, self.negative] = ord('-')
+        remaining = self.integer.copy()
+        for position in range(self.int_width, 0, -1):
+            digits = _DIGITS[remaining % 10]
+            if position < self.int_width:
+                # Cifra iniziale non significativa (lo zero delle unità resta)
+                digits[remaining == 0] = _FILL
+            target[position] = digits
+            remaining //= 10
+        if not self.decimals:
+            return
+        target[self.int_width + 1] = ord('.')
+        remaining = self.fraction.copy()
+        for position in range(self.width - 1, self.int_width + 1, -1):
+            target[position] = _DIGITS[remaining % 10]
+            remaining //= 10
@@ -0,0 +1,118 @@
+"""
+Formato binario compatto dei percorsi utensile per il visualizzatore
+
+Un intervallo di layer è codificato in un unico blocco di byte little-endian
+che il client può leggere senza analisi del testo, con viste tipizzate
+direttamente sul buffer (tutte le sezioni a 4 byte iniziano a un offset
+multiplo di 4):
+
+    header   24 byte: magic b'PMTP', versione (uint16), riservato (uint16),
+             layer totali del modello, primo layer, layer nel blocco,
+             movimenti nel blocco (uint32)
+    z        float32 x layer: quota di ogni layer
+    offsets  uint32 x (layer + 1): indice del primo movimento di ogni
+             layer, più la fine
+    xy       float32 x 2 x movimenti: punto di arrivo di ogni movimento
+    type     uint8 x movimenti: tipo di movimento (vedi toolpath.MOVE_*)
+
+Il segmento i di un layer va dal punto i - 1 al punto i con il tipo del
+punto i; il primo movimento di ogni layer è lo spostamento verso l'inizio
+del layer. Gli archi non compaiono: i percorsi sono quelli precedenti
+all'arc fitting.
+"""
+import struct
+
+import numpy as np
+
+TOOLPATH_MAGIC = b'PMTP'
+TOOLPATH_VERSION = 1
+
+# magic, versione, riservato, layer totali, primo layer, layer, movimenti
+HEADER_FORMAT = '<4sHHIIII'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+
+def encode_toolpaths(toolpaths, first_layer, total_layers):
+    """
+    Codifica i percorsi di un intervallo di layer nel formato binario
+
+    Args:
+        toolpaths: Tuple (z, toolpath) dei layer, in ordine, come da
+            iter_toolpaths (toolpath None per i layer senza contorni)
+        first_layer: Indice del primo layer dell'intervallo nel modello
+        total_layers: Numero di layer dell'intero modello
+
+    Returns:
+        Byte del blocco
+    """
+    z_values = []
+    offsets = [0]
+    xy_parts = []
+    type_parts = []
+    for z, toolpath in toolpaths:
+        z_values.append(z)
+        if toolpath is not None:
+            x, y, _, _, _, move_type = toolpath.columns()
+            xy_parts.append(np.column_stack([x, y]).astype('<f4'))
+            type_parts.append(np.asarray(move_type, dtype=np.uint8))
+            offsets.append(offsets[-1] + len(x))
+        else:
+            offsets.append(offsets[-1])
+
+    move_count = offsets[-1]
+    header = struct.pack(
+        HEADER_FORMAT, TOOLPATH_MAGIC, TOOLPATH_VERSION, 0,
+        total_layers, first_layer, len(z_values), move_count,
+    )
+    xy = np.concatenate(xy_parts) if xy_parts else np.empty((0, 2), dtype='<f4')
+    move_type = np.concatenate(type_parts) if type_parts else np.empty(0, dtype=np.uint8)
+    return b''.join([
+        header,
+        np.asarray(z_values, dtype='<f4').tobytes(),
+        np.asarray(offsets, dtype='<u4').tobytes(),
+        xy.tobytes(),
+        move_type.tobytes(),
+    ])
+
+
+def decode_toolpaths(data):
+    """
+    Legge un blocco prodotto da encode_toolpaths
+
+    Args:
+        data: Byte del blocco
+
+    Returns:
+        Dizionario con 'total_layers', 'first_layer', 'z', 'offsets', 'xy'
+        (array N x 2) e 'type'
+
+    Raises:
+        ValueError: Se il blocco non è nel formato atteso
+    """
+    if len(data) < HEADER_SIZE:
+        raise ValueError("Blocco troppo corto")
+    magic, version, _, total_layers, first_layer, layer_count, move_count = struct.unpack_from(
+        HEADER_FORMAT, data
+    )
+    if magic != TOOLPATH_MAGIC or version != TOOLPATH_VERSION:
+        raise ValueError("Formato dei percorsi non riconosciuto")
+    expected = HEADER_SIZE + 4 * layer_count + 4 * (layer_count + 1) + 9 * move_count
+    if len(data) != expected:
+        raise ValueError(f"Dimensione del blocco errata: {len(data)} byte invece di {expected}")
+
+    offset = HEADER_SIZE
+    z = np.frombuffer(data, dtype='<f4', count=layer_count, offset=offset)
+    offset += 4 * layer_count
+    offsets = np.frombuffer(data, dtype='<u4', count=layer_count + 1, offset=offset)
+    offset += 4 * (layer_count + 1)
+    xy = np.frombuffer(data, dtype='<f4', count=2 * move_count, offset=offset).reshape(-1, 2)
+    offset += 8 * move_count
+    move_type = np.frombuffer(data, dtype=np.uint8, count=move_count, offset=offset)
+    return {
+        "total_layers": total_layers,
+        "first_layer": first_layer,
+        "z": z,
+        "offsets": offsets,
+        "xy": xy,
+        "type": move_type,
+    }
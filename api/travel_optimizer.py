@@ -0,0 +1,401 @@
+"""
+Ordinamento dei percorsi di un layer per ridurre gli spostamenti a vuoto
+
+Un layer è una sequenza di pezzi: uno spostamento (tipo pari) seguito dalle
+estrusioni che partono dal suo punto di arrivo. L'ordinamento procede in
+tre passi, separatamente per perimetri e riempimento (i perimetri restano
+prima del riempimento):
+
+1. collegamento a serpentina: le linee di riempimento con la stessa
+   direzione sono ordinate per linea di scansione e percorse a direzioni
+   alternate, formando catene (tutto con ordinamenti NumPy);
+2. nearest neighbour: i pezzi e le catene sono visitati scegliendo ogni
+   volta l'estremo più vicino, cercato in una griglia hash;
+3. 2-opt (opzionale, entro un tempo massimo): inversione di sottosequenze
+   di catene finché lo spostamento totale diminuisce.
+
+I perimetri non vengono mai invertiti (stesso verso per tutti i contorni);
+le linee di riempimento sì.
+"""
+import math
+import time
+
+import numpy as np
+
+from toolpath import MOVE_TRAVEL, LayerToolpath, is_extrusion
+
+# Tolleranza (mm, radianti) per raggruppare direzioni e linee di scansione
+_DIRECTION_DECIMALS = 6
+_OFFSET_DECIMALS = 4
+
+
+class TravelOptimizer:
+    """
+    Riordina i pezzi dei layer e misura lo spostamento risparmiato
+
+    Args:
+        two_opt_budget: Secondi massimi per layer del raffinamento 2-opt
+            (0 per disattivarlo)
+    """
+
+    def __init__(self, two_opt_budget=0.0):
+        self.two_opt_budget = float(two_opt_budget)
+        self.travel_before = []
+        self.travel_after = []
+
+    def optimize(self, toolpath, position):
+        """
+        Percorso del layer con i pezzi riordinati
+
+        Args:
+            toolpath: LayerToolpath del layer
+            position: Posizione XY della testina all'inizio del layer
+
+        Returns:
+            Nuovo LayerToolpath (lo stesso se non c'è nulla da riordinare)
+        """
+        x, y, z, e, feed, move_type = toolpath.columns()
+        before = travel_distance(x, y, move_type, position)
+        pieces = _Pieces(x, y, move_type)
+        if pieces.count < 2:
+            self._record(before, before)
+            return toolpath
+
+        order = []
+        reverse = []
+        current = np.asarray(position, dtype=np.float64)
+        for group in (pieces.perimeters, pieces.infill):
+            if len(group) == 0:
+                continue
+            chains = _serpentine_chains(pieces, group)
+            chain_order, chain_reverse = _nearest_neighbour(pieces, chains, current)
+            if self.two_opt_budget > 0 and len(chain_order) > 2:
+                chain_order, chain_reverse = _two_opt(
+                    pieces, chains, chain_order, chain_reverse, current, self.two_opt_budget
+                )
+            for index, reversed_chain in zip(chain_order, chain_reverse):
+                chain = chains[index]
+                if reversed_chain:
+                    order.extend(chain.pieces[::-1])
+                    reverse.extend(~chain.reverse[::-1])
+                else:
+                    order.extend(chain.pieces)
+                    reverse.extend(chain.reverse)
+            last = order[-1]
+            current = pieces.start[last] if reverse[-1] else pieces.end[last]
+
+        rows, swap = pieces.rows(np.asarray(order), np.asarray(reverse, dtype=bool))
+        new_x, new_y = x[rows], y[rows]
+        # Linea invertita: lo spostamento va alla fine, l'estrusione all'inizio
+        new_x[swap], new_x[swap + 1] = x[rows[swap + 1]], x[rows[swap]]
+        new_y[swap], new_y[swap + 1] = y[rows[swap + 1]], y[rows[swap]]
+        after = travel_distance(new_x, new_y, move_type[rows], position)
+        if after >= before:
+            self._record(before, before)
+            return toolpath
+
+        self._record(before, after)
+        return LayerToolpath.from_columns(
+            toolpath.z_value, new_x, new_y, e[rows], feed[rows], move_type[rows], toolpath.feed_labels
+        )
+
+    def _record(self, before, after):
+        self.travel_before.append(before)
+        self.travel_after.append(after)
+
+    def summary(self):
+        """Spostamenti prima e dopo l'ordinamento (mm), totali e per layer"""
+        before = float(sum(self.travel_before))
+        after = float(sum(self.travel_after))
+        return {
+            "before_mm": round(before, 3),
+            "after_mm": round(after, 3),
+            "saved_mm": round(before - after, 3),
+            "layers_saved_mm": [round(b - a, 3) for b, a in zip(self.travel_before, self.travel_after)],
+        }
+
+
+def travel_distance(x, y, move_type, position):
+    """Lunghezza totale (mm) degli spostamenti senza estrusione"""
+    if len(x) == 0:
+        return 0.0
+    dx = np.diff(x, prepend=position[0])
+    dy = np.diff(y, prepend=position[1])
+    travel = ~is_extrusion(move_type)
+    return float(np.hypot(dx[travel], dy[travel]).sum())
+
+
+class _Pieces:
+    """Pezzi del layer: uno spostamento seguito dalle sue estrusioni"""
+
+    def __init__(self, x, y, move_type):
+        travel = np.flatnonzero(~is_extrusion(move_type))
+        if len(travel) == 0 or travel[0] != 0:
+            # Estrusioni senza spostamento iniziale: nessun riordino possibile
+            self.count = 0
+            return
+        self.first_row = travel
+        self.size = np.diff(np.append(travel, len(x)))
+        last_row = travel + self.size - 1
+        self.count = len(travel)
+        self.start = np.column_stack([x[travel], y[travel]])
+        self.end = np.column_stack([x[last_row], y[last_row]])
+        # Solo le linee singole di riempimento possono essere invertite
+        self.travel_type = move_type[travel]
+        self.reversible = (self.size == 2) & (self.travel_type != MOVE_TRAVEL)
+        self.perimeters = np.flatnonzero(self.travel_type == MOVE_TRAVEL)
+        self.infill = np.flatnonzero(self.travel_type != MOVE_TRAVEL)
+
+    def rows(self, order, reverse):
+        """
+        Indici delle righe nell'ordine dei pezzi indicato
+
+        Returns:
+            Tuple (rows, swap): indici delle righe e posizioni (nelle righe
+            riordinate) degli spostamenti delle linee da invertire
+        """
+        sizes = self.size[order]
+        offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        rows = np.arange(sizes.sum()) - np.repeat(offsets - self.first_row[order], sizes)
+        return rows, offsets[reverse]
+
+
+class _Chain:
+    """Sequenza di pezzi percorsa di seguito, eventualmente invertibile"""
+
+    def __init__(self, pieces, reverse, reversible):
+        self.pieces = pieces
+        self.reverse = reverse
+        self.reversible = reversible
+
+
+def _chain_endpoints(pieces, chain):
+    first, last = chain.pieces[0], chain.pieces[-1]
+    start = pieces.end[first] if chain.reverse[0] else pieces.start[first]
+    end = pieces.start[last] if chain.reverse[-1] else pieces.end[last]
+    return start, end
+
+
+def _serpentine_chains(pieces, group):
+    """
+    Catene a serpentina delle linee di riempimento del gruppo
+
+    Le linee con la stessa direzione sono raggruppate per linea di
+    scansione (distanza dall'origine perpendicolare alla direzione); la
+    k-esima linea di ogni scansione, nell'ordine lungo la direzione, forma
+    con quelle delle scansioni adiacenti una catena percorsa a direzioni
+    alternate. La catena si interrompe dove due linee consecutive non si
+    sovrappongono lungo la direzione.
+    """
+    reversible = group[pieces.reversible[group]]
+    chains = [
+        _Chain(np.array([piece]), np.array([False]), False)
+        for piece in group[~pieces.reversible[group]]
+    ]
+    if len(reversible) == 0:
+        return chains
+
+    start, end = pieces.start[reversible], pieces.end[reversible]
+    delta = end - start
+    angle = np.round(np.arctan2(delta[:, 1], delta[:, 0]) % np.pi, _DIRECTION_DECIMALS)
+    angle[angle >= np.round(np.pi, _DIRECTION_DECIMALS)] = 0.0
+    cos, sin = np.cos(angle), np.sin(angle)
+    offset = np.round(-sin * start[:, 0] + cos * start[:, 1], _OFFSET_DECIMALS)
+    along_start = cos * start[:, 0] + sin * start[:, 1]
+    along_end = cos * end[:, 0] + sin * end[:, 1]
+    low, high = np.minimum(along_start, along_end), np.maximum(along_start, along_end)
+    family = np.unique(np.column_stack([pieces.travel_type[reversible], angle]), axis=0, return_inverse=True)[1].ravel()
+
+    # Ordine: famiglia, linea di scansione, posizione lungo la direzione
+    order = np.lexsort([low, offset, family])
+    family, offset, low, high = family[order], offset[order], low[order], high[order]
+    new_scan = np.concatenate([[True], (family[1:] != family[:-1]) | (offset[1:] != offset[:-1])])
+    scan = np.cumsum(new_scan) - 1
+    scan_first = np.flatnonzero(new_scan)
+    rank = np.arange(len(order)) - scan_first[scan]
+    family_first_scan = scan[np.flatnonzero(np.concatenate([[True], family[1:] != family[:-1]]))]
+    scan_in_family = scan - family_first_scan[family]
+
+    # Catene: stessa famiglia e stesso rango su scansioni adiacenti che si
+    # sovrappongono lungo la direzione
+    order2 = np.lexsort([scan_in_family, rank, family])
+    f, r, s = family[order2], rank[order2], scan_in_family[order2]
+    lo, hi = low[order2], high[order2]
+    linked = np.concatenate([[False], (
+        (f[1:] == f[:-1]) & (r[1:] == r[:-1]) & (s[1:] == s[:-1] + 1)
+        & (lo[1:] <= hi[:-1]) & (lo[:-1] <= hi[1:])
+    )])
+    chain_id = np.cumsum(~linked) - 1
+    chain_first = np.flatnonzero(~linked)
+    # Direzione alternata: la prima linea della catena in avanti lungo la direzione
+    forward = (np.arange(len(order2)) - chain_first[chain_id]) % 2 == 0
+    members = reversible[order[order2]]
+    starts_low = (along_start <= along_end)[order[order2]]
+    reverse = forward != starts_low
+
+    bounds = np.append(chain_first, len(order2))
+    for a, b in zip(bounds[:-1], bounds[1:]):
+        chains.append(_Chain(members[a:b], reverse[a:b], True))
+    return chains
+
+
+class _GridHash:
+    """Griglia hash degli estremi delle catene per la ricerca del più vicino"""
+
+    def __init__(self, points, cell):
+        self.cell = cell
+        self.points = points
+        self._coordinates = points.tolist()
+        self.buckets = {}
+        keys = np.floor(points / cell).astype(np.int64)
+        for index, (i, j) in enumerate(keys.tolist()):
+            self.buckets.setdefault((i, j), []).append(index)
+        self.remaining = len(points)
+        self.removed = np.zeros(len(points), dtype=bool)
+        lower = keys.min(axis=0)
+        upper = keys.max(axis=0)
+        self.bounds = (int(lower[0]), int(lower[1]), int(upper[0]), int(upper[1]))
+
+    def remove(self, index):
+        if not self.removed[index]:
+            self.removed[index] = True
+            self.remaining -= 1
+
+    def nearest(self, point):
+        """Indice del punto non rimosso più vicino"""
+        px, py = float(point[0]), float(point[1])
+        ci, cj = math.floor(px / self.cell), math.floor(py / self.cell)
+        min_i, min_j, max_i, max_j = self.bounds
+        # Anelli di celle sempre più ampi finché il migliore trovato non è
+        # più vicino di qualunque cella ancora da esaminare
+        best, best_distance = -1, math.inf
+        ring = 0
+        max_ring = max(ci - min_i, max_i - ci, cj - min_j, max_j - cj, 0)
+        while ring <= max_ring:
+            if best >= 0 and (ring - 1) * self.cell >= best_distance:
+                break
+            if (2 * ring + 1) ** 2 > 4 * self.remaining:
+                # Pochi punti rimasti rispetto alle celle da esaminare:
+                # ricerca diretta su tutti i punti rimasti
+                remaining = np.flatnonzero(~self.removed)
+                distances = np.hypot(self.points[remaining, 0] - px, self.points[remaining, 1] - py)
+                nearest = int(np.argmin(distances))
+                if distances[nearest] < best_distance:
+                    best = int(remaining[nearest])
+                break
+            for i in range(ci - ring, ci + ring + 1):
+                edge = abs(i - ci) == ring
+                for j in (range(cj - ring, cj + ring + 1) if edge else (cj - ring, cj + ring)):
+                    bucket = self.buckets.get((i, j))
+                    if bucket is None:
+                        continue
+                    # Rimozione pigra dei punti già visitati
+                    bucket[:] = [index for index in bucket if not self.removed[index]]
+                    if not bucket:
+                        del self.buckets[(i, j)]
+                        continue
+                    for index in bucket:
+                        qx, qy = self._coordinates[index]
+                        distance = math.hypot(qx - px, qy - py)
+                        if distance < best_distance:
+                            best, best_distance = index, distance
+            ring += 1
+        return best
+
+
+def _nearest_neighbour(pieces, chains, position):
+    """
+    Ordine delle catene per nearest neighbour dalla posizione indicata
+
+    Ogni catena ha due estremi nella griglia (uno solo se non invertibile);
+    raggiunto un estremo si prosegue dall'altro.
+
+    Returns:
+        Tuple (ordine delle catene, flag di inversione)
+    """
+    endpoints = [_chain_endpoints(pieces, chain) for chain in chains]
+    points = []
+    owner = []
+    for index, (chain, (start, end)) in enumerate(zip(chains, endpoints)):
+        points.append(start)
+        owner.append((index, False))
+        if chain.reversible:
+            points.append(end)
+            owner.append((index, True))
+    points = np.array(points, dtype=np.float64)
+    span = float(np.ptp(points, axis=0).max()) if len(points) > 1 else 1.0
+    cell = max(span / math.sqrt(len(points)), 1e-3)
+    grid = _GridHash(points, cell)
+
+    # Indici dei punti di ogni catena, per rimuoverli insieme
+    chain_points = [[] for _ in chains]
+    for index, (chain_index, _) in enumerate(owner):
+        chain_points[chain_index].append(index)
+
+    order = []
+    reverse = []
+    current = position
+    while grid.remaining:
+        chain_index, reversed_chain = owner[grid.nearest(current)]
+        for index in chain_points[chain_index]:
+            grid.remove(index)
+        order.append(chain_index)
+        reverse.append(reversed_chain)
+        start, end = endpoints[chain_index]
+        current = start if reversed_chain else end
+    return order, reverse
+
+
+def _two_opt(pieces, chains, order, reverse, position, budget):
+    """
+    Raffinamento 2-opt dell'ordine delle catene entro budget secondi
+
+    Invertire le catene order[i..j] sostituisce gli spostamenti
+    (fine di i-1 -> inizio di i) e (fine di j -> inizio di j+1) con
+    (fine di i-1 -> fine di j) e (inizio di i -> inizio di j+1). Solo le
+    sottosequenze di catene invertibili possono essere invertite.
+    """
+    deadline = time.perf_counter() + budget
+    order = np.asarray(order)
+    reverse = np.asarray(reverse, dtype=bool)
+    endpoints = np.array([_chain_endpoints(pieces, chain) for chain in chains], dtype=np.float64)
+    reversible = np.array([chain.reversible for chain in chains])
+
+    def oriented():
+        ends = endpoints[order]
+        starts = np.where(reverse[:, None], ends[:, 1], ends[:, 0])
+        finishes = np.where(reverse[:, None], ends[:, 0], ends[:, 1])
+        return starts, finishes
+
+    starts, finishes = oriented()
+    count = len(order)
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for i in range(count - 1):
+            if time.perf_counter() >= deadline:
+                break
+            if not reversible[order[i]]:
+                continue
+            previous = finishes[i - 1] if i > 0 else position
+            # j ammessi: tutte le catene da i a j invertibili
+            blocked = np.flatnonzero(~reversible[order[i + 1:]])
+            limit = count if len(blocked) == 0 else i + 1 + blocked[0]
+            j = np.arange(i + 1, limit)
+            if len(j) == 0:
+                continue
+            old = np.hypot(*(starts[i] - previous))
+            new = np.hypot(*(finishes[j] - previous).T)
+            following = np.minimum(j + 1, count - 1)
+            has_next = j + 1 < count
+            old = old + np.where(has_next, np.hypot(*(starts[following] - finishes[j]).T), 0.0)
+            new = new + np.where(has_next, np.hypot(*(starts[following] - starts[i]).T), 0.0)
+            gain = old - new
+            best = int(np.argmax(gain))
+            if gain[best] > 1e-9:
+                k = j[best]
+                order[i:k + 1] = order[i:k + 1][::-1]
+                reverse[i:k + 1] = ~reverse[i:k + 1][::-1]
+                starts, finishes = oriented()
+                improved = True
+    return order.tolist(), reverse.tolist()